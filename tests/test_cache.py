@@ -0,0 +1,48 @@
+import pandas as pd
+
+import victory_cache
+
+
+def frame(rows):
+    return pd.DataFrame({"Sl.no": range(rows), "Name": [f"Name {i}" for i in range(rows)]})
+
+
+def frame_bytes(data):
+    return int(data.memory_usage(index=True, deep=True).sum())
+
+
+# Hits return the cached frame itself rather than a copy of it
+def test_hits_share_the_cached_frame():
+    cache = victory_cache.FrameCache(1 << 20)
+    loaded = cache.get("a", 1, lambda: frame(10))
+
+    assert cache.get("a", 1, lambda: frame(99)) is loaded
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+# A patch replaces the frame callers already hold instead of editing it, and recounts its bytes
+def test_patch_copies_and_recounts_bytes():
+    cache = victory_cache.FrameCache(1 << 20)
+    held = cache.get("a", 1, lambda: frame(10))
+
+    cache.patch("a", 1, 2, lambda data: pd.concat([data, frame(100)], ignore_index=True))
+
+    patched = cache.get("a", 2, lambda: frame(0))
+    assert len(held) == 10
+    assert len(patched) == 110
+    assert cache.bytes == frame_bytes(patched)
+
+
+# A patch that grows the cache past its limit evicts the oldest entries, or the patched one if it alone is too big
+def test_patch_evicts_over_the_limit():
+    small = frame_bytes(frame(10))
+    cache = victory_cache.FrameCache(small * 3)
+    cache.get("old", 1, lambda: frame(10))
+    cache.get("a", 1, lambda: frame(10))
+
+    cache.patch("a", 1, 2, lambda data: pd.concat([data, frame(12)], ignore_index=True))
+    assert cache.stats()["entries"] == 1
+    assert cache.evictions == 1
+
+    cache.patch("a", 2, 3, lambda data: pd.concat([data, frame(1000)], ignore_index=True))
+    assert (cache.stats()["entries"], cache.bytes) == (0, 0)
@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+import victory_cache
+import victory_store
+import victory_userdata
+
+EMAIL = "a@x.com"
+
+
+@pytest.fixture
+def user(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIRS", [str(tmp_path / "user_data")])
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIR", str(tmp_path / "user_data"))
+    victory_cache.frame_cache.clear()
+    victory_userdata._pending_indexes.clear()
+    victory_store.init_master_store(str(tmp_path / "master.db"), str(tmp_path / "master.csv"))
+    victory_store.add_user("a", "a", EMAIL, "pw")
+    victory_userdata.save_user_data(EMAIL, pd.DataFrame({
+        "Sl.no": range(1, 11), "Name": [f"Name {i}" for i in range(1, 11)],
+        "Phone Number": [f"98765{i:05d}" for i in range(1, 11)], "Membershipnumber": [f"M{i}" for i in range(1, 11)],
+        "Location": ["Pune"] * 10, "S/T/SF": ["S"] * 3 + [None] * 7, "Regards": ["ok"] * 3 + [None] * 7}))
+
+
+# Function to read a user's data from disk, bypassing the frame cache
+def reload():
+    victory_cache.frame_cache.clear()
+    return victory_userdata.load_user_data(EMAIL).set_index("Sl.no")
+
+
+def row(data, sl_no, *columns):
+    return [None if pd.isna(value) else value for value in data.loc[sl_no, list(columns)]]
+
+
+def test_set_replays_edits_and_keeps_untouched_columns(user):
+    victory_userdata.save_user_row(EMAIL, 5, {"S/T/SF": "T", "Regards": "call back"})
+    victory_userdata.save_user_row(EMAIL, 5, {"Regards": "busy"})
+    victory_userdata.save_user_row(EMAIL, 6, {"S/T/SF": "SF"})
+
+    data = reload()
+    assert row(data, 5, "S/T/SF", "Regards", "Name", "Location") == ["T", "busy", "Name 5", "Pune"]
+    assert row(data, 6, "S/T/SF", "Regards") == ["SF", None]
+    assert row(data, 7, "S/T/SF", "Regards") == [None, None]
+
+
+# A set to None clears the field on reload, and the pending index agrees
+def test_set_to_none_clears_the_field(user):
+    assert victory_userdata.pending_count(EMAIL) == 7
+    victory_userdata.save_user_row(EMAIL, 2, {"S/T/SF": None, "Regards": None})
+
+    data = reload()
+    assert row(data, 2, "S/T/SF", "Regards", "Name") == [None, None, "Name 2"]
+    assert victory_userdata.pending_count(EMAIL) == 8
+    victory_userdata._pending_indexes.clear()
+    assert victory_userdata.pending_count(EMAIL) == 8
+
+
+def test_delete_and_insert_replay_in_log_order(user):
+    base = victory_userdata.load_base_data(EMAIL)
+    moved = base[base["Sl.no"].between(2, 3)].assign(**{"Sl.no": [11, 12]})
+    entries = [
+        {"op": "set", "Sl.no": 2, "values": {"Regards": "before delete"}},
+        {"op": "delete", "from": 2, "to": 3},
+        {"op": "insert", "rows": moved.astype(object).where(moved.notna(), None).to_dict("records")},
+        {"op": "set", "Sl.no": 11, "values": {"Regards": "after insert"}},
+        {"op": "set", "Sl.no": 3, "values": {"Regards": "deleted row"}},
+    ]
+
+    data = victory_userdata.apply_changes(base, entries).set_index("Sl.no")
+
+    assert sorted(data.index) == [1, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+    assert row(data, 11, "Name", "Regards") == ["Name 2", "after insert"]
+    assert row(data, 12, "Name", "Regards") == ["Name 3", "ok"]
+
+
+# Compaction folds the log into the base file without changing what a reload returns
+def test_compaction_matches_replay(user):
+    victory_userdata.save_user_row(EMAIL, 1, {"S/T/SF": None})
+    victory_userdata.save_user_row(EMAIL, 8, {"S/T/SF": "S", "Regards": "done"})
+    replayed = reload()
+
+    victory_userdata.compact_user_data(EMAIL)
+
+    assert victory_userdata.read_change_log(EMAIL) == []
+    pd.testing.assert_frame_equal(reload(), replayed, check_categorical=False)
@@ -0,0 +1,93 @@
+import glob
+import io
+
+import pandas as pd
+import pytest
+
+import victory_cache
+import victory_ingest
+import victory_store
+import victory_userdata
+
+EMAIL = "a@x.com"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIRS", [str(tmp_path / "user_data")])
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIR", str(tmp_path / "user_data"))
+    victory_cache.frame_cache.clear()
+    victory_userdata._pending_indexes.clear()
+    victory_store.init_master_store(str(tmp_path / "master.db"), str(tmp_path / "master.csv"))
+    victory_store.add_user("a", "a", EMAIL, "pw")
+    victory_userdata.save_user_data(EMAIL, pd.DataFrame({
+        "Sl.no": [1, 2], "Name": ["Asha", "Ravi"], "Phone Number": ["9000000001", "9000000002"],
+        "Membershipnumber": ["M1", "M2"]}))
+    victory_store.mark_lead_index_built()
+
+
+# Function to stage a CSV upload built from rows of (Name, Phone Number, Membershipnumber)
+def stage(rows):
+    upload = pd.DataFrame(rows, columns=["Name", "Phone Number", "Membershipnumber"])
+    upload = upload.reindex(columns=victory_ingest.REQUIRED_COLUMNS).assign(**{"Sl.no": range(1, len(rows) + 1)})
+    data = io.BytesIO(upload.to_csv(index=False).encode("utf-8"))
+    data.name = "upload.csv"
+    return victory_ingest.stage_upload(data)
+
+
+def duplicate_rows(duplicates):
+    return [tuple(None if pd.isna(value) else value for value in row)
+            for row in duplicates.itertuples(index=False, name=None)]
+
+
+# Rows matching an allocated lead (phones compared on their last digits) or an earlier upload row are reported
+def test_finds_allocated_and_repeated_leads(store):
+    meta = stage([("Asha", "7000000001", " m1 "), ("Ravi", "+91 90000 00002", "N2"), ("New", "7000000003", "N3"),
+                  ("New again", "7000000004", "N3")])
+
+    assert duplicate_rows(victory_ingest.find_duplicates(meta)) == [
+        (1, "Membershipnumber", "M1", EMAIL, 1, None),
+        (2, "Phone Number", "9000000002", EMAIL, 2, None),
+        (4, "Membershipnumber", "N3", None, None, 3),
+    ]
+
+
+# A rerun reads the cached report back until the lead index moves, then scans again and drops the old report
+def test_report_is_reused_until_the_lead_index_changes(store, monkeypatch):
+    meta = stage([("Asha", "7000000001", "M1"), ("New", "7000000003", "N3")])
+    scans = []
+    scan = victory_ingest._scan_duplicates
+    monkeypatch.setattr(victory_ingest, "_scan_duplicates", lambda meta: scans.append(meta) or scan(meta))
+
+    first = victory_ingest.find_duplicates(meta)
+    pd.testing.assert_frame_equal(victory_ingest.find_duplicates(meta), first)
+    assert len(scans) == 1
+
+    victory_userdata.append_user_rows(EMAIL, [pd.DataFrame({
+        "Sl.no": ["3"], "Name": ["New"], "Phone Number": ["7000000003"], "Membershipnumber": ["N3"]})])
+
+    assert duplicate_rows(victory_ingest.find_duplicates(meta))[1] == (2, "Membershipnumber", "N3", EMAIL, 3, None)
+    assert len(scans) == 2
+    assert glob.glob(victory_ingest.duplicates_path(meta["digest"], "*")) == [
+        victory_ingest.duplicates_path(meta["digest"], victory_store.lead_index_version())]
+
+
+def test_upload_without_data_rows_is_staged_with_a_warning(store):
+    meta = stage([])
+
+    assert (meta["rows"], meta["errors"]) == (0, [])
+    assert meta["warnings"] == ["Upload has a header row but no data rows"]
+    assert victory_ingest.find_duplicates(meta).empty
+
+
+def test_upload_missing_columns_or_header_is_refused(store):
+    data = io.BytesIO(b"Name,Phone Number\nAsha,9000000001\n")
+    data.name = "missing.csv"
+    meta = victory_ingest.stage_upload(data)
+    assert meta["errors"] == ["Upload is missing required columns: Sl.no, Membershipnumber, Sex, Designation, Org, "
+                              "Location"]
+
+    empty = io.BytesIO(b"")
+    empty.name = "empty.csv"
+    assert victory_ingest.stage_upload(empty)["errors"] == ["Upload is empty: it has no header row"]
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import victory_mail
+import victory_store
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    victory_store.init_master_store(str(tmp_path / "master.db"), str(tmp_path / "master.csv"))
+
+
+def add_message(status, attempts, lease_until=None, claimed_by=None):
+    now = time.time()
+    with victory_store.transaction() as conn:
+        return conn.execute(
+            "INSERT INTO outbox (recipient, subject, body, status, attempts, next_attempt_at, created_at, "
+            "claimed_by, lease_until) VALUES ('a@x.com', 's', 'b', ?, ?, ?, ?, ?, ?)",
+            (status, attempts, now - 1, now, claimed_by, lease_until)).lastrowid
+
+
+def message(message_id):
+    return victory_store.connect().execute(
+        "SELECT status, attempts, next_attempt_at, claimed_by, last_error FROM outbox WHERE id = ?",
+        (message_id,)).fetchone()
+
+
+# A message whose worker died mid-send counts as a failed attempt and waits out the backoff
+def test_expired_lease_counts_as_an_attempt(outbox):
+    message_id = add_message("sending", 0, lease_until=time.time() - 1, claimed_by="dead")
+
+    assert victory_mail._claim_next("w") is None
+
+    status, attempts, next_attempt_at, claimed_by, last_error = message(message_id)
+    assert (status, attempts, claimed_by, last_error) == ("queued", 1, None, victory_mail.LEASE_EXPIRED_ERROR)
+    assert next_attempt_at > time.time()
+
+
+# A message that keeps killing its worker stops being retried after MAX_ATTEMPTS
+def test_expired_lease_on_last_attempt_fails(outbox):
+    message_id = add_message("sending", victory_mail.MAX_ATTEMPTS - 1, lease_until=time.time() - 1, claimed_by="dead")
+
+    victory_mail._claim_next("w")
+
+    assert message(message_id)[:2] == ("failed", victory_mail.MAX_ATTEMPTS)
+
+
+# A live lease is left to its worker, whose result still applies; other workers cannot mark it
+def test_live_lease_is_left_alone(outbox):
+    message_id = add_message("sending", 0, lease_until=time.time() + 60, claimed_by="live")
+
+    assert victory_mail._claim_next("w") is None
+    victory_mail._mark_sent(message_id, "w")
+    assert message(message_id)[:2] == ("sending", 0)
+
+    victory_mail._mark_sent(message_id, "live")
+    assert message(message_id)[0] == "sent"
+
+
+def test_claim_leases_due_message(outbox):
+    message_id = add_message("queued", 0)
+
+    row = victory_mail._claim_next("w")
+
+    assert row[0] == message_id
+    assert message(message_id)[0] == "sending"
+    assert message(message_id)[3] == "w"
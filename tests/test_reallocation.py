@@ -0,0 +1,102 @@
+import glob
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import victory_cache
+import victory_store
+import victory_userdata
+
+ROWS = 2000
+
+
+@pytest.fixture
+def users(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIRS", [str(tmp_path / "user_data")])
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIR", str(tmp_path / "user_data"))
+    victory_cache.frame_cache.clear()
+    victory_userdata._pending_indexes.clear()
+    victory_store.init_master_store(str(tmp_path / "master.db"), str(tmp_path / "master.csv"))
+    emails = ["a@x.com", "b@x.com"]
+    for n, email in enumerate(emails):
+        victory_store.add_user(email.split("@")[0], email.split("@")[0], email, "pw")
+        victory_userdata.save_user_data(email, pd.DataFrame({
+            "Sl.no": range(1, ROWS + 1), "Name": [f"{email} {i}" for i in range(ROWS)],
+            "Phone Number": [f"9{n}{i:08d}" for i in range(ROWS)],
+            "Membershipnumber": [f"{email}-{i}" for i in range(ROWS)]}))
+    victory_store.increment_many("Assigned", {email: ROWS for email in emails})
+    return emails
+
+
+def row_counts(emails):
+    victory_cache.frame_cache.clear()
+    assigned = victory_store.load_master().set_index("Email")["Assigned"]
+    return [len(victory_userdata.load_user_data(email)) for email in emails], [int(assigned[e]) for e in emails]
+
+
+def journals():
+    return glob.glob(os.path.join(victory_userdata.USER_DATA_DIR, ".realloc-*.json"))
+
+
+# A recovery started while a move is in flight must leave the move alone, not roll it back once it commits
+def test_recovery_during_move_leaves_it_committed(users, monkeypatch):
+    errors = []
+    recovery = []
+
+    def recover():
+        try:
+            victory_userdata.recover_reallocations()
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+
+    commit = victory_store.commit_reallocation
+
+    def commit_while_recovering(*args, **kwargs):
+        recovery.append(threading.Thread(target=recover))
+        recovery[0].start()
+        time.sleep(0.2)
+        return commit(*args, **kwargs)
+
+    monkeypatch.setattr(victory_store, "commit_reallocation", commit_while_recovering)
+    moved, _ = victory_userdata.reallocate_range(users[0], users[1], 1, 100)
+    recovery[0].join()
+
+    assert errors == []
+    assert len(moved) == 100
+    assert row_counts(users) == ([ROWS - 100, ROWS + 100], [ROWS - 100, ROWS + 100])
+    assert journals() == []
+
+
+# A move whose commit fails rolls back its own log appends
+def test_failed_commit_rolls_back(users, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(victory_store, "commit_reallocation", fail)
+    with pytest.raises(RuntimeError):
+        victory_userdata.reallocate_range(users[0], users[1], 1, 100)
+
+    assert row_counts(users) == ([ROWS, ROWS], [ROWS, ROWS])
+    assert journals() == []
+
+
+# A journal left by a crashed mover (no one holds its lock) is rolled back by recovery
+def test_abandoned_journal_is_rolled_back(users):
+    journal = {"id": "crashed", "from": users[0], "to": users[1],
+               "from_log_size": victory_userdata._log_size(users[0]),
+               "to_log_size": victory_userdata._log_size(users[1])}
+    with open(victory_userdata._journal_path("crashed"), "w") as f:
+        json.dump(journal, f)
+    rows = victory_userdata.read_serial_range(users[0], 1, 10).assign(**{"Sl.no": range(ROWS + 1, ROWS + 11)})
+    victory_userdata._append_log_entry(users[1], {"op": "insert", "rows": rows.astype(object).where(
+        rows.notna(), None).to_dict("records")})
+
+    victory_userdata.recover_reallocations()
+
+    assert row_counts(users) == ([ROWS, ROWS], [ROWS, ROWS])
+    assert journals() == []
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import victory_export
+import victory_reports
+
+DAYS = ["2026-01-01", "2026-01-02", "2026-01-03"]
+
+
+@pytest.fixture
+def reports(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for day in DAYS:
+        victory_reports.upsert_report_rows("a@x.com", day, pd.DataFrame({
+            "Sl.no": range(1, 41), "Name": [f"{day} {i}" for i in range(40)], "Date": day, "User": "a"}))
+
+
+def test_preview_is_the_head_of_the_range(reports):
+    preview, more = victory_reports.preview_reports(date(2026, 1, 1), date(2026, 1, 3), limit=50)
+    full = victory_reports.query_reports(date(2026, 1, 1), date(2026, 1, 3))
+
+    assert more
+    assert len(full) == 120
+    pd.testing.assert_frame_equal(preview, full.head(50))
+
+
+# Days past the one that fills the preview are not read
+def test_preview_stops_reading_at_the_limit(reports, monkeypatch):
+    read = []
+    read_day = victory_reports._read_day
+    monkeypatch.setattr(victory_reports, "_read_day", lambda directory, columns: read.append(directory) or
+                        read_day(directory, columns))
+
+    preview, more = victory_reports.preview_reports(date(2026, 1, 1), date(2026, 1, 3), limit=40)
+
+    assert (len(preview), more) == (40, True)
+    assert len(read) == 2
+
+
+def test_preview_of_a_whole_small_range(reports):
+    preview, more = victory_reports.preview_reports(date(2026, 1, 2), date(2026, 1, 3), limit=80)
+    assert (len(preview), more) == (80, False)
+
+    preview, more = victory_reports.preview_reports(date(2025, 1, 1), date(2025, 1, 3))
+    assert (len(preview), more) == (0, False)
+
+
+# An export left behind by an ended session is removed by a later export
+def test_export_prunes_stale_exports(reports):
+    fd, stale = tempfile.mkstemp(prefix=victory_export.EXPORT_PREFIX, suffix=".csv.gz")
+    os.close(fd)
+    old = time.time() - victory_export.EXPORT_MAX_AGE_SECONDS - 60
+    os.utime(stale, (old, old))
+
+    path, rows = victory_export.export_report(date(2026, 1, 1), date(2026, 1, 3), "csv.gz")
+    try:
+        assert rows == 120
+        assert not os.path.exists(stale)
+    finally:
+        victory_export.discard_export(path)
@@ -0,0 +1,83 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import victory_cache
+import victory_search
+import victory_store
+import victory_userdata
+
+EMAIL = "a@x.com"
+
+
+@pytest.fixture
+def user(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIRS", [str(tmp_path / "user_data")])
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIR", str(tmp_path / "user_data"))
+    victory_cache.frame_cache.clear()
+    victory_userdata._pending_indexes.clear()
+    victory_store.init_master_store(str(tmp_path / "master.db"), str(tmp_path / "master.csv"))
+    victory_store.add_user("a", "a", EMAIL, "pw")
+    victory_userdata.save_user_data(EMAIL, pd.DataFrame({
+        "Sl.no": [1, 2, 3, 4], "Name": ["bob kumar", "Alice Kumar", "adam kumar", "Carl Rao"],
+        "Phone Number": ["9000000001", "9000000002", "9000000003", "9000000004"],
+        "Membershipnumber": ["M1", "M2", "M3", "M4"], "Org": ["A", "B", "A", "B"], "Location": ["Pune"] * 4}))
+
+
+def index_snapshot():
+    conn = victory_store.connect()
+    return (sorted(conn.execute("SELECT email, sl_no, name, phone, membership, designation, org, location, status "
+                                "FROM search_rows").fetchall(), key=str),
+            sorted(conn.execute("SELECT location, org, status, rows FROM search_facets WHERE rows > 0").fetchall()),
+            sorted(conn.execute("SELECT r.sl_no FROM search_fts JOIN search_rows r ON r.id = search_fts.rowid "
+                                "WHERE search_fts MATCH 'kumar'").fetchall()))
+
+
+# Names sort case-insensitively whether result columns are object or pandas' str dtype
+@pytest.mark.skipif(not victory_store.SEARCH_AVAILABLE, reason=victory_store.SEARCH_UNAVAILABLE_MESSAGE)
+@pytest.mark.parametrize("infer_string", [False, True])
+def test_results_sort_names_case_insensitively(user, infer_string):
+    with pd.option_context("future.infer_string", infer_string):
+        results, total, _ = victory_search.search("kumar")
+    assert total == 3
+    assert results["Name"].tolist() == ["adam kumar", "Alice Kumar", "bob kumar"]
+
+
+# Saving a whole allocation writes only the differences, leaving the index as a full rebuild would
+@pytest.mark.skipif(not victory_store.SEARCH_AVAILABLE, reason=victory_store.SEARCH_UNAVAILABLE_MESSAGE)
+def test_save_diffs_search_rows_like_a_rebuild(user):
+    victory_userdata.save_user_row(EMAIL, 1, {"S/T/SF": "S"})
+    data = victory_userdata.load_user_data(EMAIL).astype(object)
+    data.loc[data["Sl.no"] == 2, "Name"] = "Alicia Kumar"
+    data.loc[data["Sl.no"] == 3, "Org"] = "C"
+    data = pd.concat([data[data["Sl.no"] != 4], data[data["Sl.no"] == 4].assign(**{"Sl.no": 5})], ignore_index=True)
+    victory_userdata.save_user_data(EMAIL, data)
+    diffed = index_snapshot()
+    victory_store.connect().execute("INSERT INTO search_fts (search_fts) VALUES ('integrity-check')")
+
+    victory_userdata.rebuild_search_index([EMAIL])
+
+    assert diffed == index_snapshot()
+    assert [row[1:3] for row in diffed[0]] == [(1, "bob kumar"), (2, "Alicia Kumar"), (3, "adam kumar"),
+                                               (5, "Carl Rao")]
+
+
+# Without the trigram tokenizer the store opens without the search tables and saves still work
+def test_store_opens_without_search(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(victory_store, "SEARCH_AVAILABLE", False)
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIRS", [str(tmp_path / "user_data")])
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIR", str(tmp_path / "user_data"))
+    victory_store.init_master_store(str(tmp_path / "old.db"), str(tmp_path / "old.csv"))
+    victory_store.add_user("a", "a", EMAIL, "pw")
+
+    victory_userdata.save_user_data(EMAIL, pd.DataFrame({"Sl.no": [1], "Name": ["x"], "Phone Number": ["9000000001"],
+                                                         "Membershipnumber": ["M1"]}))
+    victory_userdata.save_user_row(EMAIL, 1, {"S/T/SF": "S"})
+    victory_userdata.rebuild_search_index([EMAIL])
+
+    with pytest.raises(sqlite3.OperationalError):
+        victory_store.connect().execute("SELECT * FROM search_rows")
+    assert victory_userdata.pending_count(EMAIL) == 0
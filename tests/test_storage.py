@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+import pytest
+
+import victory_export
+import victory_ingest
+import victory_storage
+import victory_store
+import victory_userdata
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIRS", [str(tmp_path / "user_data")])
+    monkeypatch.setattr(victory_userdata, "USER_DATA_DIR", str(tmp_path / "user_data"))
+    victory_store.init_master_store(str(tmp_path / "master.db"), str(tmp_path / "master.csv"))
+    victory_store.add_user("a", "a", "a@x.com", "pw")
+
+
+def request(module, function, *args, **kwargs):
+    attachments = []
+    return {"token": victory_storage.STORAGE_TOKEN, "module": module, "function": function,
+            "args": victory_storage.encode(list(args), attachments),
+            "kwargs": victory_storage.encode(kwargs, attachments)}, attachments
+
+
+def check(module, function, *args, **kwargs):
+    victory_storage._check_arguments(module, victory_storage._resolve(module, function), args, kwargs)
+
+
+# A list of emails is checked element by element before the function runs
+@pytest.mark.parametrize("function", ["load_user_summaries", "rebuild_lead_index", "rebuild_search_index"])
+def test_dispatch_refuses_email_lists_with_paths(store, function):
+    victory_store.mark_lead_index_built()
+    victory_store.mark_search_index_built()
+
+    with pytest.raises(PermissionError):
+        victory_storage._dispatch(*request("victory_userdata", function, ["a@x.com", "../../etc/x"]))
+
+    assert victory_store.lead_index_built()
+    assert victory_store.search_index_built()
+
+
+# Functions outside the page-facing API are refused even when they exist
+def test_dispatch_refuses_internal_functions(store):
+    with pytest.raises(PermissionError):
+        victory_storage._dispatch(*request("victory_store", "reset_lead_index"))
+    with pytest.raises(PermissionError):
+        victory_storage._dispatch(*request("os", "remove", "master.db"))
+
+
+def test_dispatch_runs_page_functions(store):
+    assert victory_storage._dispatch(*request("victory_userdata", "pending_count", "a@x.com")) == 0
+
+
+@pytest.mark.parametrize("email", ["../a", "a/b", "..", "", "a\\b"])
+def test_check_arguments_refuses_bad_emails(store, email):
+    with pytest.raises(PermissionError):
+        check("victory_userdata", "load_user_data", email)
+    with pytest.raises(PermissionError):
+        check("victory_userdata", "reallocate_range", "a@x.com", email, 1, 2)
+
+
+def test_check_arguments_refuses_paths_outside_the_store(store, tmp_path):
+    with pytest.raises(PermissionError):
+        check("victory_store", "export_master_csv", "/tmp/master.csv")
+    with pytest.raises(PermissionError):
+        check("victory_store", "init_master_store", str(tmp_path / "other.db"), "master.csv")
+    with pytest.raises(PermissionError):
+        check("victory_export", "discard_export", str(tmp_path / "master.db"))
+    check("victory_store", "export_master_csv", "master.csv")
+    check("victory_store", "init_master_store", "master.db", "master.csv")
+
+
+def test_check_arguments_refuses_forged_staged_uploads(store):
+    digest = "0" * 64
+    meta = {"digest": digest, "path": victory_ingest.staged_paths(digest)[0]}
+    check("victory_ingest", "find_duplicates", meta)
+    with pytest.raises(PermissionError):
+        check("victory_ingest", "find_duplicates", dict(meta, path="/etc/passwd"))
+    with pytest.raises(PermissionError):
+        check("victory_ingest", "find_duplicates", dict(meta, digest="../x"))
+
+
+def test_check_arguments_accepts_report_exports(store):
+    fd, path = tempfile.mkstemp(prefix=victory_export.EXPORT_PREFIX, suffix=".csv.gz")
+    os.close(fd)
+    try:
+        check("victory_export", "discard_export", path)
+    finally:
+        victory_export.discard_export(path)
+    assert not os.path.exists(path)
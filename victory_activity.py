@@ -0,0 +1,67 @@
+# Call activity history: an append-only log of every submit plus hourly and daily rollups per user,
+# so throughput trends are read from the rollups instead of rescanning call records
+import time
+
+import pandas as pd
+
+import victory_store
+
+# Rollup granularities: label -> (key stored in activity_rollup, strftime format of a period)
+GRANULARITIES = {"Hourly": ("hour", "%Y-%m-%d %H:00"), "Daily": ("day", "%Y-%m-%d")}
+
+# Rollup counters, as stored and as shown
+ROLLUP_COLUMNS = {"calls": "Calls", "first_calls": "First Calls", "re_edits": "Re-edits", "spoke": "Spoke",
+                  "tried": "Tried", "sf": "SF"}
+
+STATUS_COUNTERS = {"S": "spoke", "T": "tried", "SF": "sf"}
+
+
+# Function to record one submitted call and fold it into the user's hourly and daily rollups
+def record_call(email, sl_no, old_status, new_status, at=None):
+    at = time.time() if at is None else at
+    old_status = old_status if pd.notna(old_status) else None
+    first_call = 1 if old_status is None else 0
+    counter = STATUS_COUNTERS.get(new_status)
+    with victory_store.transaction() as conn:
+        conn.execute("INSERT INTO activity (at, email, sl_no, old_status, new_status) VALUES (?, ?, ?, ?, ?)",
+                     (at, email, int(sl_no), old_status, new_status))
+        for granularity, fmt in GRANULARITIES.values():
+            conn.execute(
+                "INSERT INTO activity_rollup (email, granularity, period, calls, first_calls, re_edits, spoke, tried, sf) "
+                "VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (granularity, period, email) DO UPDATE SET calls = calls + 1, "
+                "first_calls = first_calls + excluded.first_calls, re_edits = re_edits + excluded.re_edits, "
+                "spoke = spoke + excluded.spoke, tried = tried + excluded.tried, sf = sf + excluded.sf",
+                (email, granularity, time.strftime(fmt, time.localtime(at)), first_call, 1 - first_call,
+                 int(counter == "spoke"), int(counter == "tried"), int(counter == "sf")))
+
+
+# Function to read rollups for periods within [start_date, end_date]; one row per (period, email)
+def query_rollups(start_date, end_date, granularity="Daily", emails=None):
+    key, _ = GRANULARITIES[granularity]
+    sql = (f"SELECT period, email, {', '.join(ROLLUP_COLUMNS)} FROM activity_rollup "
+           "WHERE granularity = ? AND period >= ? AND period < ?")
+    params = [key, str(start_date), f"{end_date}~"]  # "~" sorts after any time suffix on the end date
+    if emails is not None:
+        emails = list(emails)
+        sql += f" AND email IN ({', '.join('?' * len(emails))})"
+        params += emails
+    rows = victory_store.connect().execute(sql + " ORDER BY period", params).fetchall()
+    rollups = pd.DataFrame(rows, columns=["Period", "Email"] + list(ROLLUP_COLUMNS.values()))
+    rollups["Period"] = pd.to_datetime(rollups["Period"])
+    return rollups
+
+
+# Function to total rollups per period across users
+def trend(start_date, end_date, granularity="Daily"):
+    rollups = query_rollups(start_date, end_date, granularity)
+    return rollups.drop(columns="Email").groupby("Period", as_index=False).sum()
+
+
+# Function to summarize each caller's throughput over a date range: totals, active hours and calls per active hour
+def caller_velocity(start_date, end_date):
+    hourly = query_rollups(start_date, end_date, "Hourly")
+    velocity = hourly.groupby("Email").agg(
+        **{label: (label, "sum") for label in ROLLUP_COLUMNS.values()}, **{"Active Hours": ("Period", "nunique")})
+    velocity["Calls per Active Hour"] = (velocity["Calls"] / velocity["Active Hours"]).round(2)
+    return velocity.reset_index()
@@ -0,0 +1,516 @@
+# Admin pages (dashboard, allocation, reports, search, performance), imported only when the admin is logged in
+# so caller reruns do not load AgGrid, plotly or the ingestion and export code
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+from st_aggrid import AgGrid, GridOptionsBuilder, ColumnsAutoSizeMode
+
+import victory_activity
+import victory_cache
+import victory_charts
+import victory_events
+import victory_export
+import victory_ingest
+import victory_metrics
+import victory_reports
+import victory_search
+import victory_store
+import victory_userdata
+from victory_data import MASTER_CSV, load_master_csv, update_assigned_count
+
+# Seconds between live refreshes of the dashboard's totals and charts
+DASHBOARD_REFRESH_SECONDS = 5
+
+# st.fragment reruns part of a page on its own; older Streamlit releases only have the experimental name
+live_fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+# Function to format the completed and pending serial ranges of each user from the summary index
+def completed_pending_ranges(master_df, summaries):
+    completed_list = []
+    pending_list = []
+    for email, assigned in zip(master_df["Email"], master_df["Assigned"]):
+        first_completed_serial = last_completed_serial = None
+        if email in summaries.index:
+            first_completed_serial = summaries.at[email, "min_completed"]
+            last_completed_serial = summaries.at[email, "max_completed"]
+
+        if pd.notna(first_completed_serial) and pd.notna(last_completed_serial):
+            first_completed_serial = int(first_completed_serial)
+            last_completed_serial = int(last_completed_serial)
+            completed_range = f"{first_completed_serial} - {last_completed_serial}" if first_completed_serial <= last_completed_serial else "None"
+            pending_range = f"{last_completed_serial + 1} - {assigned}" if last_completed_serial < assigned else "None"
+        else:
+            completed_range = "None"
+            pending_range = f"1 - {assigned}"  # If no data is completed
+
+        completed_list.append(completed_range)
+        pending_list.append(pending_range)
+    return completed_list, pending_list
+
+
+# Function to build the dashboard's user table from the master table and summary index: the AgGrid view with
+# completion and serial range columns, its grid options and the master CSV export
+@victory_metrics.timed()
+def build_dashboard_table():
+    # The cached master frame is shared: add the dashboard columns to a copy
+    master_df = load_master_csv().copy()
+
+    # Completed and Pending ranges come from the per-user summary index, not the users' files
+    summaries = victory_userdata.load_user_summaries(master_df["Email"].tolist())
+    master_df["Completed"], master_df["Pending"] = completed_pending_ranges(master_df, summaries)
+    last_modified = pd.to_numeric(master_df["Email"].map(summaries["last_modified"]), errors="coerce")
+    master_df["Last Updated"] = pd.to_datetime(last_modified, unit="s").dt.strftime("%Y-%m-%d %H:%M").fillna("")
+
+    # Calculate percentage of completion for each user and round to 2 decimal places
+    master_df['Completion (%)'] = ((master_df['Spoke'] + master_df['Tried'] + master_df['SF']) / master_df['Assigned']) * 100
+    master_df['Completion (%)'] = master_df['Completion (%)'].fillna(0).round(2)  # Handle NaN and round to 2 decimals
+
+    # Create a DataFrame with the required columns for AgGrid
+    display_df = master_df[["Sl.no", "Name", "Assigned", "Spoke", "Tried", "SF", "Completion (%)", "Completed",
+                            "Pending", "Last Updated"]].copy()
+
+    # Use AgGrid to create an interactive table
+    gb = GridOptionsBuilder.from_dataframe(display_df)
+    gb.configure_pagination(enabled=True)
+    gb.configure_side_bar()
+    gb.configure_default_column(editable=False, filter=True, sortable=True, resizable=True)
+    gb.configure_auto_height()
+    gb.configure_selection(selection_mode="single")
+    grid_options = gb.build()
+    return display_df, grid_options, master_df[victory_store.MASTER_COLUMNS].to_csv(index=False)
+
+
+# Function to get the dashboard's user table, built once per data version and shared by every admin session
+def dashboard_table():
+    return victory_cache.memo_cache.get("dashboard_table", victory_store.data_version(), build_dashboard_table,
+                                        sources=("master", "summaries"))
+
+
+@victory_metrics.timed()
+def admin_dashboard():
+    st.title("Admin Dashboard")
+    st.write("User Statistics (Data from Master CSV):")
+
+    display_df, grid_options, master_csv = dashboard_table()
+
+    # Totals and charts refresh on a timer from the change feed, without rerunning the whole page
+    live_statistics()
+
+    st.subheader("Interactive User Data Table")
+    AgGrid(
+        display_df,
+        gridOptions=grid_options,
+        enable_enterprise_modules=True,
+        allow_unsafe_jscode=True,
+        theme='streamlit',  # Available themes: 'streamlit', 'light', 'dark', 'blue', 'fresh', 'material'
+        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS
+    )
+
+    # Export the master data back to CSV
+    st.download_button(label="Download Master CSV",
+                       data=master_csv,
+                       file_name=MASTER_CSV,
+                       mime="text/csv",
+                       key="download_master_csv")
+
+    # Reduce the gap by removing excessive spacing
+    st.markdown("<style>div.block-container {padding-top: 0px; padding-bottom: 0px;}</style>", unsafe_allow_html=True)
+
+    # ----- Graphs -----
+    live_charts()
+
+    # Daily calls over the last 30 days, from the activity rollups
+    st.subheader("Calls per Day (Last 30 Days)")
+    today = datetime.now().date()
+    activity_df = victory_activity.trend(today - timedelta(days=29), today, "Daily")
+    if activity_df.empty:
+        st.write("No calls recorded in the last 30 days.")
+    else:
+        st.plotly_chart(victory_charts.activity_figure(activity_df, "Daily Calls"))
+
+
+# Function to get this session's live dashboard stats, applying the changes fed since the last refresh
+def refresh_live_stats():
+    live = st.session_state.get("dashboard_live")
+    if live is None:
+        live = st.session_state.dashboard_live = victory_events.LiveStats.load()
+    else:
+        live.refresh()
+    return live
+
+
+# Totals across all users, refreshed from the change feed
+@live_fragment(run_every=DASHBOARD_REFRESH_SECONDS)
+def live_statistics():
+    live = refresh_live_stats()
+
+    # Display totals horizontally using Streamlit columns
+    st.subheader("Total Statistics")
+    col1, col2, col3, col4, col5 = st.columns(5)
+
+    col1.metric("Total Assigned", int(live.totals['Assigned']))
+    col2.metric("Total Spoke", int(live.totals['Spoke']))
+    col3.metric("Total Tried", int(live.totals['Tried']))
+    col4.metric("Total SF", int(live.totals['SF']))
+    col5.metric("Overall Completion (%)", f"{live.overall_completion()}%")
+
+
+# Charts of per-user stats, rebuilt only when the change feed has moved
+@live_fragment(run_every=DASHBOARD_REFRESH_SECONDS)
+def live_charts():
+    live = refresh_live_stats()
+
+    # Large teams are shown as top N plus "Others"
+    top_n = st.number_input("Users shown in charts", min_value=5, max_value=200,
+                            value=victory_charts.TOP_N_DEFAULT, step=5, key="chart_top_n")
+    figures = victory_charts.dashboard_figures(live.stats, live.seq, int(top_n))
+
+    # Bar chart: Assigned vs. Spoke, Tried, SF
+    st.subheader("Bar Chart: Performance of Users")
+    st.plotly_chart(figures["performance"])
+
+    # Pie chart: Distribution of total Spoke, Tried, SF
+    st.subheader("Pie Chart: Distribution of Actions")
+    st.plotly_chart(figures["distribution"])
+
+    # Completion percentage bar chart
+    st.subheader("Completion Percentage by User")
+    st.plotly_chart(figures["completion"])
+
+
+# Function to check a staged upload against every allocated lead, show the duplicates found and ask
+# what to do with them; returns (duplicates, dedup mode)
+def dedup_controls(staged, master_df, key):
+    # Backfill the lead index from the users' files the first time it is needed
+    if not victory_store.lead_index_built():
+        with st.spinner("Indexing allocated leads..."):
+            victory_userdata.rebuild_lead_index(master_df["Email"].dropna().drop_duplicates().tolist())
+
+    duplicates = victory_ingest.find_duplicates(staged)
+    if duplicates.empty:
+        st.write("No uploaded row is already allocated.")
+        return duplicates, victory_ingest.DEDUP_REPORT
+
+    rows = duplicates["Row"].nunique()
+    allocated = duplicates["Allocated To"].notna()
+    st.warning(f"{rows} uploaded rows match a Membershipnumber or Phone Number that is already allocated "
+               f"({duplicates.loc[allocated, 'Allocated To'].nunique()} users) or repeated in the upload.")
+    names = dict(zip(master_df["Email"], master_df["Name"]))
+    with st.expander("Duplicate Report"):
+        report = duplicates.assign(User=duplicates["Allocated To"].map(names))
+        st.dataframe(report)
+        st.download_button("Download Duplicate Report", report.to_csv(index=False),
+                           file_name=f"duplicates_{staged['digest'][:12]}.csv", mime="text/csv",
+                           key=f"{key}_duplicates_download")
+    return duplicates, st.radio("Duplicates", victory_ingest.DEDUP_MODES, horizontal=True, key=f"{key}_dedup_mode")
+
+
+# Function to merge duplicates when asked to and report how many allocated rows were updated
+def merge_if_requested(staged, duplicates, mode):
+    if mode == victory_ingest.DEDUP_MERGE:
+        merged = victory_ingest.merge_duplicates(staged, duplicates)
+        st.info(f"Updated {merged} already allocated rows from the upload.")
+
+
+# Bulk allocation: split one upload across several users
+def admin_bulk_allocate(master_df):
+    user_names = master_df["Name"].tolist()
+    selected_names = st.multiselect("Users to Allocate Data to", user_names, default=user_names)
+    strategy = st.radio("Split Strategy", victory_ingest.SPLIT_STRATEGIES, horizontal=True)
+    uploaded_file = st.file_uploader("Upload Data for Bulk Allocation", type=["csv", "xlsx"], key="bulk_upload")
+
+    if uploaded_file is None or not selected_names:
+        return
+
+    staged = victory_ingest.stage_upload(uploaded_file)
+    for warning in staged["warnings"]:
+        st.warning(warning)
+    for error in staged["errors"]:
+        st.error(error)
+    if staged["errors"]:
+        return
+
+    duplicates, dedup_mode = dedup_controls(staged, master_df, "bulk")
+    to_allocate = staged
+    if dedup_mode != victory_ingest.DEDUP_REPORT:
+        to_allocate = victory_ingest.without_duplicates(staged, duplicates)
+
+    # Pending load is Assigned minus the calls already made
+    selected = master_df[master_df["Name"].isin(selected_names)].drop_duplicates(subset="Email")
+    pending = selected["Assigned"] - (selected["Spoke"] + selected["Tried"] + selected["SF"])
+    users = [{"email": email, "name": name, "pending": int(load)}
+             for email, name, load in zip(selected["Email"], selected["Name"], pending)]
+
+    plan = victory_ingest.plan_bulk_split(to_allocate, users, strategy)
+    st.write(f"{to_allocate['rows']} rows will be split across {len(users)} users:")
+    st.dataframe(pd.DataFrame({"User": [user["name"] for user in users],
+                               "Pending": [user["pending"] for user in users],
+                               "Rows to Allocate": plan["counts"]}))
+
+    if st.button("Allocate to Selected Users"):
+        try:
+            merge_if_requested(staged, duplicates, dedup_mode)
+            allocated = victory_ingest.allocate_bulk(to_allocate, users, plan) if to_allocate["rows"] else {}
+            st.success(f"Allocated {sum(allocated.values())} rows across {len(allocated)} users!")
+        except Exception as e:
+            st.error(f"An error occurred during bulk allocation: {str(e)}")
+
+
+@victory_metrics.timed()
+def admin_allocate():
+    st.title("Admin Allocate")
+
+    # Load master CSV for users
+    master_df = load_master_csv()
+
+    allocation_mode = st.radio("Allocation Mode", ["Single User", "Bulk (split across users)"], horizontal=True)
+    if allocation_mode != "Single User":
+        admin_bulk_allocate(master_df)
+    else:
+        # Display a dropdown to select a user by name for allocation
+        user_name = st.selectbox("Select User to Allocate Data", master_df["Name"].tolist())
+
+        # Find the corresponding email for the selected user
+        user_row = master_df[master_df["Name"] == user_name]
+        if not user_row.empty:
+            user_email = user_row["Email"].values[0]
+
+            # Display a file uploader to upload data for allocation
+            uploaded_file = st.file_uploader("Upload Data for Allocation", type=["csv", "xlsx"])
+
+            if uploaded_file is not None:
+                # Parse and validate the upload once in chunks; reruns reuse the copy staged under its hash
+                staged = victory_ingest.stage_upload(uploaded_file)
+                for warning in staged["warnings"]:
+                    st.warning(warning)
+                for error in staged["errors"]:
+                    st.error(error)
+
+                if not staged["errors"]:
+                    st.write("Uploaded Data Preview")
+                    st.write(pd.DataFrame(staged["preview"]))  # Display the first few rows of the data
+
+                    # Check the upload against every allocated lead before anything is written
+                    duplicates, dedup_mode = dedup_controls(staged, master_df, "single")
+                    to_allocate = staged
+                    if dedup_mode != victory_ingest.DEDUP_REPORT:
+                        to_allocate = victory_ingest.without_duplicates(staged, duplicates)
+                    st.write(f"{to_allocate['rows']} rows ready to allocate")
+
+                    # Button to confirm the allocation
+                    if st.button("Allocate Data"):
+                        try:
+                            merge_if_requested(staged, duplicates, dedup_mode)
+
+                            # Append the staged rows to the user's individual CSV
+                            allocated_rows = 0
+                            if to_allocate["rows"]:
+                                allocated_rows = victory_ingest.allocate_staged(user_email, user_name, to_allocate)
+
+                            # Update the user's assigned count in the master CSV
+                            update_assigned_count(user_email, allocated_rows)
+
+                            # Reload the updated master CSV to refresh the dashboard
+                            master_df = load_master_csv()
+
+                            st.success(f"Data allocated successfully to {user_name}!")
+
+                        except Exception as e:
+                            st.error(f"An error occurred while saving data: {str(e)}")
+
+        else:
+            st.error("User not found in master CSV")
+
+    # ---- Reallocation Section ----
+    st.subheader("Reallocate Data")
+
+    if 'reallocation_started' not in st.session_state:
+        st.session_state.reallocation_started = False
+
+    if st.button("Reallocate"):
+        st.session_state.reallocation_started = True
+
+    if st.session_state.reallocation_started:
+        reallocate_from = st.selectbox("Reallocate from", master_df["Name"].tolist(), key="reallocate_from")
+        reallocate_to = st.selectbox("Reallocate to", master_df["Name"].tolist(), key="reallocate_to")
+
+        start_serial = st.number_input("From Serial No.", min_value=0, key="start_serial")
+        end_serial = st.number_input("To Serial No.", min_value=0, key="end_serial")
+        keep_serials = st.checkbox("Keep original serial numbers", key="keep_serials")
+
+        if st.button("Confirm Reallocation"):
+            if start_serial > end_serial:
+                st.error("The starting serial number must be less than or equal to the ending serial number.")
+            else:
+                try:
+                    from_user_email = master_df[master_df["Name"] == reallocate_from]["Email"].values[0]
+                    to_user_email = master_df[master_df["Name"] == reallocate_to]["Email"].values[0]
+
+                    # Only the rows in the range are read and moved; neither user's full data is loaded
+                    moved, original_serials = victory_userdata.reallocate_range(
+                        from_user_email, to_user_email, int(start_serial), int(end_serial), keep_serials)
+
+                    if moved.empty:
+                        st.error("No data found in the specified serial range for reallocation.")
+                    else:
+                        victory_reports.move_report_rows(from_user_email, to_user_email, reallocate_to, moved,
+                                                         original_serials)
+
+                        # Reload the updated master CSV to refresh the dashboard
+                        master_df = load_master_csv()
+
+                        st.success(
+                            f"Successfully reallocated Serial No. {start_serial} to {end_serial} from {reallocate_from} to {reallocate_to}!")
+
+                except Exception as e:
+                    st.error(f"An error occurred during reallocation: {str(e)}")
+
+
+@victory_metrics.timed()
+def admin_reports():
+    st.title("Admin Reports")
+
+    # Date filters for the report
+    start_date = st.date_input("Start Date")
+    end_date = st.date_input("End Date")
+
+    if start_date > end_date:
+        st.error("End date must be greater than or equal to start date.")
+
+    # Load the master CSV for all users
+    master_df = load_master_csv()
+
+    # Backfill the date-partitioned report store from the users' files the first time it is needed
+    if not victory_reports.is_built():
+        with st.spinner("Building the report store from user data..."):
+            victory_reports.rebuild_report_store(
+                list(master_df[["Email", "Name"]].itertuples(index=False, name=None)))
+
+    # Preview the first rows of the range; the whole range is only read by the streamed export below
+    report_df, more = victory_reports.preview_reports(start_date, end_date)
+
+    if not report_df.empty:
+        # Reorder and rename columns as required
+        report_df = report_df[['Sl.no', 'Name', 'Membershipnumber', 'Phone Number', 'S/T/SF',
+                               'Regards', 'Date', 'Location', 'New Location', 'User']]
+
+        st.write("Filtered Report")
+        if more:
+            st.caption(f"Showing the first {len(report_df)} rows; the download has the whole range.")
+        st.dataframe(report_df)
+
+        # Export by streaming the report partitions to a file rather than building the workbook in memory
+        export_label = st.radio("Export Format", list(victory_export.EXPORT_FORMATS), horizontal=True,
+                                key="report_export_format")
+        extension, mime = victory_export.EXPORT_FORMATS[export_label]
+        if st.button("Prepare Download", key="prepare_report_export"):
+            previous = st.session_state.get("report_export")
+            if previous:
+                victory_export.discard_export(previous["path"])
+            path, rows = victory_export.export_report(start_date, end_date, extension)
+            st.session_state.report_export = {"path": path, "rows": rows, "extension": extension, "mime": mime,
+                                              "range": (start_date, end_date)}
+
+        export = st.session_state.get("report_export")
+        if export and export["range"] == (start_date, end_date) and os.path.exists(export["path"]):
+            with open(export["path"], "rb") as export_file:
+                st.download_button(label=f"Download Report ({export['rows']} rows)",
+                                   data=export_file,
+                                   file_name=f"report_{start_date}_to_{end_date}.{export['extension']}",
+                                   mime=export["mime"],
+                                   key="download_button")
+    else:
+        st.write("No data available for the selected date range.")
+
+    # Throughput over the range comes from the hourly/daily activity rollups
+    st.subheader("Call Activity")
+    granularity = st.radio("Granularity", list(victory_activity.GRANULARITIES), index=1, horizontal=True,
+                           key="activity_granularity")
+    activity_df = victory_activity.trend(start_date, end_date, granularity)
+    if activity_df.empty:
+        st.write("No calls recorded in the selected date range.")
+    else:
+        st.plotly_chart(victory_charts.activity_figure(activity_df, f"{granularity} Calls"))
+        velocity = victory_activity.caller_velocity(start_date, end_date)
+        velocity.insert(0, "User", velocity["Email"].map(master_df.drop_duplicates("Email").set_index("Email")["Name"]))
+        st.write("Caller Velocity")
+        st.dataframe(velocity.drop(columns="Email"), hide_index=True)
+
+
+# Admin Search Page: find leads across every user's allocation
+@victory_metrics.timed()
+def admin_search():
+    st.title("Search Leads")
+    if not victory_store.SEARCH_AVAILABLE:
+        st.error(victory_store.SEARCH_UNAVAILABLE_MESSAGE)
+        return
+    master_df = load_master_csv()
+
+    # Backfill the search index from the users' files the first time it is needed
+    if not victory_store.search_index_built():
+        with st.spinner("Indexing allocated leads for search..."):
+            victory_userdata.rebuild_search_index(master_df["Email"].dropna().drop_duplicates().tolist())
+
+    text = st.text_input("Name, phone, membership number, Org, Location or Designation", key="search_text")
+    fuzzy = st.checkbox("Allow misspelled names", key="search_fuzzy")
+
+    # The facet selections made on the previous run narrow this one
+    filters = {label: st.session_state.get(f"search_facet_{label}", []) for label in victory_search.FACETS}
+    results, total, facets = victory_search.search(text, filters, fuzzy=fuzzy)
+
+    for column, (label, counts) in zip(st.columns(len(facets)), facets.items()):
+        options = list(dict.fromkeys(list(counts.index) + filters[label]))
+        column.multiselect(label, options, key=f"search_facet_{label}",
+                           format_func=lambda value, counts=counts: f"{value} ({counts.get(value, 0)})")
+
+    if total > victory_search.SCAN_ROWS:
+        st.write(f"More than {victory_search.SCAN_ROWS} matching rows (counts cover the first "
+                 f"{victory_search.SCAN_ROWS}), showing {len(results)}; add terms or pick facets to narrow the search")
+    else:
+        shown = f", showing the first {len(results)}" if total > len(results) else ""
+        st.write(f"{total} matching rows{shown}")
+    if not results.empty:
+        results.insert(0, "User", results["Email"].map(dict(zip(master_df["Email"], master_df["Name"]))))
+        st.dataframe(results, hide_index=True)
+
+
+# Admin Performance Page (listed only when VICTORY_METRICS=1)
+def admin_performance():
+    st.title("Performance")
+    timings, counters = victory_metrics.snapshot()
+    st.caption("Counters cover this server process since it started or was last reset.")
+
+    if timings:
+        timings_df = pd.DataFrame([
+            {"Function": name, "Calls": t["calls"], "Errors": t["errors"], "Total (s)": round(t["total"], 3),
+             "Mean (ms)": round(t["total"] / t["calls"] * 1000, 2), "Max (ms)": round(t["max"] * 1000, 2)}
+            for name, t in timings.items()]).sort_values("Total (s)", ascending=False)
+        st.dataframe(timings_df, hide_index=True)
+    else:
+        st.write("No instrumented calls recorded yet.")
+
+    cache = victory_cache.cache_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Reruns", counters.get("reruns", 0))
+    col2.metric("MB Read", round(counters.get("bytes_read", 0) / 1e6, 2))
+    col3.metric("MB Written", round(counters.get("bytes_written", 0) / 1e6, 2))
+    col4.metric("Cache Hit Rate", f"{cache['hit_rate'] * 100:.1f}%")
+    st.write(f"Frame cache: {cache['entries']} entries, {cache['bytes'] / 1e6:.1f} of "
+             f"{cache['max_bytes'] / 1e6:.0f} MB, {cache['evictions']} evictions")
+    memo = victory_cache.memo_stats()
+    st.write(f"Shared views: {memo['entries']} of {memo['max_entries']} entries, "
+             f"{memo['hit_rate'] * 100:.1f}% hit rate, {memo['expirations']} expired after {memo['ttl']:.0f} s, "
+             f"{memo['invalidations']} invalidated by writes, {memo['evictions']} evictions")
+    if st.button("Clear shared views"):
+        victory_cache.invalidate_derived()
+
+    metrics_text = victory_metrics.render()
+    with st.expander("Prometheus text"):
+        st.code(metrics_text, language="text")
+    st.download_button("Download metrics", metrics_text, file_name="victory_metrics.prom", mime="text/plain")
+    if st.button("Reset counters"):
+        victory_metrics.reset()
+        st.rerun()
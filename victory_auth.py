@@ -0,0 +1,126 @@
+# Credential checks: an in-memory username index over the users table and salted PBKDF2 password hashes
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import victory_store
+
+# Stored hash layout: pbkdf2_sha256$<iterations>$<salt>$<hash>, salt and hash base64-encoded
+HASH_ALGORITHM = "pbkdf2_sha256"
+HASH_ITERATIONS = 600000
+SALT_BYTES = 16
+
+# Password checks run on this many threads at most; PBKDF2 releases the GIL while it works
+VERIFY_WORKERS = int(os.environ.get("VICTORY_AUTH_WORKERS", "2"))
+
+_verify_pool = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix="victory-auth")
+_index_lock = threading.Lock()
+_index = {}
+_index_version = None
+
+
+# Function to hash a password with a fresh salt
+def hash_password(password, iterations=HASH_ITERATIONS):
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join([HASH_ALGORITHM, str(iterations), base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+
+# Function to check whether a stored password is a hash (older rows hold plaintext)
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(HASH_ALGORITHM + "$")
+
+
+# Function to compare a password with a stored hash (or, for rows not yet upgraded, plaintext)
+def check_password(password, stored):
+    if not is_hashed(stored):
+        return stored is not None and hmac.compare_digest(str(stored).encode("utf-8"), password.encode("utf-8"))
+    _, iterations, salt, expected = stored.split("$")
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations))
+    return hmac.compare_digest(digest, base64.b64decode(expected))
+
+
+_dummy_hash = None
+
+
+# Function to get the hash compared against for unknown usernames, so they take as long to reject as
+# wrong passwords (built on first use rather than at import)
+def _get_dummy_hash():
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(os.urandom(8).hex())
+    return _dummy_hash
+
+
+# Function to get the username index, reloading it only when credentials changed since it was built
+def _credentials():
+    global _index, _index_version
+    version = victory_store.credentials_version()
+    with _index_lock:
+        if version != _index_version:
+            index = {}
+            for username, email, password in victory_store.load_credentials():
+                index.setdefault(username, {"email": email, "password": password})
+            _index, _index_version = index, version
+        return _index
+
+
+# Function to look up a user's credential record by username (None if unknown)
+def lookup(username):
+    return _credentials().get(username)
+
+
+# Function to store a new password hash for a user, updating the index in place
+def set_password(username, password):
+    global _index_version
+    hashed = hash_password(password)
+    updated, (old_version, new_version) = victory_store.set_password(username, hashed)
+    with _index_lock:
+        if updated and _index_version == old_version and username in _index:
+            _index[username] = dict(_index[username], password=hashed)
+            _index_version = new_version
+    return updated
+
+
+# Function to check a username and password on the verification pool; plaintext rows are upgraded
+# to a hash on their first successful login. Returns the user's record or None
+def authenticate(username, password):
+    record = lookup(username)
+    stored = record["password"] if record is not None else _get_dummy_hash()
+    if not _verify_pool.submit(check_password, password, stored).result():
+        return None
+    if record is None:
+        return None
+    if not is_hashed(stored):
+        set_password(username, password)
+    return record
+
+
+# Function to hash every remaining plaintext password in the store
+def upgrade_all():
+    upgraded = 0
+    seen = set()
+    for username, _, password in victory_store.load_credentials():
+        # Only the first row of a username is used for logins (and updated by set_password)
+        if username in seen:
+            continue
+        seen.add(username)
+        if password is not None and not is_hashed(password):
+            victory_store.set_password(username, hash_password(password))
+            upgraded += 1
+    return upgraded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage Victory user credentials")
+    parser.add_argument("command", choices=["upgrade"])
+    parser.add_argument("--db", default="master_users.db")
+    parser.add_argument("--csv", default="master_users.csv")
+    args = parser.parse_args()
+
+    victory_store.init_master_store(args.db, args.csv)
+    print(f"Hashed {upgrade_all()} plaintext passwords")
@@ -0,0 +1,405 @@
+# Benchmarks for the hot paths: generates a synthetic master_users.csv + user_data/ tree at a chosen scale,
+# runs each path headless (page renders through Streamlit's AppTest, no browser) and reports latency
+# percentiles, peak RSS and bytes written as JSON that can be compared across commits.
+#
+#   python victory_bench.py generate --dir /tmp/bench --users 50 --rows 20000 --completion 0.3
+#   python victory_bench.py run --dir /tmp/bench --out before.json
+#   python victory_bench.py compare before.json after.json
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOCATIONS = ["Hyderabad", "Bangalore", "Chennai", "Mumbai", "Delhi", "Pune", "Kolkata", "Vizag"]
+DESIGNATIONS = ["Manager", "Engineer", "Analyst", "Director", "Officer"]
+ORGS = ["Org A", "Org B", "Org C", "Org D"]
+
+# Regressions above this fraction are flagged by compare
+REGRESSION_THRESHOLD = 0.10
+
+
+# Function to generate one user's allocation with a share of completed (dated) rows
+def generate_user_rows(rng, rows, completion, start_serial=1):
+    completed = rng.random(rows) < completion
+    days_ago = rng.integers(0, 90, rows)
+    dates = pd.Series([str(date.today() - timedelta(days=int(d))) for d in days_ago])
+    return pd.DataFrame({
+        "Sl.no": np.arange(start_serial, start_serial + rows),
+        "Name": [f"Lead {i}" for i in range(start_serial, start_serial + rows)],
+        "Phone Number": rng.integers(6000000000, 9999999999, rows),
+        "Membershipnumber": [f"M{i:07d}" for i in rng.integers(0, 10 ** 7, rows)],
+        "Sex": rng.choice(["M", "F"], rows),
+        "Designation": rng.choice(DESIGNATIONS, rows),
+        "Org": rng.choice(ORGS, rows),
+        "Location": rng.choice(LOCATIONS, rows),
+        "S/T/SF": np.where(completed, rng.choice(["S", "T", "SF"], rows), None),
+        "Regards": np.where(completed, rng.choice(["High", "Medium", "Low", "None"], rows), None),
+        "New Location": None,
+        "Date": np.where(completed, dates, None),
+    })
+
+
+# Function to write a synthetic master_users.csv and user_data/ tree into directory
+def generate(directory, users, rows, completion, seed=7):
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(directory, "user_data"), exist_ok=True)
+    master = []
+    for i in range(1, users + 1):
+        email = f"caller{i}@example.com"
+        data = generate_user_rows(rng, rows, completion)
+        data.to_csv(os.path.join(directory, "user_data", f"{email}.csv"), index=False)
+        counts = data["S/T/SF"].value_counts()
+        master.append({"Sl.no": i, "User Number": f"user{i}", "Name": f"Caller {i}", "Username": f"caller{i}",
+                       "Email": email, "Password": f"pw{i}", "Assigned": rows, "Spoke": int(counts.get("S", 0)),
+                       "Tried": int(counts.get("T", 0)), "SF": int(counts.get("SF", 0))})
+    pd.DataFrame(master).to_csv(os.path.join(directory, "master_users.csv"), index=False)
+    with open(os.path.join(directory, "bench_scale.json"), "w") as f:
+        json.dump({"users": users, "rows": rows, "completion": completion, "seed": seed}, f)
+
+
+# Function to read this process's cumulative bytes written (from /proc; None where unavailable)
+def bytes_written():
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+# Function to read this process's peak resident set size in KiB
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+# Collects per-path latencies, bytes written and peak RSS
+class Recorder:
+    def __init__(self):
+        self.results = {}
+
+    # Function to time fn repeat times (after warmup untimed calls) and record the path's stats
+    def measure(self, name, fn, repeat=5, warmup=0, setup=None):
+        for _ in range(warmup):
+            if setup:
+                setup()
+            fn()
+        latencies = []
+        written_before = bytes_written()
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn()
+            latencies.append((time.perf_counter() - start) * 1000)
+        self.record(name, latencies, written_before)
+
+    # Function to store stats for latencies (ms) gathered by the caller
+    def record(self, name, latencies, written_before=None):
+        written_after = bytes_written()
+        latencies = np.array(latencies)
+        self.results[name] = {
+            "n": int(len(latencies)),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p90_ms": round(float(np.percentile(latencies, 90)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "max_ms": round(float(latencies.max()), 3),
+            "bytes_written": (written_after - written_before
+                              if written_before is not None and written_after is not None else None),
+            "peak_rss_kb": peak_rss_kb(),
+        }
+        print(f"{name:<32} p50 {self.results[name]['p50_ms']:>10.2f} ms  p90 {self.results[name]['p90_ms']:>10.2f} ms"
+              f"  written {self.results[name]['bytes_written']}")
+
+
+# Function to render one page of Victory.py headlessly; returns the AppTest after its run
+def render_page(session_state, sidebar_page=None):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(os.getcwd(), "Victory.py"), default_timeout=600)
+    for key, value in session_state.items():
+        at.session_state[key] = value
+    at.run()
+    if sidebar_page is not None:
+        next(radio for radio in at.sidebar.radio if radio.label == "Admin Pages").set_value(sidebar_page).run()
+    if at.exception:
+        raise RuntimeError(f"Page raised: {at.exception[0].message}")
+    return at
+
+
+# Function to copy a generated tree and the app's modules into a temp directory, so runs start from
+# the same files and never touch the generated tree
+def prepare_work_dir(directory):
+    work = tempfile.mkdtemp(prefix="victory_bench_")
+    shutil.copytree(directory, work, dirs_exist_ok=True)
+    for name in os.listdir(APP_DIR):
+        if name.endswith(".py"):
+            shutil.copy(os.path.join(APP_DIR, name), work)
+    return work
+
+
+# Function to run every benchmarked path against a copy of a generated tree; returns the results document
+def run(directory, repeat, threads):
+    with open(os.path.join(directory, "bench_scale.json")) as f:
+        scale = json.load(f)
+
+    work = prepare_work_dir(directory)
+    os.chdir(work)
+    sys.path.insert(0, work)
+
+    import victory_cache
+    import victory_ingest
+    import victory_reports
+    import victory_store
+    import victory_userdata
+
+    recorder = Recorder()
+    recorder.measure("store_init_migrate", lambda: victory_store.init_master_store("master_users.db", "master_users.csv"),
+                     repeat=1)
+    master = victory_store.load_master()
+    emails = master["Email"].tolist()
+    rng = random.Random(11)
+
+    recorder.measure("load_master_cold", victory_store.load_master, repeat=repeat,
+                     setup=victory_cache.frame_cache.clear)
+    recorder.measure("load_master_warm", victory_store.load_master, repeat=repeat, warmup=1)
+
+    # update_user_stats under contention: every thread increments random users concurrently
+    latencies = []
+    latencies_lock = threading.Lock()
+    written_before = bytes_written()
+
+    def increment_worker():
+        local = []
+        for _ in range(repeat * 10):
+            start = time.perf_counter()
+            victory_store.increment_stat(rng.choice(emails), rng.choice(["Spoke", "Tried", "SF"]), 1)
+            local.append((time.perf_counter() - start) * 1000)
+        with latencies_lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=increment_worker) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    recorder.record(f"update_user_stats_x{threads}", latencies, written_before)
+
+    email = emails[0]
+    recorder.measure("load_user_data_cold", lambda: victory_userdata.load_user_data(email), repeat=repeat,
+                     setup=victory_cache.frame_cache.clear)
+    data = victory_userdata.load_user_data(email)
+    # Memory of one user's frame as the app holds it, next to the same file read with inferred dtypes
+    untyped = pd.read_csv(victory_userdata.user_data_path(email))
+    memory = {"user_frame_bytes": int(data.memory_usage(index=True, deep=True).sum()),
+              "user_frame_inferred_bytes": int(untyped.memory_usage(index=True, deep=True).sum())}
+    print(f"user frame memory: {memory['user_frame_bytes']} bytes "
+          f"(inferred dtypes: {memory['user_frame_inferred_bytes']} bytes)")
+    recorder.measure("save_user_data_full", lambda: victory_userdata.save_user_data(email, data), repeat=repeat)
+    serials = data["Sl.no"].tolist()
+    recorder.measure("save_user_row", lambda: victory_userdata.save_user_row(
+        email, rng.choice(serials), {"S/T/SF": "S", "Regards": "High", "New Location": "",
+                                     "Date": str(date.today())}), repeat=repeat * 10)
+
+    victory_cache.frame_cache.clear()
+    for user_email in emails:
+        victory_userdata.load_user_data(user_email)
+    memory["frame_cache_all_users_bytes"] = victory_cache.cache_stats()["bytes"]
+    recorder.measure("dashboard_user_summaries", lambda: victory_userdata.load_user_summaries(emails),
+                     repeat=repeat, warmup=1)
+
+    victory_reports.rebuild_report_store(master[["Email", "Name"]].itertuples(index=False, name=None),
+                                         victory_userdata.load_user_data)
+    end = date.today()
+    recorder.measure("reports_query_30_days", lambda: victory_reports.query_reports(end - timedelta(days=29), end),
+                     repeat=repeat)
+
+    # Reallocation: move a block of rows back and forth between two users
+    block = max(1, scale["rows"] // 100)
+    state = {"from": emails[1], "to": emails[2], "start": 1}
+
+    def reallocate():
+        moved, _ = victory_userdata.reallocate_range(state["from"], state["to"], state["start"],
+                                                     state["start"] + block - 1)
+        state["start"] = int(moved["Sl.no"].min())
+        state["from"], state["to"] = state["to"], state["from"]
+
+    recorder.measure(f"reallocate_{block}_rows", reallocate, repeat=repeat)
+
+    # Duplicate check of an upload against the lead index: half the rows are already allocated
+    recorder.measure("lead_index_backfill", lambda: victory_userdata.rebuild_lead_index(emails), repeat=1)
+    upload_rows = min(1000, scale["rows"])
+    known = victory_userdata.load_user_data(emails[0]).head(upload_rows // 2)
+    fresh = known.assign(**{"Membershipnumber": [f"NEW{i}" for i in range(len(known))],
+                            "Phone Number": [f"7{i:09d}" for i in range(len(known))]})
+    upload = io.BytesIO(pd.concat([known, fresh]).reindex(columns=victory_ingest.STAGED_COLUMNS)
+                        .to_csv(index=False).encode("utf-8"))
+    upload.name = "bench_upload.csv"
+    staged = victory_ingest.stage_upload(upload)
+    recorder.measure(f"dedup_check_{staged['rows']}_rows", lambda: victory_ingest.find_duplicates(staged), repeat=1)
+    recorder.measure(f"dedup_rerun_{staged['rows']}_rows", lambda: victory_ingest.find_duplicates(staged),
+                     repeat=repeat)
+
+    # Page renders, including the user's allocation table and the admin pages
+    user = master.iloc[0]
+    recorder.measure("render_user_page", lambda: render_page({"logged_in": True, "username": user["Username"]}),
+                     repeat=repeat, warmup=1)
+    admin = {"logged_in": True, "username": "admin"}
+    recorder.measure("render_admin_dashboard", lambda: render_page(admin), repeat=repeat, warmup=1)
+    recorder.measure("render_admin_reports", lambda: render_page(admin, "Reports"), repeat=repeat, warmup=1)
+
+    os.chdir(APP_DIR)
+    shutil.rmtree(work, ignore_errors=True)
+    return {"meta": {"commit": git_commit(), "scale": scale, "repeat": repeat, "threads": threads,
+                     "python": sys.version.split()[0], "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "paths": recorder.results, "memory": memory}
+
+
+# Run in a fresh interpreter: times the first render of a page from process start, then its reruns
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_ready = time.perf_counter()
+at = AppTest.from_file("Victory.py", default_timeout=600)
+for key, value in json.loads(sys.argv[1]).items():
+    at.session_state[key] = value
+at.run()
+first = time.perf_counter()
+if at.exception:
+    raise SystemExit(at.exception[0].message)
+reruns = []
+for _ in range(int(sys.argv[2])):
+    rerun_start = time.perf_counter()
+    at.run()
+    reruns.append((time.perf_counter() - rerun_start) * 1000)
+print(json.dumps({"streamlit_import_ms": (streamlit_ready - start) * 1000, "first_render_ms": (first - start) * 1000,
+                  "reruns_ms": reruns, "modules": sorted(sys.modules)}))
+"""
+
+# Modules whose presence after a render shows a page paid for a heavy import
+HEAVY_MODULES = ["plotly", "st_aggrid", "smtplib", "email.mime", "matplotlib", "xlsxwriter", "http.server"]
+
+# Pages timed by the startup benchmark: name -> session state set before the first render
+STARTUP_PAGES = {
+    "login": {},
+    "user_page": {"logged_in": True, "username": "caller1"},
+    "admin_dashboard": {"logged_in": True, "username": "admin"},
+}
+
+
+# Function to time cold first renders and reruns of the login, user and admin pages, each in new processes
+def startup(directory, samples, reruns):
+    work = prepare_work_dir(directory)
+    results = {}
+    for page, session_state in STARTUP_PAGES.items():
+        first, app_first, rerun_ms, heavy = [], [], [], set()
+        for _ in range(samples):
+            output = subprocess.run([sys.executable, "-c", STARTUP_PROBE, json.dumps(session_state), str(reruns)],
+                                    cwd=work, capture_output=True, text=True, check=True).stdout
+            probe = json.loads(output.strip().splitlines()[-1])
+            first.append(probe["first_render_ms"])
+            app_first.append(probe["first_render_ms"] - probe["streamlit_import_ms"])
+            rerun_ms += probe["reruns_ms"]
+            heavy |= {name for name in HEAVY_MODULES if name in probe["modules"]}
+        results[page] = {"first_render_ms": round(float(np.median(first)), 1),
+                         "first_render_app_ms": round(float(np.median(app_first)), 1),
+                         "rerun_p50_ms": round(float(np.percentile(rerun_ms, 50)), 2),
+                         "rerun_p90_ms": round(float(np.percentile(rerun_ms, 90)), 2),
+                         "heavy_modules": sorted(heavy)}
+        print(f"{page:<16} first render {results[page]['first_render_ms']:>8.1f} ms "
+              f"(app {results[page]['first_render_app_ms']:>7.1f} ms)  rerun p50 {results[page]['rerun_p50_ms']:>7.2f} ms"
+              f"  heavy: {', '.join(results[page]['heavy_modules']) or '-'}")
+    shutil.rmtree(work, ignore_errors=True)
+    return {"meta": {"commit": git_commit(), "samples": samples, "reruns": reruns, "python": sys.version.split()[0],
+                     "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "startup": results}
+
+
+# Function to read the commit the benchmarked code came from (None outside a git checkout)
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to print per-path changes between two result files, flagging regressions
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'path':<32} {'p50 before':>12} {'p50 after':>12} {'change':>9}  {'bytes before':>14} {'bytes after':>14}")
+    regressions = 0
+    for name, new in after["paths"].items():
+        old = before["paths"].get(name)
+        if old is None:
+            print(f"{name:<32} {'-':>12} {new['p50_ms']:>12.2f}")
+            continue
+        change = (new["p50_ms"] - old["p50_ms"]) / old["p50_ms"] if old["p50_ms"] else 0.0
+        flag = "  REGRESSION" if change > REGRESSION_THRESHOLD else ""
+        regressions += bool(flag)
+        print(f"{name:<32} {old['p50_ms']:>12.2f} {new['p50_ms']:>12.2f} {change:>+9.1%}  "
+              f"{str(old['bytes_written']):>14} {str(new['bytes_written']):>14}{flag}")
+    for name, new in after.get("memory", {}).items():
+        print(f"{name:<32} {str(before.get('memory', {}).get(name)):>12} {new:>12}  bytes")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Victory's hot paths on synthetic data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="write a synthetic data tree")
+    generate_parser.add_argument("--dir", required=True)
+    generate_parser.add_argument("--users", type=int, default=20)
+    generate_parser.add_argument("--rows", type=int, default=5000, help="rows per user")
+    generate_parser.add_argument("--completion", type=float, default=0.3, help="share of completed rows")
+    generate_parser.add_argument("--seed", type=int, default=7)
+
+    run_parser = commands.add_parser("run", help="benchmark a generated tree")
+    run_parser.add_argument("--dir", required=True)
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--threads", type=int, default=8)
+    run_parser.add_argument("--out", help="write results JSON here")
+
+    startup_parser = commands.add_parser("startup", help="time cold first renders and reruns of the pages")
+    startup_parser.add_argument("--dir", required=True)
+    startup_parser.add_argument("--samples", type=int, default=3, help="fresh processes per page")
+    startup_parser.add_argument("--reruns", type=int, default=10)
+    startup_parser.add_argument("--out", help="write results JSON here")
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate(args.dir, args.users, args.rows, args.completion, args.seed)
+        print(f"Generated {args.users} users x {args.rows} rows in {args.dir}")
+    elif args.command in ("run", "startup"):
+        if args.command == "run":
+            results = run(os.path.abspath(args.dir), args.repeat, args.threads)
+        else:
+            results = startup(os.path.abspath(args.dir), args.samples, args.reruns)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(results, f, indent=2)
+    else:
+        sys.exit(1 if compare(args.before, args.after) else 0)
@@ -0,0 +1,197 @@
+# Process-wide caches shared by every Streamlit session in this server: loaded DataFrames, and values derived
+# from them (display frames, grid options, exports) memoized by the data version they were computed from
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Upper bound on the memory held by cached frames
+MAX_CACHE_BYTES = int(os.environ.get("VICTORY_CACHE_MB", "256")) * 1024 * 1024
+
+# Derived values kept, and seconds one is served before it is recomputed even if its version has not moved
+# (catches changes made behind the store's back, such as user files edited by hand)
+MAX_MEMO_ENTRIES = int(os.environ.get("VICTORY_MEMO_ENTRIES", "64"))
+MEMO_TTL_SECONDS = float(os.environ.get("VICTORY_MEMO_TTL", "300"))
+
+
+# LRU cache of DataFrames keyed by source, validated by a signature of the source
+# (file mtime/size or a store version). Every caller receives the same frame, which must be treated as read-only:
+# callers that change it take their own copy first, and patches replace the cached frame instead of editing it
+class FrameCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Function to return the cached frame for key, loading it if missing or stale
+    def get(self, key, signature, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        frame = loader()
+        self.put(key, signature, frame)
+        return frame
+
+    # Function to store a frame (write-through from the save functions)
+    def put(self, key, signature, frame):
+        nbytes = int(frame.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            self._discard(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (signature, frame, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    # Function to apply a change to a copy of a cached frame whose source moved from one signature to the next,
+    # leaving the frame earlier callers hold untouched
+    def patch(self, key, old_signature, new_signature, update):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if entry[0] != old_signature:
+                self._discard(key)
+                return
+            frame = update(entry[1].copy())
+        self.put(key, new_signature, frame)
+
+    # Function to drop one key
+    def invalidate(self, key):
+        with self._lock:
+            self._discard(key)
+
+    # Function to drop every cached frame
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    # Function to remove an entry and its byte count (caller holds the lock)
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    # Function to report hit/miss counters and memory use
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# LRU memo of derived values keyed by name and arguments, valid while the data version they were computed from
+# is current and for at most ttl seconds. Sessions missing the same key together wait for one computation, and
+# callers receive their own copy. Entries also name the sources they derive from ("master", "summaries") so
+# write paths can drop them at once
+class MemoCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._computing = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Function to return the memoized value for key at version, computing it if missing, stale or expired
+    def get(self, key, version, compute, sources=()):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == version:
+                    if time.monotonic() - entry[1] <= self.ttl:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return copy.deepcopy(entry[2])
+                    self.expirations += 1
+                waiting = self._computing.get(key)
+                if waiting is None:
+                    done = self._computing[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another session is computing this key: use its result rather than computing it again
+            waiting.wait()
+        try:
+            value = compute()
+            self.put(key, version, value, sources)
+            return copy.deepcopy(value)
+        finally:
+            with self._lock:
+                del self._computing[key]
+            done.set()
+
+    # Function to store a value computed at version
+    def put(self, key, version, value, sources=()):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (version, time.monotonic(), value, frozenset(sources))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Function to drop every value derived from any of the given sources (every value when none are given)
+    def invalidate(self, *sources):
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if not sources or entry[3] & set(sources)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    # Function to report hit/miss counters and entry count
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+frame_cache = FrameCache(MAX_CACHE_BYTES)
+memo_cache = MemoCache(MAX_MEMO_ENTRIES, MEMO_TTL_SECONDS)
+
+
+# Function to report the shared frame cache's counters
+def cache_stats():
+    return frame_cache.stats()
+
+
+# Function to report the shared memo's counters
+def memo_stats():
+    return memo_cache.stats()
+
+
+# Function to drop the memoized values derived from the given sources; called by the write paths
+def invalidate_derived(*sources):
+    memo_cache.invalidate(*sources)
@@ -0,0 +1,88 @@
+# Dashboard charts: plotly figures built from vectorized aggregates and memoized per stats version
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.express as px
+
+# Users shown by name in the per-user charts; the rest are folded into one "Others" bar
+TOP_N_DEFAULT = 20
+
+# Figure sets kept in memory; older ones are dropped so long-lived servers do not accumulate them
+MAX_CACHED_FIGURE_SETS = 8
+
+ACTION_COLUMNS = ['Spoke', 'Tried', 'SF']
+ACTION_COLORS = {'Spoke': '#66b3ff', 'Tried': '#99ff99', 'SF': '#ffcc99'}
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+
+# Function to keep the n users with the most of sort_column and sum everyone else into an "Others" row
+def top_n_users(stats, sort_column, n):
+    if len(stats) <= n:
+        return stats.sort_values(sort_column, ascending=False)
+    ranked = stats.sort_values(sort_column, ascending=False)
+    top, rest = ranked.iloc[:n], ranked.iloc[n:]
+    others = rest[['Assigned'] + ACTION_COLUMNS].sum().to_frame().T
+    others['Name'] = f"Others ({len(rest)} users)"
+    return pd.concat([top, others], ignore_index=True)
+
+
+# Function to compute per-user action totals and completion percentages in one vectorized pass
+def user_stats(master_df):
+    stats = master_df[['Name', 'Assigned'] + ACTION_COLUMNS].copy()
+    stats['Actions'] = stats[ACTION_COLUMNS].sum(axis=1)
+    return stats
+
+
+# Function to compute completion (%) for rows of user stats
+def completion_percent(stats):
+    done = stats[ACTION_COLUMNS].sum(axis=1)
+    return (done / stats['Assigned'].where(stats['Assigned'] > 0)).mul(100).fillna(0).round(2)
+
+
+# Function to build the dashboard's three figures
+def build_figures(master_df, top_n=TOP_N_DEFAULT):
+    stats = user_stats(master_df)
+
+    by_actions = top_n_users(stats, 'Actions', top_n)
+    long_df = by_actions.melt(id_vars='Name', value_vars=ACTION_COLUMNS, var_name='Action', value_name='Count')
+    performance = px.bar(long_df, x='Name', y='Count', color='Action', barmode='stack',
+                         color_discrete_map=ACTION_COLORS, title="Spoke, Tried, and SF by User",
+                         labels={'Name': 'User'})
+
+    totals = stats[ACTION_COLUMNS].sum()
+    distribution = px.pie(names=totals.index, values=totals.values, color=totals.index,
+                          color_discrete_map=ACTION_COLORS, title="Distribution of Actions")
+
+    by_assigned = top_n_users(stats, 'Assigned', top_n)
+    by_assigned['Completion (%)'] = completion_percent(by_assigned)
+    completion = px.bar(by_assigned.sort_values('Completion (%)', ascending=False), x='Name', y='Completion (%)',
+                        title='User Completion Percentage', labels={'Completion (%)': 'Completion (%)'})
+
+    return {"performance": performance, "distribution": distribution, "completion": completion}
+
+
+# Function to get the dashboard figures for a stats version, building them only when the stats changed
+def dashboard_figures(master_df, version, top_n=TOP_N_DEFAULT):
+    key = (version, top_n)
+    with _figures_lock:
+        figures = _figures.get(key)
+        if figures is not None:
+            _figures.move_to_end(key)
+            return figures
+    figures = build_figures(master_df, top_n)
+    with _figures_lock:
+        _figures[key] = figures
+        while len(_figures) > MAX_CACHED_FIGURE_SETS:
+            _figures.popitem(last=False)
+    return figures
+
+
+# Function to chart calls per period from activity rollups (first calls and re-edits stacked)
+def activity_figure(trend_df, title="Calls over Time"):
+    long_df = trend_df.melt(id_vars='Period', value_vars=['First Calls', 'Re-edits'], var_name='Kind',
+                            value_name='Count')
+    return px.bar(long_df, x='Period', y='Count', color='Kind', barmode='stack', title=title,
+                  labels={'Count': 'Calls'})
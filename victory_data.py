@@ -0,0 +1,92 @@
+# Storage entry points shared by the pages: thin wrappers over the storage modules, plus the
+# once-per-process startup (store migration, reallocation recovery, metrics exporters)
+import threading
+
+import victory_storage
+
+# With VICTORY_STORAGE_URL set, storage calls go to the shared storage daemon; this has to happen
+# before the storage modules are imported below
+victory_storage.install()
+
+import victory_auth
+import victory_metrics
+import victory_store
+import victory_userdata
+
+# Path for the master CSV file (kept as the import/export format)
+MASTER_CSV = "master_users.csv"
+# Path for the SQLite store that holds the master data
+MASTER_DB = "master_users.db"
+
+# S/T/SF status -> master column it counts towards
+STATUS_COLUMNS = {"S": "Spoke", "T": "Tried", "SF": "SF"}
+
+_started = False
+_start_lock = threading.Lock()
+
+
+# Function to open the master store (migrating the master CSV into it on first run), finish interrupted
+# reallocations and start the metrics exporters; does the work once per process, not on every rerun
+def startup():
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        victory_store.init_master_store(MASTER_DB, MASTER_CSV)
+        victory_userdata.recover_reallocations()
+        victory_metrics.start_exporters()
+        _started = True
+
+
+# Function to load master data
+@victory_metrics.timed()
+def load_master_csv():
+    return victory_store.load_master()
+
+
+# Function to replace the master data
+@victory_metrics.timed()
+def update_master_csv(master_df):
+    victory_store.replace_master(master_df)
+
+
+# Function to export the master data back to the master CSV
+def export_master_csv(csv_path=MASTER_CSV):
+    victory_store.export_master_csv(csv_path)
+
+
+# Function to load user data from individual CSV (with pending row edits merged in)
+@victory_metrics.timed()
+def load_user_data(email):
+    return victory_userdata.load_user_data(email)
+
+
+# Function to save user data to their individual CSV
+@victory_metrics.timed()
+def save_user_data(email, data):
+    victory_userdata.save_user_data(email, data)
+
+
+# Function to save the edited fields of a single row of a user's data
+@victory_metrics.timed()
+def save_user_row(email, serial_no, values, was_completed=False):
+    victory_userdata.save_user_row(email, serial_no, values, was_completed)
+
+# Function to update user password
+@victory_metrics.timed()
+def update_user_password(username, new_password):
+    return victory_auth.set_password(username, new_password)
+
+
+# Function to update user statistics in the master store
+@victory_metrics.timed()
+def update_user_stats(username, spoke_status):
+    column = STATUS_COLUMNS.get(spoke_status)
+    if column:
+        victory_store.increment_stat(username, column, 1)
+
+
+# Function to update assigned count in the master store
+@victory_metrics.timed()
+def update_assigned_count(username, num_rows_assigned):
+    victory_store.increment_stat(username, "Assigned", num_rows_assigned)
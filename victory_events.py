@@ -0,0 +1,51 @@
+# Live dashboard aggregates that catch up from the store's change feed (which every server process writes to)
+# by applying deltas
+import pandas as pd
+
+import victory_charts
+import victory_store
+
+ACTION_COLUMNS = victory_charts.ACTION_COLUMNS
+
+
+# Per-user stats and totals kept current by applying change feed deltas instead of reloading the users table
+class LiveStats:
+    def __init__(self, master_df, seq):
+        self.seq = seq
+        self.stats = master_df.groupby("Email", sort=False).agg(
+            {"Name": "first", "Assigned": "first", "Spoke": "first", "Tried": "first", "SF": "first"})
+        self.stats["Completion (%)"] = victory_charts.completion_percent(self.stats)
+        self.totals = self.stats[["Assigned"] + ACTION_COLUMNS].sum()
+
+    # Function to build live stats from the users table, positioned at the current end of the feed
+    @classmethod
+    def load(cls):
+        master_df, seq = victory_store.load_master_at_feed_position()
+        return cls(master_df, seq)
+
+    # Function to apply the feed entries written since the last refresh; returns the emails whose stats
+    # changed, or None when the stats had to be reloaded (a reset, or the feed was pruned past our position)
+    def refresh(self):
+        rows, oldest = victory_store.read_feed(self.seq)
+        if not rows:
+            return set()
+        feed = pd.DataFrame(rows, columns=["seq", "email", "stat", "delta"])
+        if oldest > self.seq + 1 or (feed["stat"] == victory_store.FEED_RESET).any():
+            fresh = LiveStats.load()
+            self.seq, self.stats, self.totals = fresh.seq, fresh.stats, fresh.totals
+            return None
+        self.seq = int(feed["seq"].max())
+
+        deltas = feed.pivot_table(index="email", columns="stat", values="delta", aggfunc="sum", fill_value=0)
+        deltas = deltas.reindex(columns=["Assigned"] + ACTION_COLUMNS, fill_value=0)
+        deltas = deltas[deltas.index.isin(self.stats.index)]
+        changed = deltas.index
+        self.stats.loc[changed, deltas.columns] += deltas
+        self.stats.loc[changed, "Completion (%)"] = victory_charts.completion_percent(self.stats.loc[changed])
+        self.totals = self.totals + deltas.sum()
+        return set(changed)
+
+    # Function to compute the overall completion percentage from the running totals
+    def overall_completion(self):
+        assigned = self.totals["Assigned"]
+        return round(self.totals[ACTION_COLUMNS].sum() / assigned * 100, 2) if assigned > 0 else 0
@@ -0,0 +1,94 @@
+# Streaming report export: rows are written chunk by chunk to a file instead of an in-memory workbook
+import glob
+import gzip
+import os
+import tempfile
+import time
+
+import victory_reports
+
+# Label shown to the admin -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "Excel (.xlsx)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Compressed CSV (.csv.gz)": ("csv.gz", "application/gzip"),
+}
+
+# Name prefix of export files in the temp directory
+EXPORT_PREFIX = "victory_report_"
+
+# Exports older than this are removed when the next export is made (a session that ended never discards its own)
+EXPORT_MAX_AGE_SECONDS = 60 * 60
+
+
+# Function to turn a chunk into plain Python rows (NA -> None) for the xlsx writer
+def _chunk_rows(chunk):
+    return chunk.astype(object).where(chunk.notna(), None).values.tolist()
+
+
+# Function to write chunks into an xlsx file using xlsxwriter's constant-memory mode
+def write_xlsx(chunks, path, columns, sheet_name="Report"):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, columns)
+    row_number = 1
+    for chunk in chunks:
+        for row in _chunk_rows(chunk[columns]):
+            worksheet.write_row(row_number, 0, row)
+            row_number += 1
+    workbook.close()
+    return row_number - 1
+
+
+# Function to write chunks into a gzip-compressed CSV file
+def write_csv_gz(chunks, path, columns):
+    rows = 0
+    with gzip.open(path, "wt", newline="", encoding="utf-8") as f:
+        f.write(",".join(columns) + "\n")
+        for chunk in chunks:
+            chunk[columns].to_csv(f, header=False, index=False)
+            rows += len(chunk)
+    return rows
+
+
+# Function to remove export files past their age limit
+def _prune_exports():
+    cutoff = time.time() - EXPORT_MAX_AGE_SECONDS
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), f"{EXPORT_PREFIX}*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+
+
+# Function to export the report for a date range to a temporary file; returns its path and row count
+def export_report(start_date, end_date, extension):
+    _prune_exports()
+    columns = victory_reports.REPORT_COLUMNS
+    chunks = victory_reports.iter_report_chunks(start_date, end_date, columns)
+    fd, path = tempfile.mkstemp(prefix=EXPORT_PREFIX, suffix=f".{extension}")
+    os.close(fd)
+    if extension == "xlsx":
+        rows = write_xlsx(chunks, path, columns)
+    else:
+        rows = write_csv_gz(chunks, path, columns)
+    return path, rows
+
+
+# Function to check that a path names a report export (a file export_report created in the temp directory)
+def is_export_path(path):
+    real = os.path.realpath(path)
+    return (os.path.dirname(real) == os.path.realpath(tempfile.gettempdir())
+            and os.path.basename(real).startswith(EXPORT_PREFIX))
+
+
+# Function to delete an export file that is no longer offered for download
+def discard_export(path):
+    if not path:
+        return
+    if not is_export_path(path):
+        raise ValueError(f"Not a report export: {path}")
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,150 @@
+# Storage-write layer shared by every module that writes files: cross-process advisory locks,
+# atomic temp-file + fsync + os.replace writes, and group commit for small concurrent updates
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX: fall back to in-process locking only
+    fcntl = None
+
+import victory_metrics
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+# Re-entrant lock on <path>.lock that also excludes other processes (flock) while held
+class FileLock:
+    def __init__(self, path):
+        self.lock_path = path + ".lock"
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                directory = os.path.dirname(self.lock_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                self._fd = fd
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+        return False
+
+
+# Function to get the lock guarding writes to a file (one FileLock per path in this process)
+def file_lock(path):
+    key = os.path.abspath(path)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = FileLock(path)
+        return lock
+
+
+# Function to take an exclusive flock on an open file without waiting; returns False while another open file
+# (in this or another process) holds it. Always succeeds where flock is unavailable
+def try_flock(fd):
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+# Function to fsync a directory so a rename in it survives a crash
+def _fsync_dir(directory):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Context manager yielding a temp file next to path; on success it is fsynced and renamed over path,
+# so readers only ever see the old or the new file
+@contextmanager
+def atomic_write(path, mode="w", **open_kwargs):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **open_kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+            victory_metrics.count("bytes_written", os.fstat(f.fileno()).st_size)
+        os.replace(tmp_path, path)
+        _fsync_dir(directory)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Function to write a DataFrame to a CSV file atomically under the file's lock
+def write_csv(df, path, **to_csv_kwargs):
+    with file_lock(path):
+        with atomic_write(path, "w", newline="", encoding="utf-8") as f:
+            df.to_csv(f, **to_csv_kwargs)
+
+
+# Batches concurrent small writes: callers queue an item and wait, and whichever caller gets to commit
+# next applies every item queued so far in one call to commit(items), which returns one result per item
+class GroupCommitter:
+    def __init__(self, commit):
+        self.commit = commit
+        self._queue_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._queued = []
+        self.batches = 0
+        self.items = 0
+
+    # Function to queue one item and return its result once a batch containing it has committed
+    def submit(self, item):
+        done = threading.Event()
+        outcome = []
+        with self._queue_lock:
+            self._queued.append((item, done, outcome))
+        with self._commit_lock:
+            if not done.is_set():
+                with self._queue_lock:
+                    batch, self._queued = self._queued, []
+                try:
+                    results = self.commit([queued[0] for queued in batch])
+                    error = None
+                except Exception as e:
+                    results = [None] * len(batch)
+                    error = e
+                self.batches += 1
+                self.items += len(batch)
+                for (_, batch_done, batch_outcome), result in zip(batch, results):
+                    batch_outcome.extend([error, result])
+                    batch_done.set()
+        if outcome[0] is not None:
+            raise outcome[0]
+        return outcome[1]
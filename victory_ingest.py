@@ -0,0 +1,397 @@
+# Upload ingestion for admin_allocate: parse once in chunks, validate, stage to disk, then append
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import victory_fileio
+import victory_reports
+import victory_schema
+import victory_store
+import victory_userdata
+
+# Directory holding staged uploads: staging/<sha256>.csv plus staging/<sha256>.json
+STAGING_DIR = "staging"
+
+# Rows parsed, written and appended per chunk
+CHUNK_ROWS = 50000
+
+# Staged uploads older than this are removed
+STAGING_MAX_AGE_SECONDS = 24 * 60 * 60
+
+# Columns an allocation file is written with; the call-entry columns may be absent from an upload
+STAGED_COLUMNS = victory_userdata.USER_DATA_COLUMNS + ['Date']
+ENTRY_COLUMNS = ['S/T/SF', 'Regards', 'New Location', 'Date']
+REQUIRED_COLUMNS = [col for col in STAGED_COLUMNS if col not in ENTRY_COLUMNS]
+
+# Ways a bulk upload can be split across users
+SPLIT_STRATEGIES = ["Round-robin", "Weighted by pending load", "By Location"]
+
+# Parallel writers used when appending bulk shards
+MAX_SHARD_WRITERS = 8
+
+# What to do with uploaded rows whose Membershipnumber or Phone Number is already allocated
+DEDUP_SKIP = "Skip duplicates"
+DEDUP_MERGE = "Merge into existing"
+DEDUP_REPORT = "Report only"
+DEDUP_MODES = [DEDUP_SKIP, DEDUP_MERGE, DEDUP_REPORT]
+
+# Columns a merged duplicate may update on the row it matched (never the call entries or the lead keys)
+MERGE_COLUMNS = ['Name', 'Sex', 'Designation', 'Org', 'Location']
+
+DUPLICATE_COLUMNS = ["Row", "Matched On", "Value", "Allocated To", "Sl.no", "Earlier Row"]
+
+
+# Function to hash an uploaded file without loading it all at once
+def upload_digest(uploaded_file):
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for block in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+# Function to read an uploaded CSV or Excel file as chunks of string columns
+def iter_upload_chunks(uploaded_file, file_name):
+    uploaded_file.seek(0)
+    if file_name.endswith(".csv"):
+        try:
+            yield from pd.read_csv(uploaded_file, dtype=str, chunksize=CHUNK_ROWS)
+        except pd.errors.EmptyDataError:
+            return
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = [str(col) for col in next(rows, ())]
+    batch = []
+    chunks = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == CHUNK_ROWS:
+            yield pd.DataFrame(batch, columns=header).astype("string").astype(object)
+            chunks += 1
+            batch = []
+    # A header-only sheet still yields its (empty) header chunk so the columns get validated
+    if batch or (header and not chunks):
+        yield pd.DataFrame(batch, columns=header).astype("string").astype(object)
+    workbook.close()
+
+
+# Function to get the staged CSV and metadata paths for an upload hash
+def staged_paths(digest):
+    return os.path.join(STAGING_DIR, f"{digest}.csv"), os.path.join(STAGING_DIR, f"{digest}.json")
+
+
+# Function to remove staged uploads past their age limit
+def _prune_staging():
+    if not os.path.exists(STAGING_DIR):
+        return
+    cutoff = time.time() - STAGING_MAX_AGE_SECONDS
+    for name in os.listdir(STAGING_DIR):
+        path = os.path.join(STAGING_DIR, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+
+# Function to parse, validate and stage an upload once; later calls with the same file reuse the staged copy
+def stage_upload(uploaded_file):
+    digest = upload_digest(uploaded_file)
+    csv_path, meta_path = staged_paths(digest)
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["errors"] or os.path.exists(csv_path):
+            return meta
+
+    _prune_staging()
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    meta = {"digest": digest, "file_name": uploaded_file.name, "path": csv_path, "rows": 0, "preview": [],
+            "errors": [], "warnings": [], "filled_columns": []}
+    filled = set()
+    header_read = False
+    with victory_fileio.atomic_write(csv_path, "w", newline="", encoding="utf-8") as out:
+        for number, chunk in enumerate(iter_upload_chunks(uploaded_file, uploaded_file.name)):
+            if number == 0:
+                header_read = True
+                missing = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+                extra = [col for col in chunk.columns if col not in STAGED_COLUMNS]
+                if missing:
+                    meta["errors"].append(f"Upload is missing required columns: {', '.join(missing)}")
+                    break
+                if extra:
+                    meta["warnings"].append(f"Ignoring columns not used in allocations: {', '.join(map(str, extra))}")
+                meta["preview"] = chunk.head().where(chunk.head().notna(), None).to_dict("records")
+            chunk = chunk.reindex(columns=STAGED_COLUMNS)
+            filled.update(col for col in STAGED_COLUMNS if chunk[col].notna().any())
+            chunk.to_csv(out, header=(number == 0), index=False)
+            meta["rows"] += len(chunk)
+
+    if not header_read:
+        meta["errors"].append("Upload is empty: it has no header row")
+    elif not meta["errors"] and not meta["rows"]:
+        meta["warnings"].append("Upload has a header row but no data rows")
+
+    if meta["errors"]:
+        os.remove(csv_path)
+    meta["filled_columns"] = [col for col in STAGED_COLUMNS if col in filled]
+    with victory_fileio.atomic_write(meta_path) as f:
+        json.dump(meta, f)
+    return meta
+
+
+# Function to read a staged upload back in chunks
+def iter_staged_chunks(meta):
+    return pd.read_csv(meta["path"], dtype=str, chunksize=CHUNK_ROWS)
+
+
+# Function to append chunks to a user's allocation without loading their existing rows
+def _append_chunks(email, user_name, read_chunks, filled_columns):
+    header = victory_userdata.read_header(email)
+    needed = [col for col in filled_columns if header is not None and col not in header]
+    if needed:
+        # The user's file predates some uploaded columns: rewrite it once with the full column set
+        existing = victory_userdata.load_user_data(email)
+        staged = victory_schema.apply_schema(pd.concat(list(read_chunks()), ignore_index=True))
+        victory_userdata.save_user_data(email, pd.concat([existing, staged], ignore_index=True))
+    else:
+        victory_userdata.append_user_rows(email, read_chunks())
+
+    # Uploaded rows that already carry a Date belong in the report store
+    if "Date" in filled_columns:
+        for chunk in read_chunks():
+            dated = chunk[pd.to_datetime(chunk["Date"], errors="coerce").notna()].copy()
+            if dated.empty:
+                continue
+            dated["Date"] = pd.to_datetime(dated["Date"]).dt.strftime("%Y-%m-%d")
+            dated["User"] = user_name
+            for date, rows in dated.groupby("Date"):
+                victory_reports.upsert_report_rows(email, date, rows)
+
+
+# Function to append a staged upload to a user's allocation without loading their existing rows;
+# returns the number of rows allocated
+def allocate_staged(email, user_name, meta):
+    _append_chunks(email, user_name, lambda: iter_staged_chunks(meta), meta["filled_columns"])
+    return meta["rows"]
+
+
+# Function to scan a staged upload for rows whose Membershipnumber or Phone Number is already allocated
+# (to any user) or repeats an earlier row of the upload. Rows are 1-based upload row numbers; the lead index
+# is queried only for the upload's keys, so the cost scales with the upload rather than the allocated data
+def _scan_duplicates(meta):
+    prefixes = {prefix: column for column, prefix in victory_userdata.LEAD_KEY_COLUMNS.items()}
+    records = []
+    first_rows = {}
+    offset = 0
+    for chunk in iter_staged_chunks(meta):
+        keys = victory_userdata.lead_keys(chunk, positions=np.arange(offset + 1, offset + len(chunk) + 1))
+        offset += len(chunk)
+        holders = {}
+        for key, email, sl_no in victory_store.find_lead_keys([key for key, _ in keys]):
+            holders.setdefault(key, []).append((email, sl_no))
+        for key, row in keys:
+            prefix, value = key.split(":", 1)
+            for email, sl_no in holders.get(key, []):
+                records.append((row, prefixes[prefix], value, email, sl_no, None))
+            first = first_rows.setdefault(key, row)
+            if first != row:
+                records.append((row, prefixes[prefix], value, None, None, first))
+    duplicates = pd.DataFrame(records, columns=DUPLICATE_COLUMNS)
+    duplicates = duplicates.astype({"Sl.no": "Int64", "Earlier Row": "Int64"}).sort_values("Row", kind="stable")
+    return duplicates.reset_index(drop=True)
+
+
+# Function to get the path a staged upload's duplicate report is cached at for one lead index version
+def duplicates_path(digest, lead_version):
+    return os.path.join(STAGING_DIR, f"{digest}.duplicates-{lead_version}.parquet")
+
+
+# Function to find the duplicate rows of a staged upload (see _scan_duplicates). The report is cached next to
+# the staged file under the lead index version it was checked against, so reruns read it back until an
+# allocation, reallocation or rebuild changes the index
+def find_duplicates(meta):
+    lead_version = victory_store.lead_index_version()
+    path = duplicates_path(meta["digest"], lead_version)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+
+    duplicates = _scan_duplicates(meta)
+    for stale in glob.glob(duplicates_path(meta["digest"], "*")):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(stale)
+    with victory_fileio.atomic_write(path, "wb") as f:
+        duplicates.to_parquet(f, index=False)
+    return duplicates
+
+
+# Function to get the staged upload without the duplicate rows; the filtered copy is staged next to
+# the upload under a name derived from the dropped rows, so reruns reuse it
+def without_duplicates(meta, duplicates):
+    dropped = np.unique(duplicates["Row"].to_numpy(dtype=np.int64))
+    if not len(dropped):
+        return meta
+    tag = hashlib.sha256(dropped.tobytes()).hexdigest()[:16]
+    digest = f"{meta['digest']}-{tag}"
+    csv_path, _ = staged_paths(digest)
+    filtered = dict(meta, digest=digest, path=csv_path, rows=meta["rows"] - len(dropped))
+    if os.path.exists(csv_path):
+        return filtered
+
+    offset = 0
+    with victory_fileio.atomic_write(csv_path, "w", newline="", encoding="utf-8") as out:
+        for number, chunk in enumerate(iter_staged_chunks(meta)):
+            rows = np.arange(offset + 1, offset + len(chunk) + 1)
+            offset += len(chunk)
+            chunk[~np.isin(rows, dropped)].to_csv(out, header=(number == 0), index=False)
+    return filtered
+
+
+# Function to copy the details of duplicate upload rows onto the allocated rows they matched, filling only
+# the MERGE_COLUMNS the upload has values for; returns the number of allocated rows updated
+def merge_duplicates(meta, duplicates):
+    matched = duplicates.dropna(subset=["Allocated To"])
+    if matched.empty:
+        return 0
+    wanted = set(matched["Row"])
+    details = {}
+    offset = 0
+    for chunk in iter_staged_chunks(meta):
+        chunk.index = np.arange(offset + 1, offset + len(chunk) + 1)
+        offset += len(chunk)
+        rows = chunk.loc[chunk.index.isin(wanted), MERGE_COLUMNS]
+        for row, values in rows.iterrows():
+            details[row] = {col: value for col, value in values.items() if pd.notna(value)}
+
+    updates = {}
+    for row, email, sl_no in matched[["Row", "Allocated To", "Sl.no"]].itertuples(index=False, name=None):
+        if details.get(row):
+            updates.setdefault(email, {}).setdefault(int(sl_no), {}).update(details[row])
+    for email, user_updates in updates.items():
+        victory_userdata.update_user_rows(email, user_updates)
+    return sum(len(user_updates) for user_updates in updates.values())
+
+
+# Function to split total rows so the users with the least pending work are topped up first
+def weighted_counts(pending, total):
+    pending = [max(0, int(p)) for p in pending]
+    low, high = min(pending), min(pending) + total
+    while low < high:
+        level = (low + high) // 2
+        if sum(max(0, level - p) for p in pending) >= total:
+            high = level
+        else:
+            low = level + 1
+    counts = [max(0, low - 1 - p) for p in pending]
+    remaining = total - sum(counts)
+    for i in sorted(range(len(pending)), key=lambda i: pending[i]):
+        if remaining == 0:
+            break
+        if pending[i] < low:
+            counts[i] += 1
+            remaining -= 1
+    return counts
+
+
+# Function to read the Location value counts of a staged upload; a staged file never changes, so the counts
+# are cached next to it and reruns of the bulk planner read them back
+def location_counts(meta):
+    path = os.path.join(STAGING_DIR, f"{meta['digest']}.locations.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return pd.Series(dict(json.load(f)), dtype="int64")
+
+    counts = pd.Series(dtype="int64")
+    for chunk in pd.read_csv(meta["path"], dtype=str, usecols=["Location"], chunksize=CHUNK_ROWS):
+        counts = counts.add(chunk["Location"].fillna("Unknown").value_counts(), fill_value=0)
+    counts = counts.astype(int).sort_values(ascending=False)
+    with victory_fileio.atomic_write(path) as f:
+        json.dump([[location, int(count)] for location, count in counts.items()], f)
+    return counts
+
+
+# Function to plan a bulk split; users is a list of dicts with email, name and pending
+def plan_bulk_split(meta, users, strategy):
+    n = len(users)
+    total = meta["rows"]
+    plan = {"strategy": strategy, "counts": [0] * n}
+    if strategy == "Round-robin":
+        plan["counts"] = [total // n + (1 if i < total % n else 0) for i in range(n)]
+    elif strategy == "Weighted by pending load":
+        plan["counts"] = weighted_counts([user["pending"] for user in users], total)
+    else:
+        # Keep each Location with one user, placing the largest Locations first on the least loaded user
+        plan["locations"] = {}
+        for location, count in location_counts(meta).items():
+            i = int(np.argmin(plan["counts"]))
+            plan["locations"][location] = i
+            plan["counts"][i] += int(count)
+    return plan
+
+
+# Function to pick the user index of every row of a chunk under a plan; offset is the chunk's first row number
+def _route_chunk(plan, chunk, offset):
+    n = len(plan["counts"])
+    positions = np.arange(offset, offset + len(chunk))
+    if plan["strategy"] == "Round-robin":
+        return positions % n
+    if plan["strategy"] == "Weighted by pending load":
+        return np.searchsorted(np.cumsum(plan["counts"]), positions, side="right")
+    return chunk["Location"].fillna("Unknown").map(plan["locations"]).to_numpy()
+
+
+# Function to split a staged upload across users in one pass and append every shard in parallel;
+# returns {email: rows allocated}
+def allocate_bulk(meta, users, plan):
+    # Route rows into per-user shard files, numbering each user's rows after their current highest serial
+    summaries = victory_userdata.load_user_summaries([user["email"] for user in users])
+    next_serial = []
+    for user in users:
+        max_serial = summaries.at[user["email"], "max_serial"] if user["email"] in summaries.index else None
+        next_serial.append(int(max_serial) + 1 if pd.notna(max_serial) else 1)
+
+    shard_paths = [os.path.join(STAGING_DIR, f"{meta['digest']}.shard{i}.csv") for i in range(len(users))]
+    for path in shard_paths:
+        if os.path.exists(path):
+            os.remove(path)
+    shard_rows = [0] * len(users)
+    offset = 0
+    for chunk in iter_staged_chunks(meta):
+        targets = _route_chunk(plan, chunk, offset)
+        offset += len(chunk)
+        for i, part in chunk.groupby(targets):
+            i = int(i)
+            part = part.copy()
+            part["Sl.no"] = np.arange(next_serial[i], next_serial[i] + len(part))
+            next_serial[i] += len(part)
+            shard_rows[i] += len(part)
+            part.to_csv(shard_paths[i], mode="a", header=not os.path.exists(shard_paths[i]), index=False)
+
+    # Append every shard to its user in parallel
+    def write_shard(i):
+        if not shard_rows[i]:
+            return 0
+
+        def read_chunks():
+            return pd.read_csv(shard_paths[i], dtype=str, chunksize=CHUNK_ROWS)
+
+        _append_chunks(users[i]["email"], users[i]["name"], read_chunks, meta["filled_columns"])
+        os.remove(shard_paths[i])
+        return shard_rows[i]
+
+    with ThreadPoolExecutor(max_workers=min(MAX_SHARD_WRITERS, len(users))) as pool:
+        allocated = list(pool.map(write_shard, range(len(users))))
+
+    # One batched write of every Assigned count
+    result = {user["email"]: rows for user, rows in zip(users, allocated) if rows}
+    victory_store.increment_many("Assigned", result)
+    return result
@@ -0,0 +1,237 @@
+# Outbound mail: messages are queued durably in the store and delivered by background workers
+# that keep their SMTP connections open between messages
+import argparse
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+from email.mime.text import MIMEText
+
+import victory_store
+
+# SMTP settings; point VICTORY_SMTP_HOST/PORT at a local stand-in (e.g. `python -m aiosmtpd -n`) with
+# VICTORY_SMTP_STARTTLS=0 and an empty VICTORY_SMTP_USER to test without a provider
+SMTP_HOST = os.environ.get("VICTORY_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("VICTORY_SMTP_PORT", "587"))
+SMTP_STARTTLS = os.environ.get("VICTORY_SMTP_STARTTLS", "1") == "1"
+SMTP_USER = os.environ.get("VICTORY_SMTP_USER", "cmd@capcorporate.com")
+SMTP_PASSWORD = os.environ.get("VICTORY_SMTP_PASSWORD", "bqft ohrp hhjs kndq")
+SENDER = os.environ.get("VICTORY_MAIL_SENDER", SMTP_USER)
+
+# Delivery workers, each holding one authenticated connection
+POOL_SIZE = int(os.environ.get("VICTORY_SMTP_POOL", "2"))
+
+# Connections idle longer than this are closed and reopened on next use
+IDLE_TIMEOUT_SECONDS = 60
+
+# Retry schedule: BACKOFF_SECONDS * 2 ** attempts, capped, until MAX_ATTEMPTS
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 300
+
+# Seconds a claimed message belongs to its worker; a message still 'sending' after its lease ran out was left by
+# a worker or process that died, and is sent again. Longer than a send can take (connect, reconnect, two timeouts)
+LEASE_SECONDS = 180
+
+# Error recorded on a message whose lease ran out
+LEASE_EXPIRED_ERROR = "Delivery lease expired before the message was sent"
+
+# Seconds a worker pauses after an unexpected error (a locked database, say) before claiming again
+ERROR_PAUSE_SECONDS = 5
+
+# Prefix of the owner recorded on claimed messages; workers add their thread name
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+log = logging.getLogger(__name__)
+
+_wakeup = threading.Condition()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+# One worker's SMTP connection, opened lazily and reused while the server keeps it alive
+class PooledConnection:
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+
+    # Function to return a live, authenticated connection
+    def get(self):
+        if self.server is not None and time.time() - self.last_used > IDLE_TIMEOUT_SECONDS:
+            self.close()
+        if self.server is None:
+            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+            if SMTP_STARTTLS:
+                server.starttls()
+            if SMTP_USER:
+                server.login(SMTP_USER, SMTP_PASSWORD)
+            self.server = server
+        return self.server
+
+    # Function to send one message, reconnecting once if the server dropped the connection
+    def send(self, recipient, msg):
+        try:
+            self.get().sendmail(SENDER, recipient, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.get().sendmail(SENDER, recipient, msg.as_string())
+        self.last_used = time.time()
+
+    # Function to close the connection, ignoring a server that is already gone
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+# Function to queue a message for delivery; returns its outbox id
+def enqueue(recipient, subject, body):
+    now = time.time()
+    with victory_store.transaction() as conn:
+        cursor = conn.execute(
+            "INSERT INTO outbox (recipient, subject, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (recipient, subject, body, now, now))
+        message_id = cursor.lastrowid
+    start_workers()
+    with _wakeup:
+        _wakeup.notify()
+    return message_id
+
+
+# Function to report a message's delivery state: status, attempts and last error
+def delivery_status(message_id):
+    row = victory_store.connect().execute(
+        "SELECT status, attempts, last_error FROM outbox WHERE id = ?", (message_id,)).fetchone()
+    if row is None:
+        return {"status": "unknown", "attempts": 0, "last_error": None}
+    return {"status": row[0], "attempts": row[1], "last_error": row[2]}
+
+
+# Function to count one more failed attempt of a message; returns (attempts, status, next attempt time) under the
+# retry schedule
+def _retry_schedule(attempts):
+    attempts += 1
+    status = "failed" if attempts >= MAX_ATTEMPTS else "queued"
+    delay = min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    return attempts, status, time.time() + delay
+
+
+# Function to claim the next due message for delivery under a lease held by owner (None if nothing is due);
+# a message whose lease ran out while 'sending' counts as a failed attempt, so one that keeps killing its worker
+# still ends up 'failed'
+def _claim_next(owner):
+    now = time.time()
+    with victory_store.transaction() as conn:
+        expired = conn.execute("SELECT id, attempts FROM outbox "
+                               "WHERE status = 'sending' AND COALESCE(lease_until, 0) < ?", (now,)).fetchall()
+        conn.executemany("UPDATE outbox SET attempts = ?, status = ?, next_attempt_at = ?, last_error = ?, "
+                         "claimed_by = NULL, lease_until = NULL WHERE id = ?",
+                         [_retry_schedule(attempts) + (LEASE_EXPIRED_ERROR, message_id)
+                          for message_id, attempts in expired])
+        row = conn.execute(
+            "SELECT id, recipient, subject, body, attempts FROM outbox WHERE status = 'queued' AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT 1", (now,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE outbox SET status = 'sending', claimed_by = ?, lease_until = ? WHERE id = ?",
+                         (owner, now + LEASE_SECONDS, row[0]))
+    return row
+
+
+# Function to mark a message delivered, dropping its body (OTPs should not outlive delivery)
+def _mark_sent(message_id, owner):
+    with victory_store.transaction() as conn:
+        conn.execute("UPDATE outbox SET status = 'sent', body = NULL, sent_at = ?, last_error = NULL, "
+                     "claimed_by = NULL, lease_until = NULL WHERE id = ? AND claimed_by = ?",
+                     (time.time(), message_id, owner))
+
+
+# Function to schedule a retry with exponential backoff, or give up after MAX_ATTEMPTS
+def _mark_failed(message_id, owner, attempts, error):
+    attempts, status, next_attempt_at = _retry_schedule(attempts)
+    with victory_store.transaction() as conn:
+        conn.execute("UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, "
+                     "claimed_by = NULL, lease_until = NULL WHERE id = ? AND claimed_by = ?",
+                     (status, attempts, next_attempt_at, str(error), message_id, owner))
+
+
+# Function to get the seconds until the next queued message is due (None if the queue is empty)
+def _next_due_in():
+    row = victory_store.connect().execute(
+        "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'queued'").fetchone()
+    return None if row[0] is None else max(0.0, row[0] - time.time())
+
+
+# Function to claim and send one message, or wait for one to fall due
+def _deliver_next(connection, owner):
+    row = _claim_next(owner)
+    if row is None:
+        due_in = _next_due_in()
+        with _wakeup:
+            _wakeup.wait(timeout=IDLE_TIMEOUT_SECONDS if due_in is None else min(due_in, IDLE_TIMEOUT_SECONDS))
+        return
+    message_id, recipient, subject, body, attempts = row
+    msg = MIMEText(body or "")
+    msg['Subject'] = subject
+    msg['From'] = SENDER
+    msg['To'] = recipient
+    try:
+        connection.send(recipient, msg)
+    except (smtplib.SMTPException, OSError) as e:
+        connection.close()
+        _mark_failed(message_id, owner, attempts, e)
+    else:
+        _mark_sent(message_id, owner)
+
+
+# Function run by each delivery worker; an unexpected error is logged and the worker carries on, leaving a message
+# it had claimed to be sent again once its lease runs out
+def _worker():
+    connection = PooledConnection()
+    owner = f"{OWNER}:{threading.current_thread().name}"
+    while True:
+        try:
+            _deliver_next(connection, owner)
+        except Exception:
+            log.exception("Mail worker %s failed; retrying in %s s", owner, ERROR_PAUSE_SECONDS)
+            connection.close()
+            time.sleep(ERROR_PAUSE_SECONDS)
+
+
+# Function to start the delivery workers once per process, replacing any that have stopped
+def start_workers():
+    with _workers_lock:
+        for number in range(POOL_SIZE):
+            if number < len(_workers) and _workers[number].is_alive():
+                continue
+            worker = threading.Thread(target=_worker, name=f"victory-mail-{number}", daemon=True)
+            worker.start()
+            if number < len(_workers):
+                _workers[number] = worker
+            else:
+                _workers.append(worker)
+
+
+# Function to block until a message leaves the queue (used by the CLI and tests); returns its final status
+def wait_for(message_id, timeout=30):
+    deadline = time.time() + timeout
+    status = delivery_status(message_id)
+    while status["status"] in ("queued", "sending") and time.time() < deadline:
+        time.sleep(0.2)
+        status = delivery_status(message_id)
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a test message through the Victory mail queue")
+    parser.add_argument("recipient")
+    parser.add_argument("--db", default="master_users.db")
+    parser.add_argument("--csv", default="master_users.csv")
+    args = parser.parse_args()
+
+    victory_store.init_master_store(args.db, args.csv)
+    print(wait_for(enqueue(args.recipient, "Victory test message", "This is a test message.")))
@@ -0,0 +1,186 @@
+# Hot-path instrumentation: call timings and counters kept in process memory, exposed as Prometheus text
+# (HTTP endpoint and/or periodic file dump). Enabled by VICTORY_METRICS=1; while disabled, timed() returns
+# functions unwrapped and count() returns at once.
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+import victory_cache
+import victory_fileio
+
+ENABLED = os.environ.get("VICTORY_METRICS") == "1"
+# Port for the /metrics endpoint and path for the text dump (each only when set); the endpoint listens on
+# loopback unless VICTORY_METRICS_HOST names another interface
+HTTP_PORT = int(os.environ.get("VICTORY_METRICS_PORT", "0"))
+HTTP_HOST = os.environ.get("VICTORY_METRICS_HOST", "127.0.0.1")
+DUMP_PATH = os.environ.get("VICTORY_METRICS_FILE")
+DUMP_INTERVAL_SECONDS = 15
+
+PREFIX = "victory"
+# Upper bounds (seconds) of the call duration histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_timings = {}
+_counters = {}
+_exporters_started = False
+
+
+# Per-function call statistics: count, total/max seconds, errors and histogram bucket counts
+class Timing:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    # Function to add one call's duration (caller holds the lock)
+    def add(self, seconds, failed):
+        self.calls += 1
+        self.errors += failed
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+
+# Function to record one call's duration under name
+def observe(name, seconds, failed=False):
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = Timing()
+        timing.add(seconds, failed)
+
+
+# Decorator timing every call of a function under name (the function's name by default)
+def timed(name=None):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        metric = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                observe(metric, time.perf_counter() - start, failed)
+        return wrapper
+    return decorate
+
+
+# Function to add value to a counter (reruns, bytes read/written, ...)
+def count(name, value=1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+# Function to copy the current timings and counters
+def snapshot():
+    with _lock:
+        timings = {name: {"calls": t.calls, "errors": t.errors, "total": t.total, "max": t.max,
+                          "buckets": list(t.buckets)} for name, t in _timings.items()}
+        return timings, dict(_counters)
+
+
+# Function to clear every timing and counter
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+# Function to render timings, counters and frame cache and memo stats in the Prometheus text format
+def render():
+    timings, counters = snapshot()
+    lines = [f"# HELP {PREFIX}_call_seconds Duration of instrumented calls",
+             f"# TYPE {PREFIX}_call_seconds histogram"]
+    for name in sorted(timings):
+        timing = timings[name]
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, timing["buckets"]):
+            cumulative += bucket
+            lines.append(f'{PREFIX}_call_seconds_bucket{{fn="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{PREFIX}_call_seconds_bucket{{fn="{name}",le="+Inf"}} {timing["calls"]}')
+        lines.append(f'{PREFIX}_call_seconds_sum{{fn="{name}"}} {timing["total"]:.6f}')
+        lines.append(f'{PREFIX}_call_seconds_count{{fn="{name}"}} {timing["calls"]}')
+    lines += [f"# HELP {PREFIX}_call_errors_total Instrumented calls that raised",
+              f"# TYPE {PREFIX}_call_errors_total counter"]
+    lines += [f'{PREFIX}_call_errors_total{{fn="{name}"}} {timings[name]["errors"]}' for name in sorted(timings)]
+    for name in sorted(counters):
+        lines += [f"# TYPE {PREFIX}_{name}_total counter", f"{PREFIX}_{name}_total {counters[name]}"]
+    for key, value in victory_cache.cache_stats().items():
+        lines += [f"# TYPE {PREFIX}_frame_cache_{key} gauge", f"{PREFIX}_frame_cache_{key} {value}"]
+    for key, value in victory_cache.memo_stats().items():
+        lines += [f"# TYPE {PREFIX}_memo_{key} gauge", f"{PREFIX}_memo_{key} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+# Function to write the Prometheus text to path
+def dump(path):
+    with victory_fileio.atomic_write(path, "w", encoding="utf-8") as f:
+        f.write(render())
+
+
+# Function to serve render() at /metrics on host:port from a background thread
+def _serve_http(host, port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError:  # another server process already owns the port
+        log.warning("Metrics endpoint not started on %s:%s", host, port, exc_info=True)
+        return
+    threading.Thread(target=server.serve_forever, daemon=True, name="victory-metrics-http").start()
+
+
+# Function to rewrite the dump file every DUMP_INTERVAL_SECONDS
+def _dump_worker(path):
+    while True:
+        time.sleep(DUMP_INTERVAL_SECONDS)
+        try:
+            dump(path)
+        except OSError:
+            log.warning("Metrics dump to %s failed", path, exc_info=True)
+
+
+# Function to start the configured exporters once per process (no-op while metrics are disabled)
+def start_exporters():
+    global _exporters_started
+    with _lock:
+        if not ENABLED or _exporters_started:
+            return
+        _exporters_started = True
+    if HTTP_PORT:
+        _serve_http(HTTP_HOST, HTTP_PORT)
+    if DUMP_PATH:
+        threading.Thread(target=_dump_worker, args=(DUMP_PATH,), daemon=True, name="victory-metrics-dump").start()
@@ -0,0 +1,43 @@
+# Per-user work queue: hands each session the next pending records, leased so two tabs never get the same lead
+import victory_store
+import victory_userdata
+
+# Seconds a session keeps its leads without coming back for them
+LEASE_SECONDS = 15 * 60
+
+# Attempts at claiming leads before giving up on ones other sessions keep taking first
+MAX_CLAIM_ATTEMPTS = 5
+
+
+# Function to lease the next n pending serials of a user to a session; returns the leased serials in order
+def next_pending(email, holder, n=1, ttl=LEASE_SECONDS):
+    held = []
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        others = {serial for serial, owner in victory_store.active_leases(email).items() if owner != holder}
+        candidates = victory_userdata.next_pending_serials(email, n, skip=others)
+        held = victory_store.claim_leases(email, holder, candidates, ttl)
+        if len(held) == len(candidates):
+            break
+    return held
+
+
+# Function to read the record of one serial without loading the user's whole allocation (None if absent)
+def get_record(email, sl_no):
+    rows = victory_userdata.read_serial_range(email, int(sl_no), int(sl_no))
+    if rows.empty:
+        return None
+    return rows.iloc[0]
+
+
+# Function to save a submitted record, release its lease and lease the session's next lead;
+# returns the next serial (None when nothing is pending)
+def submit_and_advance(email, holder, sl_no, values, was_completed=False):
+    victory_userdata.save_user_row(email, sl_no, values, was_completed)
+    victory_store.release_leases(email, holder, [sl_no])
+    upcoming = next_pending(email, holder, 1)
+    return upcoming[0] if upcoming else None
+
+
+# Function to give back every lead a session holds for a user
+def release(email, holder):
+    victory_store.release_leases(email, holder)
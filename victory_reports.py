@@ -0,0 +1,285 @@
+# Date-partitioned store of completed call records, used by admin_reports
+import glob
+import os
+import shutil
+from contextlib import ExitStack
+
+import pandas as pd
+
+import victory_fileio
+import victory_metrics
+import victory_schema
+
+# Root of the store: report_store/date=YYYY-MM-DD/ holds the day's compacted file (every user's records, with
+# their Email) and per-user delta files <email>.parquet written since the day was last compacted. A user's delta
+# file, when there is one, holds all of their records for the day and supersedes their compacted rows
+REPORT_DIR = "report_store"
+COMPACTED_FILE = "_compacted.parquet"
+
+# Delta files a day collects before a write folds them into its compacted file; a query reads at most this many
+# files plus one per day
+COMPACT_AFTER_DELTAS = 16
+
+# Columns of a report row, in the order admin_reports shows them
+REPORT_COLUMNS = ['Sl.no', 'Name', 'Membershipnumber', 'Phone Number', 'S/T/SF', 'Regards', 'Date', 'Location',
+                  'New Location', 'User']
+
+# Rows admin_reports previews; the full range only ever goes to the streamed export
+PREVIEW_ROWS = 1000
+
+# Marker written once the store has been backfilled from the users' files
+BUILT_MARKER = "_built"
+
+
+# Function to get the directory of one day's partition
+def partition_dir(date):
+    return os.path.join(REPORT_DIR, f"date={date}")
+
+
+# Function to get the delta file holding one user's records for one day
+def partition_path(date, email):
+    return os.path.join(partition_dir(date), f"{email}.parquet")
+
+
+# Function to get the compacted file of one day
+def compacted_path(date):
+    return os.path.join(partition_dir(date), COMPACTED_FILE)
+
+
+# Function to list a day's delta files
+def _delta_paths(directory):
+    return sorted(path for path in glob.glob(os.path.join(directory, "*.parquet"))
+                  if os.path.basename(path) != COMPACTED_FILE)
+
+
+# Function to get the email a delta file belongs to
+def _email_of(path):
+    return os.path.basename(path)[:-len(".parquet")]
+
+
+# Function to check whether the store has been backfilled
+def is_built():
+    return os.path.exists(os.path.join(REPORT_DIR, BUILT_MARKER))
+
+
+# Function to coerce report rows to the stored column layout and types
+def _to_report_frame(rows):
+    df = rows.reindex(columns=REPORT_COLUMNS)
+    df["Sl.no"] = pd.to_numeric(df["Sl.no"], errors="coerce").astype("Int64")
+    # Partitions store plain strings; categories are applied once a query has concatenated them
+    for col in REPORT_COLUMNS[1:]:
+        df[col] = df[col].astype(victory_schema.STRING)
+    return df.reset_index(drop=True)
+
+
+# Function to coerce rows carrying an Email column to the compacted file's layout
+def _to_compacted_frame(rows):
+    df = _to_report_frame(rows)
+    df["Email"] = rows["Email"].astype(victory_schema.STRING).to_numpy()
+    return df
+
+
+# Function to read one parquet file
+def _read_parquet(path, columns=None, filters=None):
+    victory_metrics.count("bytes_read", os.path.getsize(path))
+    return pd.read_parquet(path, columns=columns, filters=filters)
+
+
+# Function to write one parquet file
+def _write_parquet(path, df):
+    with victory_fileio.atomic_write(path, "wb") as f:
+        df.to_parquet(f, index=False)
+
+
+# Function to read a user's records for one day: their delta file if they have one, otherwise their rows of the
+# compacted file (caller holds the delta file's lock)
+def _read_user_day(date, email):
+    path = partition_path(date, email)
+    compacted = compacted_path(date)
+    if os.path.exists(path):
+        rows = _read_parquet(path)
+    elif os.path.exists(compacted):
+        rows = _read_parquet(compacted, filters=[("Email", "==", email)])
+    else:
+        rows = pd.DataFrame(columns=REPORT_COLUMNS)
+    return _to_report_frame(rows)
+
+
+# Function to write a user's records for one day to their delta file (caller holds its lock). While the day has a
+# compacted file an empty delta is kept, since it stands for the user's compacted rows having been removed
+def _write_user_day(date, email, df):
+    path = partition_path(date, email)
+    if df.empty and not os.path.exists(compacted_path(date)):
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    _write_parquet(path, _to_report_frame(df))
+
+
+# Function to fold a day's delta files into its compacted file. Writers only ever hold one delta file's lock, so
+# taking the compacted file's lock and then every delta's in order cannot deadlock; rows of users without a delta
+# are carried over unchanged, so writers reading them meanwhile see the same rows either way
+def compact_day(date):
+    compacted = compacted_path(date)
+    with victory_fileio.file_lock(compacted), ExitStack() as locks:
+        deltas = _delta_paths(partition_dir(date))
+        for path in deltas:
+            locks.enter_context(victory_fileio.file_lock(path))
+        deltas = [path for path in deltas if os.path.exists(path)]
+        if not deltas:
+            return
+        emails = [_email_of(path) for path in deltas]
+        frames = [_read_parquet(path).assign(Email=email) for path, email in zip(deltas, emails)]
+        if os.path.exists(compacted):
+            frames.insert(0, _read_parquet(compacted, filters=[("Email", "not in", emails)]))
+        frames = [frame for frame in frames if not frame.empty]
+        if frames:
+            _write_parquet(compacted, _to_compacted_frame(pd.concat(frames, ignore_index=True)))
+        elif os.path.exists(compacted):
+            os.remove(compacted)
+        for path in deltas:
+            os.remove(path)
+
+
+# Function to compact a day once it has collected enough delta files
+def _compact_if_needed(date):
+    if len(_delta_paths(partition_dir(date))) >= COMPACT_AFTER_DELTAS:
+        compact_day(date)
+
+
+# Function to insert or replace (by Sl.no) a user's records in one day's partition
+def upsert_report_rows(email, date, rows):
+    rows = _to_report_frame(rows)
+    with victory_fileio.file_lock(partition_path(date, email)):
+        existing = _read_user_day(date, email)
+        existing = existing[~existing["Sl.no"].isin(rows["Sl.no"])]
+        _write_user_day(date, email, pd.concat([frame for frame in (existing, rows) if not frame.empty],
+                                               ignore_index=True))
+    _compact_if_needed(date)
+
+
+# Function to remove a user's records (by Sl.no) from one day's partition
+def remove_report_rows(email, date, serials):
+    with victory_fileio.file_lock(partition_path(date, email)):
+        existing = _read_user_day(date, email)
+        _write_user_day(date, email, existing[~existing["Sl.no"].isin(list(serials))])
+    _compact_if_needed(date)
+
+
+# Function to record a submitted row in its day's partition, moving it out of the day it was last submitted on
+def record_submission(email, user_name, row, old_date=None):
+    record = pd.DataFrame([{col: row.get(col) for col in REPORT_COLUMNS}])
+    record["User"] = user_name
+    date = record.at[0, "Date"]
+    if pd.notna(old_date) and str(old_date) != str(date):
+        remove_report_rows(email, str(old_date), [row.get("Sl.no")])
+    upsert_report_rows(email, str(date), record)
+
+
+# Function to move reallocated rows' records from one user's partitions to another's;
+# rows carry their new serials, original_serials the serials they had under from_email
+def move_report_rows(from_email, to_email, to_name, rows, original_serials):
+    if rows.empty or "Date" not in rows.columns:
+        return
+    dates = pd.to_datetime(rows["Date"], errors="coerce")
+    dated = rows[dates.notna()].copy()
+    dated["Date"] = dates[dates.notna()].dt.strftime("%Y-%m-%d")
+    dated["User"] = to_name
+    old_serials = pd.Series(original_serials, index=rows.index)[dates.notna()]
+    for date, group in dated.groupby("Date"):
+        remove_report_rows(from_email, date, old_serials[group.index])
+        upsert_report_rows(to_email, date, group)
+
+
+# Function to get the dated records of one user's data, with Date as YYYY-MM-DD and the user's name and email
+def _dated_records(email, user_name, data):
+    if data.empty or "Date" not in data.columns:
+        return data.iloc[0:0]
+    dates = pd.to_datetime(data["Date"], errors="coerce")
+    dated = data[dates.notna()].copy()
+    dated["Date"] = dates[dates.notna()].dt.strftime("%Y-%m-%d")
+    dated["User"] = user_name
+    dated["Email"] = email
+    return dated
+
+
+# Function to rebuild the whole store from the users' files, as one compacted file per day;
+# users is an iterable of (email, name)
+def rebuild_report_store(users, load_user_data=None):
+    if load_user_data is None:
+        import victory_userdata
+        load_user_data = victory_userdata.load_user_data
+    with victory_fileio.file_lock(REPORT_DIR):
+        if os.path.exists(REPORT_DIR):
+            shutil.rmtree(REPORT_DIR)
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        records = [_dated_records(email, user_name, load_user_data(email)) for email, user_name in users]
+        records = [frame for frame in records if not frame.empty]
+        if records:
+            for date, rows in pd.concat(records, ignore_index=True).groupby("Date"):
+                os.makedirs(partition_dir(date), exist_ok=True)
+                _write_parquet(compacted_path(date), _to_compacted_frame(rows))
+        open(os.path.join(REPORT_DIR, BUILT_MARKER), "w").close()
+
+
+# Function to list the day directories for dates within [start_date, end_date]
+def partition_dirs(start_date, end_date):
+    start, end = str(start_date), str(end_date)
+    if not os.path.exists(REPORT_DIR):
+        return []
+    return [os.path.join(REPORT_DIR, name) for name in sorted(os.listdir(REPORT_DIR))
+            if name.startswith("date=") and start <= name[len("date="):] <= end]
+
+
+# Function to read one day's records: the compacted rows of users without a delta file, then the delta files
+def _read_day(directory, columns):
+    while True:
+        deltas = _delta_paths(directory)
+        emails = [_email_of(path) for path in deltas]
+        compacted = os.path.join(directory, COMPACTED_FILE)
+        try:
+            frames = [_read_parquet(path, columns=columns) for path in deltas]
+            if os.path.exists(compacted):
+                filters = [("Email", "not in", emails)] if emails else None
+                frames.insert(0, _read_parquet(compacted, columns=list(columns), filters=filters))
+        except FileNotFoundError:
+            # The day was compacted while it was being read: its rows are all in the new compacted file
+            continue
+        frames = [frame for frame in frames if not frame.empty]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+
+# Function to yield the report rows for a date range one day at a time
+def iter_report_chunks(start_date, end_date, columns=REPORT_COLUMNS):
+    for directory in partition_dirs(start_date, end_date):
+        chunk = _read_day(directory, columns)
+        if chunk is not None:
+            yield chunk
+
+
+# Function to combine day chunks into one report frame with parsed dates
+def _concat_report(chunks, columns):
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    report_df = pd.concat(chunks, ignore_index=True)
+    if "Date" in report_df.columns:
+        report_df["Date"] = pd.to_datetime(report_df["Date"], errors="coerce")
+    return report_df
+
+
+# Function to load the report rows for a date range, reading only the partitions in range
+def query_reports(start_date, end_date, columns=REPORT_COLUMNS):
+    return _concat_report(list(iter_report_chunks(start_date, end_date, columns)), columns)
+
+
+# Function to read the first limit report rows of a date range, reading days only until limit is reached;
+# returns (rows, whether the range has more rows than were returned)
+def preview_reports(start_date, end_date, limit=PREVIEW_ROWS, columns=REPORT_COLUMNS):
+    chunks, rows, more = [], 0, False
+    for chunk in iter_report_chunks(start_date, end_date, columns):
+        if rows >= limit:
+            more = True
+            break
+        chunks.append(chunk)
+        rows += len(chunk)
+    return _concat_report(chunks, columns).head(limit), more or rows > limit
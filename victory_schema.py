@@ -0,0 +1,80 @@
+# Declared column types for allocation and report frames: categoricals for the low-cardinality fields,
+# nullable integers for serials and pyarrow-backed strings for free text, so cached frames stay compact
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# pyarrow is already needed for the parquet report store
+STRING = pd.StringDtype("pyarrow")
+CATEGORY = "category"
+SERIAL = "Int64"
+
+# Column -> dtype of a user's allocation data (columns not listed are left as read)
+USER_DATA_DTYPES = {
+    'Sl.no': SERIAL,
+    'Name': STRING,
+    'Phone Number': STRING,
+    'Membershipnumber': STRING,
+    'Sex': CATEGORY,
+    'Designation': CATEGORY,
+    'Org': CATEGORY,
+    'Location': CATEGORY,
+    'S/T/SF': CATEGORY,
+    'Regards': CATEGORY,
+    'New Location': CATEGORY,
+    'Date': CATEGORY,
+}
+
+
+# Function to get read_csv dtype hints; serials are read as text and converted by apply_schema
+# so a malformed serial does not fail the whole read
+def read_csv_dtypes(dtypes=USER_DATA_DTYPES):
+    return {col: (STRING if dtype == SERIAL else dtype) for col, dtype in dtypes.items()}
+
+
+# Function to check whether a column already has its declared dtype
+def _has_dtype(series, dtype):
+    if dtype == CATEGORY:
+        return isinstance(series.dtype, CategoricalDtype)
+    return series.dtype == dtype
+
+
+# Function to convert one column to its declared dtype
+def _convert(series, dtype):
+    if dtype == SERIAL:
+        serials = pd.to_numeric(series, errors="coerce")
+        if serials.isna().sum() > series.isna().sum():  # keep malformed serials rather than drop them
+            return series
+        return serials.astype(SERIAL)
+    return series.astype(dtype)
+
+
+# Function to give the declared columns of a frame their declared dtypes (in place; returns the frame)
+def apply_schema(df, dtypes=USER_DATA_DTYPES):
+    for col, dtype in dtypes.items():
+        if col in df.columns and not _has_dtype(df[col], dtype):
+            df[col] = _convert(df[col], dtype)
+    return df
+
+
+# Function to write values (a Series indexed like df) into one column, keeping its dtype
+def set_values(df, col, values):
+    column = df[col]
+    if isinstance(column.dtype, CategoricalDtype):
+        # Set the codes directly; going through .loc is far slower for the single-row edits of the change log
+        array = column.array
+        new = pd.Index(values.dropna().unique()).difference(array.categories)
+        array = array.add_categories(new) if len(new) else array.copy()
+        array[df.index.get_indexer(values.index)] = values.to_numpy()
+        df[col] = array
+        return df
+    if isinstance(column.dtype, pd.StringDtype):
+        values = values.map(lambda v: v if pd.isna(v) else str(v))
+    elif column.dtype != object:
+        df[col] = column.astype(object)
+    df.loc[values.index, col] = values
+    return df
+
+
+# Function to measure a frame's memory in bytes, strings included
+def memory_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
@@ -0,0 +1,197 @@
+# Admin search over every user's allocation, served from the search index the allocation write paths keep in
+# the master store: trigram full-text matching on Name, Phone Number, Membershipnumber, Designation, Org and
+# Location, name prefix and fuzzy matching, and facet counts by Location, Org and S/T/SF
+import difflib
+import re
+
+import pandas as pd
+
+import victory_store
+
+# Result rows returned per query
+RESULT_LIMIT = 200
+
+# Facet label -> search_rows column
+FACETS = {"Location": "location", "Org": "org", "S/T/SF": "status"}
+
+# Facet value shown for rows without one (S/T/SF of a lead not called yet)
+BLANK = "(blank)"
+
+# Facet values listed per facet
+FACET_LIMIT = 50
+
+# Fuzzy name search: vocabulary words scored per query word, the closest of them searched for, and the
+# similarity a word needs to count as a match
+FUZZY_WORD_CANDIDATES = 200
+FUZZY_WORDS = 25
+FUZZY_MIN_SCORE = 0.6
+
+# Matching rows read per text query; totals and facet counts beyond this are reported as lower bounds
+SCAN_ROWS = 10000
+
+# Trigram matching needs terms of at least this many characters; shorter ones are matched as name prefixes
+MIN_TERM_CHARS = 3
+
+# search_rows column -> result column
+RESULT_COLUMNS = {"email": "Email", "sl_no": "Sl.no"}
+RESULT_COLUMNS.update({col: label for label, col in victory_store.SEARCH_COLUMNS.items()})
+
+
+# Function to quote a term as an FTS5 string
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+# Function to check whether a term is a phone or membership number fragment (digits and separators only)
+def _is_number(term):
+    return bool(re.fullmatch(r"[\d+\-()]+", term)) and any(ch.isdigit() for ch in term)
+
+
+# Function to get the trigrams of a word
+def _trigrams(word):
+    return sorted({word[i:i + 3] for i in range(len(word) - 2)})
+
+
+# Function to find the name vocabulary words closest to a (misspelled) word, as {word: similarity}; candidates
+# sharing trigrams with it come from the vocabulary's own index, so the cost follows the vocabulary, not the rows
+def close_words(word):
+    word = word.lower()
+    rows = victory_store.connect().execute(
+        "SELECT word FROM search_name_words WHERE id IN (SELECT rowid FROM search_words_fts "
+        "WHERE search_words_fts MATCH ? ORDER BY rank LIMIT ?)",
+        (" OR ".join(_quote(trigram) for trigram in _trigrams(word)), FUZZY_WORD_CANDIDATES)).fetchall()
+    scored = sorted(((difflib.SequenceMatcher(None, word, candidate).ratio(), candidate) for (candidate,) in rows),
+                    reverse=True)
+    return {candidate: score for score, candidate in scored[:FUZZY_WORDS] if score >= FUZZY_MIN_SCORE}
+
+
+# Function to turn query text into a full-text match expression plus SQL conditions on search_rows (as r); every
+# term must match, and with fuzzy set each name word may match any close vocabulary word. Returns (match expression
+# or None, conditions, params, [close words of each fuzzy-matched term])
+def _text_conditions(text, fuzzy=False):
+    fts_terms, conditions, params, closeness = [], [], [], []
+    # Phone numbers are often typed with spaces: join runs of number fragments into one term
+    terms = []
+    for term in text.split():
+        if terms and _is_number(term) and _is_number(terms[-1]):
+            terms[-1] += term
+        else:
+            terms.append(term)
+    for term in terms:
+        if _is_number(term):
+            digits = re.sub(r"\D", "", term)
+            if len(digits) >= MIN_TERM_CHARS:
+                fts_terms.append("{phone membership} : " + _quote(digits))
+        elif len(term) < MIN_TERM_CHARS:
+            # The NOCASE index on name serves prefix LIKE patterns
+            conditions.append("r.name LIKE ?")
+            params.append(term.replace("%", "").replace("_", "") + "%")
+        elif fuzzy:
+            words = close_words(term)
+            if not words:
+                return None, ["0"], [], []
+            closeness.append(words)
+            fts_terms.append("name : (" + " OR ".join(_quote(word) for word in words) + ")")
+        else:
+            fts_terms.append(_quote(term))
+    return (" AND ".join(fts_terms) or None), conditions, params, closeness
+
+
+# Function to turn facet selections ({facet label: [values]}) into SQL conditions, leaving out one facet's own
+# selection when counting that facet. Blank values are NULL in search_rows (as r) and '' in search_facets.
+# Returns (conditions, params)
+def _filter_conditions(filters, skip=None, table="search_rows"):
+    conditions, params = [], []
+    for label, values in (filters or {}).items():
+        if label == skip or not values:
+            continue
+        column = FACETS[label] if table == "search_facets" else f"r.{FACETS[label]}"
+        named = [value for value in values if value != BLANK]
+        if table == "search_facets":
+            named += [""] if BLANK in values else []
+        parts = [f"{column} IN ({', '.join('?' for _ in named)})"] if named else []
+        if BLANK in values and table == "search_rows":
+            parts.append(f"{column} IS NULL")
+        conditions.append("(" + " OR ".join(parts) + ")")
+        params += named
+    return conditions, params
+
+
+# Function to build a WHERE clause from conditions
+def _where(conditions):
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+# Function to read up to SCAN_ROWS + 1 rows matching a text query, streaming from the full-text index
+def _scan(conn, match, conditions, params):
+    columns = ", ".join(f"r.{col}" for col in RESULT_COLUMNS)
+    if match is None:
+        sql = f"SELECT {columns} FROM search_rows r{_where(conditions)}"
+    else:
+        sql = (f"SELECT {columns} FROM search_fts JOIN search_rows r ON r.id = search_fts.rowid"
+               f"{_where(['search_fts MATCH ?'] + conditions)}")
+        params = [match] + params
+    rows = conn.execute(f"{sql} LIMIT ?", params + [SCAN_ROWS + 1]).fetchall()
+    return pd.DataFrame(rows, columns=list(RESULT_COLUMNS.values()))
+
+
+# Function to count rows by value of one facet
+def _value_counts(rows, label):
+    return rows[label].fillna(BLANK).value_counts().head(FACET_LIMIT)
+
+
+# Function to count all rows of one facet by value from the facet table the search_rows triggers keep,
+# leaving out the facet's own selection
+def _stored_facet_counts(conn, label, filters):
+    column = FACETS[label]
+    conditions, params = _filter_conditions(filters, skip=label, table="search_facets")
+    rows = conn.execute(f"SELECT {column}, SUM(rows) AS n FROM search_facets{_where(conditions)} "
+                        f"GROUP BY {column} HAVING n > 0 ORDER BY n DESC LIMIT ?", params + [FACET_LIMIT]).fetchall()
+    return pd.Series({(value or BLANK): count for value, count in rows}, dtype="int64")
+
+
+# Function to score how closely a name matches a fuzzy query: the mean over the query's words of the best
+# similarity among the name's words (a word only matched inside a longer one scores 0)
+def _closeness(closeness, name):
+    name_words = (name or "").lower().split()
+    return sum(max((words.get(part, 0) for part in name_words), default=0) for words in closeness) / len(closeness)
+
+
+# Function to search every allocation; filters maps facet labels to selected values. Returns (up to limit result
+# rows, total matching rows, {facet label: counts by value}).
+# Browsing by facet alone is exact at any size: rows come from the name index and counts from the facet table.
+# Text queries read at most SCAN_ROWS matching rows, so a total above SCAN_ROWS means "more than SCAN_ROWS" and
+# the facet counts then cover the rows read. With fuzzy set, name words also match misspellings and the results
+# are ordered by how close the names are
+def search(text="", filters=None, limit=RESULT_LIMIT, fuzzy=False):
+    conn = victory_store.connect()
+    match, text_conditions, text_params, closeness = _text_conditions((text or "").strip(), fuzzy)
+    filter_conditions, filter_params = _filter_conditions(filters)
+
+    if match is None and not text_conditions:
+        columns = ", ".join(f"r.{col}" for col in RESULT_COLUMNS)
+        rows = conn.execute(f"SELECT {columns} FROM search_rows r{_where(filter_conditions)} "
+                            "ORDER BY r.name, r.email, r.sl_no LIMIT ?", filter_params + [limit]).fetchall()
+        results = pd.DataFrame(rows, columns=list(RESULT_COLUMNS.values()))
+        conditions, params = _filter_conditions(filters, table="search_facets")
+        total = conn.execute(f"SELECT COALESCE(SUM(rows), 0) FROM search_facets{_where(conditions)}",
+                             params).fetchone()[0]
+        return results, total, {label: _stored_facet_counts(conn, label, filters) for label in FACETS}
+
+    hits = _scan(conn, match, text_conditions + filter_conditions, text_params + filter_params)
+    if closeness:
+        hits.insert(0, "Score", [round(_closeness(closeness, name), 3) for name in hits["Name"]])
+        order, ascending = ["Score", "Name", "Email", "Sl.no"], [False, True, True, True]
+    else:
+        order, ascending = ["Name", "Email", "Sl.no"], True
+    results = hits.sort_values(order, ascending=ascending, kind="stable",
+                               key=lambda col: col.str.lower() if pd.api.types.is_string_dtype(col) else col)
+    facets = {}
+    for label in FACETS:
+        if (filters or {}).get(label):
+            # A facet's own selection is left out of its counts
+            conditions, params = _filter_conditions(filters, skip=label)
+            facets[label] = _value_counts(_scan(conn, match, text_conditions + conditions, text_params + params), label)
+        else:
+            facets[label] = _value_counts(hits, label)
+    return results.head(limit).reset_index(drop=True), len(hits), facets
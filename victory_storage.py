@@ -0,0 +1,543 @@
+# Storage service for multi-process deployments: one daemon owns the master store, user files, report store
+# and mail outbox, and Streamlit workers call the same storage functions over a Unix socket or TCP.
+#
+#   python victory_storage.py serve --url unix:///tmp/victory.sock --root /srv/victory
+#   VICTORY_STORAGE_URL=unix:///tmp/victory.sock streamlit run Victory.py --server.port 8501
+#   python victory_storage.py launch --workers 4 --root /srv/victory      (daemon + workers on one box)
+#
+# Messages are length-prefixed JSON; DataFrames travel as Arrow IPC attachments after the JSON body.
+import argparse
+import builtins
+import glob
+import hmac
+import importlib
+import inspect
+import io
+import ipaddress
+import json
+import os
+import re
+import shutil
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+import types
+from datetime import date, datetime
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+# Daemon address: unix:///path/to.sock or tcp://host:port (unset: storage runs in-process as before)
+STORAGE_URL = os.environ.get("VICTORY_STORAGE_URL")
+# Shared secret checked on every request when set; required for a TCP daemon listening beyond loopback
+STORAGE_TOKEN = os.environ.get("VICTORY_STORAGE_TOKEN", "")
+
+# Modules whose functions run in the daemon; workers keep only their constants
+REMOTE_MODULES = ["victory_store", "victory_userdata", "victory_reports", "victory_activity", "victory_queue",
+                  "victory_ingest", "victory_mail", "victory_export", "victory_search"]
+
+# The functions the app's pages call, and the only ones the daemon serves; maintenance and internals of the
+# remote modules (index resets, compaction, raw store writes) stay reachable from the daemon's side only
+PAGE_API = {
+    "victory_activity": {"caller_velocity", "record_call", "trend"},
+    "victory_export": {"discard_export", "export_report"},
+    "victory_ingest": {"allocate_bulk", "allocate_staged", "find_duplicates", "merge_duplicates", "plan_bulk_split",
+                       "stage_upload", "without_duplicates"},
+    "victory_mail": {"delivery_status", "enqueue"},
+    "victory_queue": {"get_record", "next_pending", "release", "submit_and_advance"},
+    "victory_reports": {"is_built", "move_report_rows", "preview_reports", "rebuild_report_store",
+                        "record_submission"},
+    "victory_search": {"search"},
+    "victory_store": {"add_user", "credentials_version", "data_version", "export_master_csv", "increment_stat",
+                      "init_master_store", "lead_index_built", "load_credentials", "load_master",
+                      "load_master_at_feed_position", "read_feed", "replace_master", "search_index_built",
+                      "set_password"},
+    "victory_userdata": {"load_user_data", "load_user_summaries", "pending_count", "reallocate_range",
+                         "rebuild_lead_index", "rebuild_search_index", "recover_reallocations", "save_user_data",
+                         "save_user_row", "user_data_path"},
+}
+
+# Argument names carrying a user's email, which names their files (an "emails" argument is a list of them)
+EMAIL_ARGUMENTS = {"email", "from_email", "to_email"}
+
+# Staged upload digests: a sha256, optionally followed by the tags of filtered copies
+STAGED_DIGEST = re.compile(r"[0-9a-f]{64}(-[0-9a-f]{16})*")
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_HEADER = struct.Struct("!I")
+_ATTACHMENT = struct.Struct("!Q")
+
+
+# Raised in a worker for a daemon-side error that has no matching builtin exception
+class RemoteError(RuntimeError):
+    pass
+
+
+# BytesIO carrying the name of an uploaded file, as file uploads are passed to ingestion
+class UploadedBytes(io.BytesIO):
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+# Function to serialize a DataFrame as an Arrow IPC stream
+def _frame_bytes(df):
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns: send them as text
+        df = df.copy()
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].map(lambda v: v if v is None or pd.isna(v) else str(v)).astype("string")
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# Function to read a DataFrame from an Arrow IPC stream
+def _frame_from_bytes(data):
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+# Function to turn a value into JSON-safe form, moving frames and bytes into attachments
+def encode(value, attachments):
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.DataFrame):
+        attachments.append(_frame_bytes(value))
+        return {"__frame__": len(attachments) - 1}
+    if isinstance(value, pd.Series):
+        return {"__series__": {"name": encode(value.name, attachments),
+                               "index": [encode(v, attachments) for v in value.index],
+                               "values": [encode(v, attachments) for v in value.tolist()]}}
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return {"__timestamp__": value.isoformat()}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        attachments.append(bytes(value))
+        return {"__bytes__": len(attachments) - 1}
+    if hasattr(value, "getvalue") and hasattr(value, "name"):  # an uploaded file
+        attachments.append(value.getvalue())
+        return {"__upload__": len(attachments) - 1, "name": value.name}
+    if isinstance(value, tuple):
+        return {"__tuple__": [encode(v, attachments) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        return {"__set__": [encode(v, attachments) for v in value]}
+    if isinstance(value, (list, np.ndarray, pd.Index)):
+        return [encode(v, attachments) for v in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: encode(v, attachments) for key, v in value.items()}
+        return {"__items__": [[encode(key, attachments), encode(v, attachments)] for key, v in value.items()]}
+    raise TypeError(f"Cannot send a {type(value).__name__} to the storage service")
+
+
+# Function to rebuild a value encoded by encode
+def decode(value, attachments):
+    if isinstance(value, list):
+        return [decode(v, attachments) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__frame__" in value:
+        return _frame_from_bytes(attachments[value["__frame__"]])
+    if "__series__" in value:
+        series = value["__series__"]
+        return pd.Series(decode(series["values"], attachments), index=decode(series["index"], attachments),
+                         name=decode(series["name"], attachments), dtype=object)
+    if "__timestamp__" in value:
+        return pd.Timestamp(value["__timestamp__"])
+    if "__datetime__" in value:
+        return datetime.fromisoformat(value["__datetime__"])
+    if "__date__" in value:
+        return date.fromisoformat(value["__date__"])
+    if "__bytes__" in value:
+        return attachments[value["__bytes__"]]
+    if "__upload__" in value:
+        return UploadedBytes(attachments[value["__upload__"]], value["name"])
+    if "__tuple__" in value:
+        return tuple(decode(value["__tuple__"], attachments))
+    if "__set__" in value:
+        return set(decode(value["__set__"], attachments))
+    if "__items__" in value:
+        return {decode(key, attachments): decode(v, attachments) for key, v in value["__items__"]}
+    return {key: decode(v, attachments) for key, v in value.items()}
+
+
+# Function to read exactly n bytes from a socket (None on a clean EOF before the first byte)
+def _recv_exact(sock, n):
+    chunks = []
+    remaining = n
+    while remaining:
+        chunk = sock.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            if remaining == n:
+                return None
+            raise ConnectionError("Storage connection closed mid-message")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+# Function to send one message: its JSON body, then each attachment
+def send_message(sock, body, attachments=()):
+    body = dict(body, attachments=len(attachments))
+    payload = json.dumps(body).encode("utf-8")
+    parts = [_HEADER.pack(len(payload)), payload]
+    for attachment in attachments:
+        parts += [_ATTACHMENT.pack(len(attachment)), attachment]
+    sock.sendall(b"".join(parts))
+
+
+# Function to receive one message; returns (body, attachments), or None when the peer closed the connection
+def recv_message(sock):
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    body = json.loads(_recv_exact(sock, _HEADER.unpack(header)[0]))
+    attachments = []
+    for _ in range(body.pop("attachments")):
+        attachments.append(_recv_exact(sock, _ATTACHMENT.unpack(_recv_exact(sock, _ATTACHMENT.size))[0]))
+    return body, attachments
+
+
+# Function to split a storage URL into (socket family, address)
+def parse_url(url):
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return socket.AF_UNIX, parsed.path
+    if parsed.scheme == "tcp":
+        return socket.AF_INET, (parsed.hostname or "127.0.0.1", parsed.port or 8765)
+    raise ValueError(f"Unsupported storage URL: {url} (use unix:///path.sock or tcp://host:port)")
+
+
+# Function to check whether a TCP address only accepts connections from this machine
+def is_loopback(host):
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses)
+
+
+# Function to find the storage function a request names, refusing anything outside the page-facing API
+def _resolve(module_name, function_name):
+    if function_name not in PAGE_API.get(module_name, ()):
+        raise PermissionError(f"{module_name}.{function_name} is not a storage function")
+    module = importlib.import_module(module_name)
+    function = getattr(module, function_name, None)
+    if not isinstance(function, types.FunctionType) or function.__module__ != module_name:
+        raise PermissionError(f"{module_name}.{function_name} is not a storage function")
+    return function
+
+
+# Function to refuse an email that would name a file outside the user data directories
+def _check_email(email):
+    if not isinstance(email, str) or not email or email in (".", "..") or \
+            any(ch in email for ch in ("/", "\\", "\0")):
+        raise PermissionError(f"Invalid user email: {email!r}")
+
+
+# Function to refuse a path outside the daemon's data directory
+def _check_under_root(path):
+    root = os.path.realpath(os.getcwd())
+    if not isinstance(path, str) or os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise PermissionError(f"Path outside the storage root: {path!r}")
+
+
+# Function to refuse staged-upload metadata whose file is not the staged copy of its digest
+def _check_staged(meta):
+    import victory_ingest
+
+    if not isinstance(meta, dict) or not STAGED_DIGEST.fullmatch(str(meta.get("digest"))) or \
+            meta.get("path") != victory_ingest.staged_paths(meta["digest"])[0]:
+        raise PermissionError("Invalid staged upload")
+
+
+# Function to check a request's arguments before running it: emails, staged uploads and paths may only reach the
+# files the daemon manages, and the master store cannot be pointed at another database once open
+def _check_arguments(module_name, function, args, kwargs):
+    try:
+        arguments = inspect.signature(function).bind(*args, **kwargs).arguments
+    except TypeError as e:
+        raise PermissionError(str(e)) from None
+    for name, value in arguments.items():
+        if name in EMAIL_ARGUMENTS:
+            _check_email(value)
+        elif name == "emails":
+            for email in value:
+                _check_email(email)
+        elif name == "users":
+            for user in value:
+                _check_email(user["email"] if isinstance(user, dict) else user[0])
+        elif name == "meta":
+            _check_staged(value)
+        elif name in ("db_path", "csv_path"):
+            _check_under_root(value)
+        elif name == "path" and value:
+            import victory_export
+
+            if not victory_export.is_export_path(value):
+                raise PermissionError(f"Not a report export: {value!r}")
+    if (module_name, function.__name__) == ("victory_store", "init_master_store"):
+        import victory_store
+
+        if victory_store._initialized and \
+                os.path.realpath(arguments["db_path"]) != os.path.realpath(victory_store.DB_PATH):
+            raise PermissionError("The master store is already open")
+
+
+# Function to run one request after checking its token, function and arguments; returns the function's result
+def _dispatch(request, attachments):
+    if not hmac.compare_digest(request.get("token", ""), STORAGE_TOKEN):
+        raise PermissionError("Invalid storage token")
+    function = _resolve(request["module"], request["function"])
+    args, kwargs = decode(request["args"], attachments), decode(request["kwargs"], attachments)
+    _check_arguments(request["module"], function, args, kwargs)
+    return function(*args, **kwargs)
+
+
+# Serves storage calls on one connection until the worker disconnects
+class _StorageHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            message = recv_message(self.request)
+            if message is None:
+                return
+            request, attachments = message
+            reply_attachments = []
+            try:
+                result = _dispatch(request, attachments)
+                reply = {"ok": True, "result": encode(result, reply_attachments)}
+            except Exception as e:
+                reply_attachments = []
+                reply = {"ok": False, "error": type(e).__name__, "message": str(e)}
+            send_message(self.request, reply, reply_attachments)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# Function to run the storage daemon with root as its data directory (blocks); a TCP daemon reachable from other
+# machines must have a token
+def serve(url, root):
+    family, address = parse_url(url)
+    if family == socket.AF_INET and not STORAGE_TOKEN and not is_loopback(address[0]):
+        raise SystemExit(f"Refusing to serve {url} without VICTORY_STORAGE_TOKEN: it is reachable beyond this machine")
+    os.chdir(root)
+    sys.path.insert(0, APP_DIR)
+    for name in REMOTE_MODULES:
+        importlib.import_module(name)
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.remove(address)
+        server = _UnixServer(address, _StorageHandler)
+        os.chmod(address, 0o660)
+    else:
+        server = _TCPServer(address, _StorageHandler)
+    print(f"Victory storage serving {os.path.abspath(root)} on {url}")
+    server.serve_forever()
+
+
+# One worker thread's connection to the daemon, reopened when the daemon restarts
+class _Connection(threading.local):
+    sock = None
+
+
+# Calls storage functions on the daemon at url
+class StorageClient:
+    def __init__(self, url, token=STORAGE_TOKEN):
+        self.url = url
+        self.token = token
+        self._local = _Connection()
+
+    # Function to open this thread's connection
+    def _connect(self):
+        family, address = parse_url(self.url)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(address)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        return sock
+
+    # Function to drop this thread's connection
+    def close(self):
+        if self._local.sock is not None:
+            self._local.sock.close()
+            self._local.sock = None
+
+    # Function to call module.function(*args, **kwargs) in the daemon and return its result
+    def call(self, module, function, args, kwargs):
+        attachments = []
+        request = {"token": self.token, "module": module, "function": function,
+                   "args": encode(list(args), attachments), "kwargs": encode(kwargs, attachments)}
+        sock = self._local.sock
+        try:
+            if sock is None:
+                sock = self._connect()
+            send_message(sock, request, attachments)
+        except OSError:
+            # A connection left over from before a daemon restart; nothing was sent, so retry once
+            self.close()
+            send_message(self._connect(), request, attachments)
+        try:
+            message = recv_message(self._local.sock)
+        except OSError:
+            self.close()
+            raise
+        if message is None:
+            self.close()
+            raise ConnectionError("Storage daemon closed the connection")
+        reply, reply_attachments = message
+        if not reply["ok"]:
+            error = getattr(builtins, reply["error"], None)
+            if isinstance(error, type) and issubclass(error, Exception):
+                raise error(reply["message"])
+            raise RemoteError(f"{reply['error']}: {reply['message']}")
+        return decode(reply["result"], reply_attachments)
+
+
+# Stands in for a storage module in a worker: functions call the daemon, everything else (constants)
+# comes from the local copy of the module
+class RemoteModule(types.ModuleType):
+    def __init__(self, local, client):
+        super().__init__(local.__name__, local.__doc__)
+        self._local = local
+        self._client = client
+
+    def __getattr__(self, name):
+        value = getattr(self._local, name)
+        if isinstance(value, types.FunctionType) and value.__module__ == self.__name__ and not name.startswith("_"):
+            module = self.__name__
+
+            def remote(*args, **kwargs):
+                return self._client.call(module, name, args, kwargs)
+            remote.__name__ = name
+            return remote
+        return value
+
+
+# Function to route the storage modules of this process to the daemon when VICTORY_STORAGE_URL is set;
+# must run before anything imports them. Returns True when storage is remote
+def install(url=STORAGE_URL):
+    if not url:
+        return False
+    client = None
+    for name in REMOTE_MODULES:
+        if isinstance(sys.modules.get(name), RemoteModule):
+            continue
+        local = importlib.import_module(name)
+        client = client or StorageClient(url)
+        sys.modules[name] = RemoteModule(local, client)
+    return True
+
+
+# Function to move user files into the data directory their email now hashes to (after changing
+# VICTORY_USER_DATA_DIRS); returns the number of files moved
+def reshard(root, old_dirs):
+    os.chdir(root)
+    import victory_userdata
+
+    moved = 0
+    for directory in set(old_dirs) | set(victory_userdata.USER_DATA_DIRS):
+        for path in glob.glob(os.path.join(directory, "*.csv")) + glob.glob(os.path.join(directory, "*.log")):
+            email = os.path.basename(path).rsplit(".", 1)[0]
+            target = os.path.join(victory_userdata.user_data_dir(email), os.path.basename(path))
+            if os.path.abspath(target) != os.path.abspath(path):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+                moved += 1
+    return moved
+
+
+# Function to wait until the daemon accepts connections
+def wait_until_ready(url, timeout=30):
+    family, address = parse_url(url)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with socket.socket(family, socket.SOCK_STREAM) as sock:
+                sock.connect(address)
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+# Function to run a daemon plus several Streamlit workers on this machine until interrupted
+def launch(root, url, workers, base_port):
+    env = dict(os.environ, VICTORY_STORAGE_URL=url)
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--url", url,
+                                   "--root", root], env=env)]
+    try:
+        wait_until_ready(url)
+        for number in range(workers):
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "streamlit", "run", os.path.join(APP_DIR, "Victory.py"),
+                 "--server.port", str(base_port + number), "--server.headless", "true"], cwd=APP_DIR, env=env))
+        print(f"{workers} workers on ports {base_port}-{base_port + workers - 1}, storage on {url}")
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Victory storage service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the storage daemon")
+    serve_parser.add_argument("--url", default=STORAGE_URL or "unix:///tmp/victory-storage.sock")
+    serve_parser.add_argument("--root", default=".", help="directory holding the master store and user data")
+
+    launch_parser = commands.add_parser("launch", help="run the daemon and several workers on this machine")
+    launch_parser.add_argument("--url", default=STORAGE_URL or "unix:///tmp/victory-storage.sock")
+    launch_parser.add_argument("--root", default=".")
+    launch_parser.add_argument("--workers", type=int, default=2)
+    launch_parser.add_argument("--base-port", type=int, default=8501)
+
+    reshard_parser = commands.add_parser("reshard", help="move user files to their hashed data directories")
+    reshard_parser.add_argument("--root", default=".")
+    reshard_parser.add_argument("--old-dirs", default="user_data",
+                                help=f"previous data directories, separated by '{os.pathsep}'")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.url, args.root)
+    elif args.command == "launch":
+        launch(os.path.abspath(args.root), args.url, args.workers, args.base_port)
+    else:
+        print(f"Moved {reshard(args.root, args.old_dirs.split(os.pathsep))} files")
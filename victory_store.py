@@ -0,0 +1,866 @@
+# SQLite-backed store for the master user table (replaces master_users.csv rewrites)
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+import victory_cache
+import victory_fileio
+
+# Columns of the master table, in the order the app has always used
+MASTER_COLUMNS = ["Sl.no", "User Number", "Name", "Username", "Email", "Password", "Assigned", "Spoke", "Tried", "SF"]
+STAT_COLUMNS = ["Assigned", "Spoke", "Tried", "SF"]
+TEXT_COLUMNS = ["User Number", "Name", "Username", "Email", "Password"]
+
+# Master CSV column name -> SQLite column name
+SQL_COLUMNS = {
+    "Sl.no": "sl_no",
+    "User Number": "user_number",
+    "Name": "name",
+    "Username": "username",
+    "Email": "email",
+    "Password": "password",
+    "Assigned": "assigned",
+    "Spoke": "spoke",
+    "Tried": "tried",
+    "SF": "sf",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sl_no INTEGER,
+    user_number TEXT,
+    name TEXT,
+    username TEXT,
+    email TEXT,
+    password TEXT,
+    assigned INTEGER NOT NULL DEFAULT 0,
+    spoke INTEGER NOT NULL DEFAULT 0,
+    tried INTEGER NOT NULL DEFAULT 0,
+    sf INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_email ON users(email);
+CREATE INDEX IF NOT EXISTS users_username ON users(username);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS user_summary (
+    email TEXT PRIMARY KEY,
+    total_rows INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    min_completed INTEGER,
+    max_completed INTEGER,
+    max_serial INTEGER,
+    source_signature TEXT,
+    last_modified REAL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    email TEXT NOT NULL,
+    sl_no INTEGER NOT NULL,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (email, sl_no)
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    claimed_by TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox(status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS change_feed (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    at REAL NOT NULL,
+    email TEXT,
+    stat TEXT NOT NULL,
+    delta INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS activity (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    at REAL NOT NULL,
+    email TEXT NOT NULL,
+    sl_no INTEGER NOT NULL,
+    old_status TEXT,
+    new_status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activity_email_at ON activity(email, at);
+CREATE TABLE IF NOT EXISTS activity_rollup (
+    email TEXT NOT NULL,
+    granularity TEXT NOT NULL,
+    period TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    first_calls INTEGER NOT NULL DEFAULT 0,
+    re_edits INTEGER NOT NULL DEFAULT 0,
+    spoke INTEGER NOT NULL DEFAULT 0,
+    tried INTEGER NOT NULL DEFAULT 0,
+    sf INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, period, email)
+);
+CREATE TABLE IF NOT EXISTS lead_keys (
+    lead_key TEXT NOT NULL,
+    email TEXT NOT NULL,
+    sl_no INTEGER NOT NULL,
+    PRIMARY KEY (lead_key, email, sl_no)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS lead_keys_owner ON lead_keys(email, sl_no);
+"""
+
+# Search index tables; the trigram tokenizer needs SQLite 3.34+, and on older versions search is turned off
+# instead of failing the whole app at startup
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_rows (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    sl_no INTEGER NOT NULL,
+    name TEXT COLLATE NOCASE,
+    phone TEXT,
+    membership TEXT COLLATE NOCASE,
+    designation TEXT,
+    org TEXT,
+    location TEXT,
+    status TEXT,
+    UNIQUE (email, sl_no)
+);
+CREATE INDEX IF NOT EXISTS search_rows_name ON search_rows(name);
+CREATE INDEX IF NOT EXISTS search_rows_location ON search_rows(location);
+CREATE INDEX IF NOT EXISTS search_rows_org ON search_rows(org);
+CREATE INDEX IF NOT EXISTS search_rows_status ON search_rows(status);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    name, phone, membership, designation, org, location,
+    content='search_rows', content_rowid='id', tokenize='trigram'
+);
+CREATE TABLE IF NOT EXISTS search_facets (
+    location TEXT NOT NULL,
+    org TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (location, org, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS search_name_words (
+    id INTEGER PRIMARY KEY,
+    word TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_words_fts USING fts5(
+    word, content='search_name_words', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS search_name_words_insert AFTER INSERT ON search_name_words BEGIN
+    INSERT INTO search_words_fts (rowid, word) VALUES (new.id, new.word);
+END;
+CREATE TRIGGER IF NOT EXISTS search_rows_insert AFTER INSERT ON search_rows BEGIN
+    INSERT INTO search_fts (rowid, name, phone, membership, designation, org, location)
+    VALUES (new.id, new.name, new.phone, new.membership, new.designation, new.org, new.location);
+    INSERT INTO search_facets (location, org, status, rows)
+    VALUES (COALESCE(new.location, ''), COALESCE(new.org, ''), COALESCE(new.status, ''), 1)
+    ON CONFLICT (location, org, status) DO UPDATE SET rows = rows + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS search_rows_delete AFTER DELETE ON search_rows BEGIN
+    INSERT INTO search_fts (search_fts, rowid, name, phone, membership, designation, org, location)
+    VALUES ('delete', old.id, old.name, old.phone, old.membership, old.designation, old.org, old.location);
+    UPDATE search_facets SET rows = rows - 1
+    WHERE location = COALESCE(old.location, '') AND org = COALESCE(old.org, '') AND status = COALESCE(old.status, '');
+END;
+CREATE TRIGGER IF NOT EXISTS search_rows_update AFTER UPDATE OF name, phone, membership, designation, org, location
+ON search_rows BEGIN
+    INSERT INTO search_fts (search_fts, rowid, name, phone, membership, designation, org, location)
+    VALUES ('delete', old.id, old.name, old.phone, old.membership, old.designation, old.org, old.location);
+    INSERT INTO search_fts (rowid, name, phone, membership, designation, org, location)
+    VALUES (new.id, new.name, new.phone, new.membership, new.designation, new.org, new.location);
+END;
+CREATE TRIGGER IF NOT EXISTS search_rows_facets_update AFTER UPDATE OF org, location, status ON search_rows BEGIN
+    UPDATE search_facets SET rows = rows - 1
+    WHERE location = COALESCE(old.location, '') AND org = COALESCE(old.org, '') AND status = COALESCE(old.status, '');
+    INSERT INTO search_facets (location, org, status, rows)
+    VALUES (COALESCE(new.location, ''), COALESCE(new.org, ''), COALESCE(new.status, ''), 1)
+    ON CONFLICT (location, org, status) DO UPDATE SET rows = rows + 1;
+END;
+"""
+
+# Whether this SQLite can build the search index
+SEARCH_AVAILABLE = sqlite3.sqlite_version_info >= (3, 34, 0)
+SEARCH_UNAVAILABLE_MESSAGE = (f"Search needs SQLite 3.34 or newer for its trigram index; this Python links "
+                              f"SQLite {sqlite3.sqlite_version}.")
+
+# Columns of the per-user summary index
+SUMMARY_COLUMNS = ["total_rows", "completed", "min_completed", "max_completed", "max_serial",
+                   "source_signature", "last_modified", "updated_at"]
+
+DB_PATH = "master_users.db"
+
+# Change feed rows kept for dashboards that are catching up; older rows are pruned
+FEED_MAX_ROWS = 10000
+
+# User data column -> search_rows column; status changes on every submit and is not full-text indexed
+SEARCH_COLUMNS = {
+    "Name": "name",
+    "Phone Number": "phone",
+    "Membershipnumber": "membership",
+    "Designation": "designation",
+    "Org": "org",
+    "Location": "location",
+    "S/T/SF": "status",
+}
+
+# Lead keys looked up per query (kept under SQLite's bound parameter limit)
+LEAD_LOOKUP_BATCH = 500
+
+# Search rows added between runs of PRAGMA optimize
+OPTIMIZE_AFTER_SEARCH_ROWS = 50000
+
+# Feed stat recorded when the users table changed in a way deltas cannot describe (import, new user)
+FEED_RESET = "*"
+
+_local = threading.local()
+_initialized = set()
+_init_lock = threading.Lock()
+_search_rows_since_optimize = 0
+
+
+# Function to get this thread's connection to the store
+def connect():
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conns[DB_PATH] = conn
+    return conn
+
+
+# Context manager running a block inside a write transaction
+class transaction:
+    def __enter__(self):
+        self.conn = connect()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+# Columns added to existing tables after they were first shipped, as (table, column, definition)
+ADDED_COLUMNS = [("outbox", "claimed_by", "TEXT"), ("outbox", "lease_until", "REAL")]
+
+
+# Function to add the ADDED_COLUMNS a store created by an older release lacks
+def _add_missing_columns(conn):
+    for table, column, definition in ADDED_COLUMNS:
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# Function to open the store, creating tables and migrating the master CSV once
+def init_master_store(db_path, csv_path):
+    global DB_PATH
+    DB_PATH = db_path
+    if db_path in _initialized:
+        return
+    with _init_lock:
+        if db_path in _initialized:
+            return
+        connect().executescript(SCHEMA)
+        if SEARCH_AVAILABLE:
+            connect().executescript(SEARCH_SCHEMA)
+        with transaction() as conn:
+            _add_missing_columns(conn)
+            migrated = conn.execute("SELECT value FROM meta WHERE key = 'csv_migrated'").fetchone()
+            if migrated is None:
+                if os.path.exists(csv_path):
+                    _insert_rows(conn, _read_master_csv(csv_path))
+                conn.execute("INSERT INTO meta (key, value) VALUES ('csv_migrated', ?)", (csv_path,))
+        _initialized.add(db_path)
+
+
+# Function to read a legacy master CSV into the canonical column layout
+def _read_master_csv(csv_path):
+    df = pd.read_csv(csv_path, dtype={col: str for col in TEXT_COLUMNS})
+    return _normalize(df)
+
+
+# Function to coerce a master DataFrame to the canonical columns and types
+def _normalize(master_df):
+    df = master_df.reindex(columns=MASTER_COLUMNS)
+    for col in STAT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
+    df["Sl.no"] = pd.to_numeric(df["Sl.no"], errors="coerce")
+    return df
+
+
+# Function to insert master rows, preserving their order
+def _insert_rows(conn, master_df):
+    columns = ", ".join(SQL_COLUMNS[col] for col in MASTER_COLUMNS)
+    placeholders = ", ".join("?" for _ in MASTER_COLUMNS)
+    records = [
+        tuple(None if pd.isna(value) else (value.item() if hasattr(value, "item") else value) for value in row)
+        for row in master_df[MASTER_COLUMNS].itertuples(index=False, name=None)
+    ]
+    conn.executemany(f"INSERT INTO users ({columns}) VALUES ({placeholders})", records)
+
+
+# Function to read the version of the users table (bumped by every write to it)
+def master_version(conn=None):
+    row = (conn or connect()).execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+# Function to bump the users table version inside a write transaction; returns (old, new)
+def _bump_version(conn):
+    old = master_version(conn)
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(old + 1),))
+    return old, old + 1
+
+
+# Function to read the version of the summary index (bumped by every write to it)
+def summary_version(conn=None):
+    row = (conn or connect()).execute("SELECT value FROM meta WHERE key = 'summary_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+# Function to bump the summary index version inside a write transaction
+def _bump_summary_version(conn):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('summary_version', ?)",
+                 (str(summary_version(conn) + 1),))
+
+
+# Function to read the (users table, summary index) versions the admin views are derived from, in one query
+def data_version():
+    versions = dict(connect().execute(
+        "SELECT key, value FROM meta WHERE key IN ('version', 'summary_version')").fetchall())
+    return int(versions.get("version", 0)), int(versions.get("summary_version", 0))
+
+
+# Function to read the credentials version, bumped only when usernames, emails or passwords change
+def credentials_version(conn=None):
+    row = (conn or connect()).execute("SELECT value FROM meta WHERE key = 'credentials_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+# Function to bump the credentials version inside a write transaction; returns (old, new)
+def _bump_credentials(conn):
+    old = credentials_version(conn)
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('credentials_version', ?)", (str(old + 1),))
+    return old, old + 1
+
+
+# Function to read every user's (username, email, password) in table order
+def load_credentials():
+    return connect().execute("SELECT username, email, password FROM users ORDER BY id").fetchall()
+
+
+# Function to append stat changes, as (email, stat, delta), to the change feed inside a write transaction
+def _record_changes(conn, changes):
+    now = time.time()
+    conn.executemany("INSERT INTO change_feed (at, email, stat, delta) VALUES (?, ?, ?, ?)",
+                     [(now, email, stat, int(delta)) for email, stat, delta in changes])
+    last = conn.execute("SELECT MAX(seq) FROM change_feed").fetchone()[0]
+    conn.execute("DELETE FROM change_feed WHERE seq <= ?", (last - FEED_MAX_ROWS,))
+
+
+# Function to get the sequence number of the latest change feed entry
+def feed_position():
+    return connect().execute("SELECT COALESCE(MAX(seq), 0) FROM change_feed").fetchone()[0]
+
+
+# Function to read the change feed after a sequence number; returns (rows of (seq, email, stat, delta), oldest seq kept)
+def read_feed(after_seq):
+    conn = connect()
+    oldest = conn.execute("SELECT COALESCE(MIN(seq), 0) FROM change_feed").fetchone()[0]
+    rows = conn.execute("SELECT seq, email, stat, delta FROM change_feed WHERE seq > ? ORDER BY seq",
+                        (after_seq,)).fetchall()
+    return rows, oldest
+
+
+# Function to key the master table in the shared frame cache
+def _master_cache_key():
+    return ("master", DB_PATH)
+
+
+# Function to read the whole master table from SQLite
+def _read_master():
+    columns = ", ".join(SQL_COLUMNS[col] for col in MASTER_COLUMNS)
+    rows = connect().execute(f"SELECT {columns} FROM users ORDER BY id").fetchall()
+    return pd.DataFrame(rows, columns=MASTER_COLUMNS)
+
+
+# Function to load the whole master table as a DataFrame (served from the frame cache while unchanged)
+def load_master():
+    return victory_cache.frame_cache.get(_master_cache_key(), master_version(), _read_master)
+
+
+# Function to replace the whole master table (bulk edits and imports)
+def replace_master(master_df):
+    with transaction() as conn:
+        conn.execute("DELETE FROM users")
+        _insert_rows(conn, _normalize(master_df))
+        _bump_version(conn)
+        _bump_credentials(conn)
+        _record_changes(conn, [(None, FEED_RESET, 0)])
+    victory_cache.frame_cache.invalidate(_master_cache_key())
+    victory_cache.invalidate_derived("master")
+
+
+# Function to read the master table and the change feed position from one consistent snapshot
+def load_master_at_feed_position():
+    conn = connect()
+    conn.execute("BEGIN")
+    try:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_feed").fetchone()[0]
+        master_df = _read_master()
+    finally:
+        conn.execute("COMMIT")
+    return master_df, seq
+
+
+# Function to add a user row; returns the new serial number
+def add_user(name, username, email, password):
+    with transaction() as conn:
+        sl_no = conn.execute("SELECT COALESCE(MAX(sl_no), 0) + 1 FROM users").fetchone()[0]
+        conn.execute(
+            "INSERT INTO users (sl_no, user_number, name, username, email, password) VALUES (?, ?, ?, ?, ?, ?)",
+            (sl_no, f"user{sl_no}", name, username, email, password))
+        _bump_version(conn)
+        _bump_credentials(conn)
+        _record_changes(conn, [(email, FEED_RESET, 0)])
+    victory_cache.frame_cache.invalidate(_master_cache_key())
+    victory_cache.invalidate_derived("master")
+    return sl_no
+
+
+# Function to set the stored password (hash) of the first user with this username;
+# returns (updated, (old, new) credentials version)
+def set_password(username, password):
+    with transaction() as conn:
+        cursor = conn.execute(
+            "UPDATE users SET password = ? WHERE id = (SELECT MIN(id) FROM users WHERE username = ?)",
+            (password, username))
+        _bump_version(conn)
+        versions = _bump_credentials(conn)
+    victory_cache.frame_cache.invalidate(_master_cache_key())
+    victory_cache.invalidate_derived("master")
+    return cursor.rowcount > 0, versions
+
+
+# Function to apply a batch of (email, column, delta) increments in one transaction; returns whether each hit a user
+def _commit_increments(items):
+    updated = []
+    with transaction() as conn:
+        for email, column, delta in items:
+            sql_column = SQL_COLUMNS[column]
+            cursor = conn.execute(
+                f"UPDATE users SET {sql_column} = {sql_column} + ? WHERE id = (SELECT MIN(id) FROM users WHERE email = ?)",
+                (int(delta), email))
+            updated.append(cursor.rowcount > 0)
+        conn.executemany("UPDATE user_summary SET updated_at = ? WHERE email = ?",
+                         [(time.time(), email) for email in {item[0] for item in items}])
+        old_version, new_version = _bump_version(conn)
+        _record_changes(conn, items)
+
+    # Write the increments through to the cached master frame instead of reloading it
+    def apply_increments(master_df):
+        for email, column, delta in items:
+            rows = master_df.index[master_df["Email"] == email]
+            if len(rows):
+                master_df.at[rows[0], column] += int(delta)
+        return master_df
+
+    victory_cache.frame_cache.patch(_master_cache_key(), old_version, new_version, apply_increments)
+    victory_cache.invalidate_derived("master")
+    return updated
+
+
+# Concurrent increments (one per submitted call) are committed together rather than one transaction each
+_increment_committer = victory_fileio.GroupCommitter(_commit_increments)
+
+
+# Function to atomically add delta to one of Assigned/Spoke/Tried/SF for a user (by email)
+def increment_stat(email, column, delta):
+    if column not in STAT_COLUMNS:
+        raise ValueError(f"Unknown stat column: {column}")
+    return _increment_committer.submit((email, column, int(delta)))
+
+
+# Function to add deltas to one stat column for many users in a single transaction; deltas is {email: delta}
+def increment_many(column, deltas):
+    if column not in STAT_COLUMNS:
+        raise ValueError(f"Unknown stat column: {column}")
+    if not deltas:
+        return
+    sql_column = SQL_COLUMNS[column]
+    with transaction() as conn:
+        conn.executemany(
+            f"UPDATE users SET {sql_column} = {sql_column} + ? WHERE id = (SELECT MIN(id) FROM users WHERE email = ?)",
+            [(int(delta), email) for email, delta in deltas.items()])
+        conn.executemany("UPDATE user_summary SET updated_at = ? WHERE email = ?",
+                         [(time.time(), email) for email in deltas])
+        _bump_version(conn)
+        changes = [(email, column, delta) for email, delta in deltas.items()]
+        _record_changes(conn, changes)
+    victory_cache.frame_cache.invalidate(_master_cache_key())
+    victory_cache.invalidate_derived("master")
+
+
+# Function to store a freshly computed summary for one user
+def set_user_summary(email, summary, source_signature, last_modified):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO user_summary (email, total_rows, completed, min_completed, max_completed, "
+            "max_serial, source_signature, last_modified, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (email, summary["total_rows"], summary["completed"], summary["min_completed"],
+             summary["max_completed"], summary["max_serial"], source_signature, last_modified, time.time()))
+        _bump_summary_version(conn)
+    victory_cache.invalidate_derived("summaries")
+
+
+# Function to fold one submitted row into a user's summary without rescanning their data; the row's submitted
+# values reach its search row in the same transaction
+def record_completion(email, sl_no, newly_completed, source_signature, last_modified, values=None):
+    with transaction() as conn:
+        if values:
+            _update_search_rows(conn, email, {sl_no: values})
+        conn.execute(
+            "UPDATE user_summary SET completed = completed + ?, "
+            "min_completed = MIN(COALESCE(min_completed, ?), ?), "
+            "max_completed = MAX(COALESCE(max_completed, ?), ?), "
+            "source_signature = ?, last_modified = ?, updated_at = ? WHERE email = ?",
+            (1 if newly_completed else 0, sl_no, sl_no, sl_no, sl_no,
+             source_signature, last_modified, time.time(), email))
+        _bump_summary_version(conn)
+    victory_cache.invalidate_derived("summaries")
+
+
+# Function to fold appended rows into a user's summary without rescanning their data
+def record_append(email, added, source_signature, last_modified):
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE user_summary SET total_rows = total_rows + ?, completed = completed + ?, "
+            "min_completed = CASE WHEN ? IS NULL THEN min_completed ELSE MIN(COALESCE(min_completed, ?), ?) END, "
+            "max_completed = CASE WHEN ? IS NULL THEN max_completed ELSE MAX(COALESCE(max_completed, ?), ?) END, "
+            "max_serial = CASE WHEN ? IS NULL THEN max_serial ELSE MAX(COALESCE(max_serial, ?), ?) END, "
+            "source_signature = ?, last_modified = ?, updated_at = ? WHERE email = ?",
+            (added["total_rows"], added["completed"],
+             added["min_completed"], added["min_completed"], added["min_completed"],
+             added["max_completed"], added["max_completed"], added["max_completed"],
+             added["max_serial"], added["max_serial"], added["max_serial"],
+             source_signature, last_modified, time.time(), email))
+        _bump_summary_version(conn)
+    victory_cache.invalidate_derived("summaries")
+
+
+# Function to fold rows removed from a serial range into a user's summary; the completed bounds are
+# only known to be intact when they lie outside the range, otherwise the summary is left to be rebuilt.
+# max_serial stays as the high-water mark so freed serials are not handed out again
+def record_removal(email, removed, start, end, source_signature, last_modified):
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE user_summary SET total_rows = MAX(total_rows - ?, 0), completed = MAX(completed - ?, 0), "
+            "source_signature = CASE WHEN ? > 0 AND (min_completed BETWEEN ? AND ? OR max_completed BETWEEN ? AND ?) "
+            "THEN '' ELSE ? END, last_modified = ?, updated_at = ? WHERE email = ?",
+            (removed["total_rows"], removed["completed"], removed["completed"], start, end, start, end,
+             source_signature, last_modified, time.time(), email))
+        _bump_summary_version(conn)
+    victory_cache.invalidate_derived("summaries")
+
+
+# Function to move k Assigned from one user to another and mark the reallocation done, in one transaction;
+# the lead keys and search rows of the source's serial range move to the target with their new serials in the
+# same transaction
+def commit_reallocation(realloc_id, from_email, to_email, moved, serial_range=None, lead_keys=(), search_rows=()):
+    with transaction() as conn:
+        if serial_range is not None:
+            for table in ("lead_keys", "search_rows") if SEARCH_AVAILABLE else ("lead_keys",):
+                conn.execute(f"DELETE FROM {table} WHERE email = ? AND sl_no BETWEEN ? AND ?",
+                             (from_email, int(serial_range[0]), int(serial_range[1])))
+        _insert_lead_keys(conn, to_email, lead_keys)
+        _upsert_search_rows(conn, to_email, search_rows)
+        conn.executemany(
+            "UPDATE users SET assigned = assigned + ? WHERE id = (SELECT MIN(id) FROM users WHERE email = ?)",
+            [(-int(moved), from_email), (int(moved), to_email)])
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"realloc_done:{realloc_id}", "1"))
+        _bump_version(conn)
+        _bump_lead_index_version(conn)
+        changes = [(from_email, "Assigned", -int(moved)), (to_email, "Assigned", int(moved))]
+        _record_changes(conn, changes)
+    victory_cache.frame_cache.invalidate(_master_cache_key())
+    victory_cache.invalidate_derived("master")
+
+
+# Function to check whether a journaled reallocation reached its commit
+def reallocation_committed(realloc_id):
+    row = connect().execute("SELECT value FROM meta WHERE key = ?", (f"realloc_done:{realloc_id}",)).fetchone()
+    return row is not None
+
+
+# Function to drop the done marker of a reallocation whose journal is gone
+def forget_reallocation(realloc_id):
+    with transaction() as conn:
+        conn.execute("DELETE FROM meta WHERE key = ?", (f"realloc_done:{realloc_id}",))
+
+
+# Function to map the unexpired leased serials of a user to the session holding them
+def active_leases(email):
+    rows = connect().execute("SELECT sl_no, holder FROM leases WHERE email = ? AND expires_at > ?",
+                             (email, time.time())).fetchall()
+    return dict(rows)
+
+
+# Function to make serials the holder's lease set for a user, replacing any leases it held before;
+# serials leased to another holder in the meantime are skipped. Returns the serials now held
+def claim_leases(email, holder, serials, ttl):
+    now = time.time()
+    with transaction() as conn:
+        conn.execute("DELETE FROM leases WHERE email = ? AND (expires_at <= ? OR holder = ?)", (email, now, holder))
+        conn.executemany("INSERT OR IGNORE INTO leases (email, sl_no, holder, expires_at) VALUES (?, ?, ?, ?)",
+                         [(email, int(serial), holder, now + ttl) for serial in serials])
+        rows = conn.execute("SELECT sl_no FROM leases WHERE email = ? AND holder = ? ORDER BY sl_no",
+                            (email, holder)).fetchall()
+    return [row[0] for row in rows]
+
+
+# Function to release a holder's leases on a user (all of them when serials is None)
+def release_leases(email, holder, serials=None):
+    with transaction() as conn:
+        if serials is None:
+            conn.execute("DELETE FROM leases WHERE email = ? AND holder = ?", (email, holder))
+        else:
+            conn.executemany("DELETE FROM leases WHERE email = ? AND holder = ? AND sl_no = ?",
+                             [(email, holder, int(serial)) for serial in serials])
+
+
+# Function to read the version of the lead key index (bumped by every write to it)
+def lead_index_version(conn=None):
+    row = (conn or connect()).execute("SELECT value FROM meta WHERE key = 'lead_index_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+# Function to bump the lead key index version inside a write transaction
+def _bump_lead_index_version(conn):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('lead_index_version', ?)",
+                 (str(lead_index_version(conn) + 1),))
+
+
+# Function to insert (lead key, Sl.no) pairs held by a user
+def _insert_lead_keys(conn, email, lead_keys):
+    conn.executemany("INSERT OR IGNORE INTO lead_keys (lead_key, email, sl_no) VALUES (?, ?, ?)",
+                     [(key, email, int(sl_no)) for key, sl_no in lead_keys])
+
+
+# Function to record the lead keys of rows allocated to a user
+def add_lead_keys(email, lead_keys):
+    with transaction() as conn:
+        _insert_lead_keys(conn, email, lead_keys)
+        _bump_lead_index_version(conn)
+
+
+# Function to make lead_keys the whole set of a user's lead keys (after their whole allocation was rewritten);
+# only the keys that differ from the stored ones are written, and the index version moves only when one does
+def replace_lead_keys(email, lead_keys):
+    wanted = {(key, int(sl_no)) for key, sl_no in lead_keys}
+    with transaction() as conn:
+        stored = set(conn.execute("SELECT lead_key, sl_no FROM lead_keys WHERE email = ?", (email,)).fetchall())
+        removed, added = stored - wanted, wanted - stored
+        conn.executemany("DELETE FROM lead_keys WHERE lead_key = ? AND email = ? AND sl_no = ?",
+                         [(key, email, sl_no) for key, sl_no in removed])
+        _insert_lead_keys(conn, email, added)
+        if removed or added:
+            _bump_lead_index_version(conn)
+
+
+# Function to find who holds any of the given lead keys; returns (lead key, email, Sl.no) rows.
+# Each key is a primary key lookup, so the cost follows the number of keys asked about
+def find_lead_keys(lead_keys):
+    lead_keys = list(dict.fromkeys(lead_keys))
+    conn = connect()
+    rows = []
+    for i in range(0, len(lead_keys), LEAD_LOOKUP_BATCH):
+        batch = lead_keys[i:i + LEAD_LOOKUP_BATCH]
+        rows += conn.execute(f"SELECT lead_key, email, sl_no FROM lead_keys WHERE lead_key IN "
+                             f"({', '.join('?' for _ in batch)})", batch).fetchall()
+    return rows
+
+
+# Function to check whether the lead key index has been backfilled from the users' files
+def lead_index_built():
+    row = connect().execute("SELECT value FROM meta WHERE key = 'lead_index_built'").fetchone()
+    return row is not None
+
+
+# Function to empty the lead key index ahead of a backfill
+def reset_lead_index():
+    with transaction() as conn:
+        conn.execute("DELETE FROM lead_keys")
+        conn.execute("DELETE FROM meta WHERE key = 'lead_index_built'")
+        _bump_lead_index_version(conn)
+
+
+# Function to mark the lead key index as backfilled
+def mark_lead_index_built():
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('lead_index_built', ?)", (str(time.time()),))
+        _bump_lead_index_version(conn)
+
+
+# Function to add the words of names to the name vocabulary fuzzy search matches against (words are
+# never removed; a word no row has any more only costs a lookup)
+def _add_name_words(conn, names):
+    words = {word for name in names if isinstance(name, str) for word in name.lower().split()}
+    conn.executemany("INSERT OR IGNORE INTO search_name_words (word) VALUES (?)", [(word,) for word in words])
+
+
+# Function to insert or replace search rows, given as tuples of Sl.no then the SEARCH_COLUMNS values (every
+# search write is skipped when SEARCH_AVAILABLE is off)
+def _upsert_search_rows(conn, email, rows):
+    if not SEARCH_AVAILABLE:
+        return
+    columns = list(SEARCH_COLUMNS.values())
+    rows = [(email, int(row[0])) + tuple(row[1:]) for row in rows]
+    conn.executemany(
+        f"INSERT INTO search_rows (email, sl_no, {', '.join(columns)}) "
+        f"VALUES (?, ?, {', '.join('?' for _ in columns)}) ON CONFLICT (email, sl_no) DO UPDATE SET "
+        + ", ".join(f"{col} = excluded.{col}" for col in columns), rows)
+    _add_name_words(conn, (row[2] for row in rows))
+
+
+# Function to turn a value into the text search_rows stores for it (missing values are NULL)
+def _search_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return None if pd.isna(value) else str(value)
+
+
+# Function to set changed columns of existing search rows; changes is a list of (Sl.no, {search_rows column:
+# value}). Rows changing the same columns share one statement, and only a change to a full-text column
+# rewrites the row's search_fts entry
+def _set_search_columns(conn, email, changes):
+    by_columns = {}
+    for sl_no, changed in changes:
+        by_columns.setdefault(tuple(changed), []).append(list(changed.values()) + [email, int(sl_no)])
+    for columns, params in by_columns.items():
+        conn.executemany(f"UPDATE search_rows SET {', '.join(f'{col} = ?' for col in columns)} "
+                         "WHERE email = ? AND sl_no = ?", params)
+    _add_name_words(conn, (changed["name"] for _, changed in changes if "name" in changed))
+
+
+# Function to add or refresh the search rows of rows allocated to a user; every OPTIMIZE_AFTER_SEARCH_ROWS rows
+# written, PRAGMA optimize refreshes the planner statistics if the table has grown enough to need it
+def add_search_rows(email, rows):
+    global _search_rows_since_optimize
+    with transaction() as conn:
+        _upsert_search_rows(conn, email, rows)
+    _search_rows_since_optimize += len(rows)
+    if _search_rows_since_optimize >= OPTIMIZE_AFTER_SEARCH_ROWS:
+        _search_rows_since_optimize = 0
+        connect().execute("PRAGMA optimize")
+
+
+# Function to make rows the whole set of a user's search rows (after their whole allocation was rewritten);
+# the rows are compared with the stored ones so only removed, added and changed rows are written
+def replace_search_rows(email, rows):
+    if not SEARCH_AVAILABLE:
+        return
+    columns = list(SEARCH_COLUMNS.values())
+    wanted = {int(row[0]): tuple(_search_text(value) for value in row[1:]) for row in rows}
+    with transaction() as conn:
+        stored = {row[0]: row[1:] for row in conn.execute(
+            f"SELECT sl_no, {', '.join(columns)} FROM search_rows WHERE email = ?", (email,))}
+        conn.executemany("DELETE FROM search_rows WHERE email = ? AND sl_no = ?",
+                         [(email, sl_no) for sl_no in stored.keys() - wanted.keys()])
+        _upsert_search_rows(conn, email, [(sl_no,) + values for sl_no, values in wanted.items() if sl_no not in stored])
+        _set_search_columns(conn, email, [
+            (sl_no, {col: new for col, old, new in zip(columns, stored[sl_no], values) if old != new})
+            for sl_no, values in wanted.items() if sl_no in stored and stored[sl_no] != values])
+
+
+# Function to apply row edits to the search rows inside a write transaction; updates maps Sl.no -> {user data
+# column: value}. Columns that are not searched, and values equal to the stored ones, are skipped
+def _update_search_rows(conn, email, updates):
+    if not SEARCH_AVAILABLE:
+        return
+    changes = []
+    for sl_no, values in updates.items():
+        edited = {SEARCH_COLUMNS[col]: _search_text(value) for col, value in values.items() if col in SEARCH_COLUMNS}
+        if not edited:
+            continue
+        stored = conn.execute(f"SELECT {', '.join(edited)} FROM search_rows WHERE email = ? AND sl_no = ?",
+                              (email, int(sl_no))).fetchone()
+        if stored is not None:
+            changed = {col: value for (col, value), old in zip(edited.items(), stored) if value != old}
+            if changed:
+                changes.append((sl_no, changed))
+    _set_search_columns(conn, email, changes)
+
+
+# Function to apply row edits to the search rows; updates maps Sl.no -> {user data column: value}
+def update_search_rows(email, updates):
+    with transaction() as conn:
+        _update_search_rows(conn, email, updates)
+
+
+# Function to check whether the search index has been backfilled from the users' files
+def search_index_built():
+    row = connect().execute("SELECT value FROM meta WHERE key = 'search_index_built'").fetchone()
+    return row is not None
+
+
+# Function to empty the search index ahead of a backfill
+def reset_search_index():
+    if not SEARCH_AVAILABLE:
+        return
+    with transaction() as conn:
+        conn.execute("DELETE FROM search_rows")
+        conn.execute("DELETE FROM search_facets")
+        conn.execute("DELETE FROM search_name_words")
+        conn.execute("INSERT INTO search_words_fts (search_words_fts) VALUES ('delete-all')")
+        conn.execute("DELETE FROM meta WHERE key = 'search_index_built'")
+
+
+# Function to mark the search index as backfilled, gathering the planner statistics facet browsing relies on
+def mark_search_index_built():
+    if not SEARCH_AVAILABLE:
+        return
+    connect().execute("ANALYZE search_rows")
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('search_index_built', ?)", (str(time.time()),))
+
+
+# Function to load the summary index as a DataFrame indexed by email
+def load_user_summaries():
+    rows = connect().execute(f"SELECT email, {', '.join(SUMMARY_COLUMNS)} FROM user_summary").fetchall()
+    return pd.DataFrame(rows, columns=["Email"] + SUMMARY_COLUMNS).set_index("Email")
+
+
+# Function to export the master table back to a CSV file
+def export_master_csv(csv_path):
+    victory_fileio.write_csv(load_master(), csv_path, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the Victory master user store")
+    parser.add_argument("command", choices=["migrate", "export"])
+    parser.add_argument("--db", default="master_users.db")
+    parser.add_argument("--csv", default="master_users.csv")
+    args = parser.parse_args()
+
+    init_master_store(args.db, args.csv)
+    if args.command == "export":
+        export_master_csv(args.csv)
+        print(f"Exported master data to {args.csv}")
+    else:
+        print(f"Master store ready at {args.db}")
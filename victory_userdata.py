@@ -0,0 +1,839 @@
+# Per-user allocation storage: a base CSV plus an append-only change log
+import bisect
+import csv
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import victory_cache
+import victory_fileio
+import victory_metrics
+import victory_schema
+import victory_store
+
+# Directories holding <email>.csv and <email>.log, users spread across them by a hash of their email
+# (VICTORY_USER_DATA_DIRS, separated by os.pathsep); the first also holds reallocation journals
+USER_DATA_DIRS = [d for d in os.environ.get("VICTORY_USER_DATA_DIRS", "").split(os.pathsep) if d] or ["user_data"]
+USER_DATA_DIR = USER_DATA_DIRS[0]
+
+# Columns of a user's allocation file
+USER_DATA_COLUMNS = ['Sl.no', 'Name', 'Phone Number', 'Membershipnumber', 'Sex', 'Designation', 'Org', 'Location',
+                     'S/T/SF', 'Regards', 'New Location']
+
+# Columns identifying the same lead across allocations -> prefix of their keys in the lead index
+LEAD_KEY_COLUMNS = {'Membershipnumber': 'M', 'Phone Number': 'P'}
+
+# Phone numbers are compared on their last digits so +91 and trunk-0 prefixes still match
+PHONE_KEY_DIGITS = 10
+
+# Fold the change log into the base CSV once it grows past this many bytes
+COMPACT_AFTER_BYTES = 256 * 1024
+
+_locks_guard = threading.Lock()
+_compaction_queue = queue.Queue()
+_compaction_pending = set()
+_compaction_thread = None
+
+# Reallocations this process is running, skipped by recovery even where flock is unavailable
+_active_reallocations = set()
+
+log = logging.getLogger(__name__)
+
+
+# Function to get the data directory a user's files live in
+def user_data_dir(email):
+    if len(USER_DATA_DIRS) == 1:
+        return USER_DATA_DIR
+    digest = hashlib.blake2b(email.encode("utf-8"), digest_size=8).digest()
+    return USER_DATA_DIRS[int.from_bytes(digest, "big") % len(USER_DATA_DIRS)]
+
+
+# Function to get the path of a user's base CSV
+def user_data_path(email):
+    return os.path.join(user_data_dir(email), f"{email}.csv")
+
+
+# Function to get the path of a user's change log
+def change_log_path(email):
+    return os.path.join(user_data_dir(email), f"{email}.log")
+
+
+# Function to get the lock serializing access to one user's files, across threads and server processes
+def _lock_for(email):
+    return victory_fileio.file_lock(user_data_path(email))
+
+
+# Function to parse change log bytes into entries, ignoring a torn last line
+def _parse_log(content):
+    entries = []
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries
+
+
+# Function to read every entry of a user's change log
+def read_change_log(email):
+    log_path = change_log_path(email)
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, "rb") as f:
+        content = f.read()
+    victory_metrics.count("bytes_read", len(content))
+    return _parse_log(content)
+
+
+# Function to apply a batch of "set" entries (row edits by Sl.no); a column an entry sets to None is cleared,
+# while columns no entry names keep their values
+def _apply_sets(data, entries):
+    changes = {}
+    for entry in entries:
+        changes.setdefault(entry["Sl.no"], {}).update(entry["values"])
+
+    changed = pd.DataFrame.from_dict(changes, orient="index")
+    touched = pd.DataFrame.from_dict({sl_no: dict.fromkeys(values, True) for sl_no, values in changes.items()},
+                                     orient="index").notna()
+    rows = data["Sl.no"][data["Sl.no"].isin(changed.index)]
+    for col in changed.columns:
+        if col not in data.columns:
+            data[col] = None
+        values = pd.Series(changed[col].reindex(rows.to_numpy()).to_numpy(), index=rows.index)
+        victory_schema.set_values(data, col, values[touched[col].reindex(rows.to_numpy()).to_numpy()])
+    return data
+
+
+# Function to apply a batch of "insert" entries (rows reallocated to this user)
+def _apply_inserts(data, entries):
+    inserted = [pd.DataFrame(entry["rows"]) for entry in entries if entry["rows"]]
+    if not inserted:
+        return data
+    return pd.concat([data] + inserted, ignore_index=True)
+
+
+# Function to apply a batch of "delete" entries (Sl.no ranges reallocated away from this user)
+def _apply_deletes(data, entries):
+    serials = pd.to_numeric(data["Sl.no"], errors="coerce")
+    removed = pd.Series(False, index=data.index)
+    for entry in entries:
+        removed |= serials.between(entry["from"], entry["to"])
+    return data[~removed].reset_index(drop=True)
+
+
+_APPLY_OPS = {"set": _apply_sets, "insert": _apply_inserts, "delete": _apply_deletes}
+
+
+# Function to apply change log entries on top of a user's base data, in log order
+def apply_changes(data, entries):
+    batch = []
+    for entry in entries + [None]:
+        if batch and (entry is None or entry.get("op") != batch[0].get("op")):
+            data = _APPLY_OPS[batch[0]["op"]](data, batch)
+            batch = []
+        if entry is not None and entry.get("op") in _APPLY_OPS:
+            batch.append(entry)
+    # Inserted rows arrive untyped; restore the declared dtypes
+    return victory_schema.apply_schema(data)
+
+
+# Function to get the (signature, last-modified time) of a user's base CSV and change log
+def files_signature(email):
+    parts = []
+    last_modified = 0.0
+    for path in (user_data_path(email), change_log_path(email)):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            parts.append("-")
+            continue
+        parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        last_modified = max(last_modified, stat.st_mtime)
+    return "|".join(parts), last_modified
+
+
+# Function to compute a user's summary (completed count and serial ranges) from their data
+def summarize(data):
+    summary = {"total_rows": len(data), "completed": 0, "min_completed": None, "max_completed": None,
+               "max_serial": None}
+    if data.empty:
+        return summary
+    serials = pd.to_numeric(data["Sl.no"], errors="coerce")
+    if serials.notna().any():
+        summary["max_serial"] = int(serials.max())
+    if "S/T/SF" in data.columns:
+        completed = serials[data["S/T/SF"].notna()]
+        summary["completed"] = int(len(completed))
+        if completed.notna().any():
+            summary["min_completed"] = int(completed.min())
+            summary["max_completed"] = int(completed.max())
+    return summary
+
+
+# Function to recompute and store a user's summary
+def refresh_summary(email, data=None):
+    if data is None:
+        data = load_user_data(email)
+    signature, last_modified = files_signature(email)
+    victory_store.set_user_summary(email, summarize(data), signature, last_modified)
+
+
+# Function to load the summaries of the given users, rebuilding any that are missing or stale
+def load_user_summaries(emails):
+    summaries = victory_store.load_user_summaries()
+    rebuilt = False
+    for email in emails:
+        signature, _ = files_signature(email)
+        if email not in summaries.index or summaries.at[email, "source_signature"] != signature:
+            refresh_summary(email)
+            rebuilt = True
+    if rebuilt:
+        summaries = victory_store.load_user_summaries()
+    return summaries
+
+
+# Function to reduce phone numbers to their digits (numbers read as floats lose their ".0")
+def phone_digits(values):
+    return values.astype("string").str.strip().str.replace(r"\.0$", "", regex=True).str.replace(r"\D", "", regex=True)
+
+
+# Function to normalize one column of membership or phone numbers for matching (missing values stay NA)
+def normalize_lead_values(values, column):
+    if column == 'Phone Number':
+        text = phone_digits(values).str[-PHONE_KEY_DIGITS:]
+    else:
+        text = values.astype("string").str.strip().str.upper()
+    return text.mask(text == "")
+
+
+# Function to get the lead index keys of rows as (key, position) pairs; positions are the rows' serials
+# unless given (rows without a usable serial are left out)
+def lead_keys(rows, positions=None):
+    if positions is None:
+        positions = pd.to_numeric(rows['Sl.no'], errors="coerce") if 'Sl.no' in rows.columns else None
+    if positions is None:
+        return []
+    positions = pd.Series(positions, index=rows.index)
+    keys = []
+    for column, prefix in LEAD_KEY_COLUMNS.items():
+        if column not in rows.columns:
+            continue
+        values = normalize_lead_values(rows[column], column)
+        usable = values.notna() & positions.notna()
+        keys += zip((prefix + ":" + values[usable]).tolist(), positions[usable].astype(int).tolist())
+    return keys
+
+
+# Function to get the search index rows of rows: tuples of Sl.no then the victory_store.SEARCH_COLUMNS
+# values, phone numbers as digits (rows without a usable serial are left out)
+def search_records(rows):
+    if rows.empty or 'Sl.no' not in rows.columns:
+        return []
+    serials = pd.to_numeric(rows['Sl.no'], errors="coerce")
+    frame = pd.DataFrame({'Sl.no': serials}, index=rows.index)
+    for col in victory_store.SEARCH_COLUMNS:
+        values = rows[col] if col in rows.columns else pd.Series(None, index=rows.index, dtype=object)
+        if col == 'Phone Number':
+            values = phone_digits(values).mask(lambda digits: digits == "")
+        frame[col] = values.astype(object).where(values.notna(), None)
+    frame = frame[serials.notna()]
+    return list(zip(frame['Sl.no'].astype(int).tolist(), *(frame[col].tolist() for col in victory_store.SEARCH_COLUMNS)))
+
+
+# Function to backfill the search index from every given user's allocation
+def rebuild_search_index(emails):
+    victory_store.reset_search_index()
+    for email in emails:
+        victory_store.add_search_rows(email, search_records(load_user_data(email)))
+    victory_store.mark_search_index_built()
+
+
+# Function to backfill the lead index from every given user's allocation
+def rebuild_lead_index(emails):
+    victory_store.reset_lead_index()
+    for email in emails:
+        victory_store.add_lead_keys(email, lead_keys(load_user_data(email)))
+    victory_store.mark_lead_index_built()
+
+
+# Function to read a user's base CSV without the change log
+def load_base_data(email):
+    file_path = user_data_path(email)
+    if os.path.exists(file_path):
+        victory_metrics.count("bytes_read", os.path.getsize(file_path))
+        return victory_schema.apply_schema(pd.read_csv(file_path, dtype=victory_schema.read_csv_dtypes()))
+    return victory_schema.apply_schema(pd.DataFrame(columns=USER_DATA_COLUMNS))
+
+
+# Function to key a user's data in the shared frame cache
+def _cache_key(email):
+    return ("user", os.path.abspath(user_data_path(email)))
+
+
+# Function to read a user's base CSV and merge the change log into it
+def _read_user_data(email):
+    data = load_base_data(email)
+    entries = read_change_log(email)
+    if entries:
+        data = apply_changes(data, entries)
+    return data
+
+
+# Function to load a user's data with the change log merged in (served from the frame cache while unchanged)
+def load_user_data(email):
+    with _lock_for(email):
+        signature, _ = files_signature(email)
+        return victory_cache.frame_cache.get(_cache_key(email), signature, lambda: _read_user_data(email))
+
+
+# Function to overwrite a user's whole allocation (allocation and reallocation)
+def save_user_data(email, data):
+    data = victory_schema.apply_schema(data.copy())
+    with _lock_for(email):
+        victory_fileio.write_csv(data, user_data_path(email), index=False)
+        if os.path.exists(change_log_path(email)):
+            os.remove(change_log_path(email))
+        signature, _ = files_signature(email)
+        victory_cache.frame_cache.put(_cache_key(email), signature, data)
+        _pending_indexes[email] = PendingIndex(signature, pending_serials_of(data))
+        refresh_summary(email, data)
+        victory_store.replace_lead_keys(email, lead_keys(data))
+        victory_store.replace_search_rows(email, search_records(data))
+
+
+# Function to read the column header of a user's base CSV (None if there is no file yet)
+def read_header(email):
+    file_path = user_data_path(email)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), None)
+
+
+# Function to combine the summaries of two sets of rows
+def _merge_summaries(a, b):
+    merged = {"total_rows": a["total_rows"] + b["total_rows"], "completed": a["completed"] + b["completed"]}
+    for key, pick in (("min_completed", min), ("max_completed", max), ("max_serial", max)):
+        values = [v for v in (a[key], b[key]) if v is not None]
+        merged[key] = pick(values) if values else None
+    return merged
+
+
+# Function to append new rows to a user's base CSV without reading the rows already there;
+# returns the summary of the appended rows
+def append_user_rows(email, chunks):
+    added = summarize(pd.DataFrame(columns=USER_DATA_COLUMNS))
+    with _lock_for(email):
+        # Deletes in the log are serial ranges; fold them in first so they cannot hit the new rows
+        if any(entry.get("op") == "delete" for entry in read_change_log(email)):
+            compact_user_data(email)
+        os.makedirs(user_data_dir(email), exist_ok=True)
+        file_path = user_data_path(email)
+        old_signature, _ = files_signature(email)
+        header = read_header(email)
+        pending = []
+        keys = []
+        records = []
+        needs_newline = False
+        if header is not None:
+            with open(file_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        with open(file_path, "a", newline="", encoding="utf-8") as f:
+            start_size = f.tell()
+            if header is not None and needs_newline:
+                f.write("\n")
+            for chunk in chunks:
+                if header is None:
+                    header = list(chunk.columns)
+                    chunk.to_csv(f, index=False)
+                else:
+                    chunk.reindex(columns=header).to_csv(f, header=False, index=False)
+                added = _merge_summaries(added, summarize(chunk))
+                pending.extend(pending_serials_of(chunk))
+                keys.extend(lead_keys(chunk))
+                records.extend(search_records(chunk))
+            f.flush()
+            os.fsync(f.fileno())
+            victory_metrics.count("bytes_written", os.fstat(f.fileno()).st_size - start_size)
+
+        victory_cache.frame_cache.invalidate(_cache_key(email))
+        signature, last_modified = files_signature(email)
+        _patch_pending(email, old_signature, signature, lambda index: index.add(pending))
+        victory_store.record_append(email, added, signature, last_modified)
+        victory_store.add_lead_keys(email, keys)
+        victory_store.add_search_rows(email, records)
+        extend_serial_index(email)
+    return added
+
+
+# Function to serialize numpy scalars found in log entries
+def _json_default(value):
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__} in a change log entry")
+
+
+# Function to append entries to a user's change log in one write and write them through to the cached
+# frame; the caller holds the user's lock. Returns (signature, last_modified, log_size)
+def _append_log_entries(email, entries):
+    os.makedirs(user_data_dir(email), exist_ok=True)
+    old_signature, _ = files_signature(email)
+    lines = "".join(json.dumps(entry, default=_json_default) + "\n" for entry in entries).encode("utf-8")
+    with open(change_log_path(email), "ab") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+        log_size = f.tell()
+    victory_metrics.count("bytes_written", len(lines))
+    signature, last_modified = files_signature(email)
+    victory_cache.frame_cache.patch(_cache_key(email), old_signature, signature,
+                                    lambda data: apply_changes(data, entries))
+
+    def apply_all(index):
+        for entry in entries:
+            index.apply(entry)
+    _patch_pending(email, old_signature, signature, apply_all)
+    return signature, last_modified, log_size
+
+
+# Function to append one entry to a user's change log (see _append_log_entries)
+def _append_log_entry(email, entry):
+    return _append_log_entries(email, [entry])
+
+
+# Function to record the new values of one row by appending to the change log
+def save_user_row(email, sl_no, values, was_completed=False):
+    entry = {"op": "set", "Sl.no": int(sl_no), "values": values}
+    with _lock_for(email):
+        signature, last_modified, log_size = _append_log_entry(email, entry)
+        if pd.notna(values.get("S/T/SF")):
+            victory_store.record_completion(email, int(sl_no), not was_completed, signature, last_modified, values)
+        else:
+            victory_store.update_search_rows(email, {int(sl_no): values})
+    if log_size > COMPACT_AFTER_BYTES:
+        schedule_compaction(email)
+
+
+# Function to update the details of several rows of a user in one change log write; updates maps
+# Sl.no -> values and must not touch the call-entry or lead key columns
+def update_user_rows(email, updates):
+    if not updates:
+        return
+    entries = [{"op": "set", "Sl.no": int(sl_no), "values": values} for sl_no, values in updates.items()]
+    with _lock_for(email):
+        _, _, log_size = _append_log_entries(email, entries)
+        victory_store.update_search_rows(email, updates)
+    if log_size > COMPACT_AFTER_BYTES:
+        schedule_compaction(email)
+
+
+# Function to fold a user's change log into the base CSV
+def compact_user_data(email):
+    log_path = change_log_path(email)
+    with _lock_for(email):
+        if not os.path.exists(log_path):
+            return
+        old_signature, _ = files_signature(email)
+        with open(log_path, "rb") as f:
+            content = f.read()
+        data = apply_changes(load_base_data(email), _parse_log(content))
+
+        victory_fileio.write_csv(data, user_data_path(email), index=False)
+
+        # Keep anything appended after the snapshot was taken
+        with open(log_path, "rb") as f:
+            f.seek(len(content))
+            rest = f.read()
+        if rest:
+            with victory_fileio.atomic_write(log_path, "wb") as f:
+                f.write(rest)
+        else:
+            os.remove(log_path)
+        if rest:
+            victory_cache.frame_cache.invalidate(_cache_key(email))
+            _pending_indexes.pop(email, None)
+            refresh_summary(email)
+        else:
+            signature, _ = files_signature(email)
+            victory_cache.frame_cache.put(_cache_key(email), signature, data.copy())
+            # Compaction does not change which rows are pending
+            _patch_pending(email, old_signature, signature, lambda index: None)
+            refresh_summary(email, data)
+
+
+# Function run by the background thread compacting queued users
+def _compaction_worker():
+    while True:
+        email = _compaction_queue.get()
+        try:
+            compact_user_data(email)
+        except Exception:
+            log.exception("Compaction of %s failed", email)
+        finally:
+            with _locks_guard:
+                _compaction_pending.discard(email)
+
+
+# Function to queue a user's change log for background compaction
+def schedule_compaction(email):
+    global _compaction_thread
+    with _locks_guard:
+        if email in _compaction_pending:
+            return
+        _compaction_pending.add(email)
+        if _compaction_thread is None:
+            _compaction_thread = threading.Thread(target=_compaction_worker, name="victory-compaction", daemon=True)
+            _compaction_thread.start()
+    _compaction_queue.put(email)
+
+
+# Sorted Sl.no -> (byte offset, length) index over the records of a user's base CSV
+class SerialIndex:
+    def __init__(self, base_signature, scanned_bytes, header, serials, offsets, lengths):
+        self.base_signature = base_signature
+        self.scanned_bytes = scanned_bytes
+        self.header = header
+        self.serials = serials
+        self.offsets = offsets
+        self.lengths = lengths
+
+    # Function to find the records with serials in [start, end]; returns (offsets, lengths) in file order
+    def lookup(self, start, end):
+        lo = np.searchsorted(self.serials, start, side="left")
+        hi = np.searchsorted(self.serials, end, side="right")
+        order = np.argsort(self.offsets[lo:hi], kind="stable")
+        return self.offsets[lo:hi][order], self.lengths[lo:hi][order]
+
+
+_serial_indexes = {}
+
+
+# Function to get the signature of just a user's base CSV
+def _base_signature(email):
+    try:
+        stat = os.stat(user_data_path(email))
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+# Function to scan CSV records from a byte offset; returns (serials, offsets, lengths, end offset)
+def _scan_records(f, offset, serial_column):
+    serials, offsets, lengths = [], [], []
+    f.seek(offset)
+    record, record_start = b"", offset
+    for line in iter(f.readline, b""):
+        record += line
+        if record.count(b'"') % 2:
+            continue  # quoted field spans lines
+        fields = next(csv.reader([record.decode("utf-8")]), [])
+        try:
+            serial = int(float(fields[serial_column]))
+        except (IndexError, ValueError):
+            serial = None
+        if serial is not None:
+            serials.append(serial)
+            offsets.append(record_start)
+            lengths.append(len(record))
+        record_start += len(record)
+        record = b""
+    return serials, offsets, lengths, record_start
+
+
+# Function to build (or reuse) the serial index of a user's base CSV
+def serial_index(email):
+    with _lock_for(email):
+        base_signature = _base_signature(email)
+        index = _serial_indexes.get(email)
+        if index is not None and index.base_signature == base_signature:
+            return index
+        if base_signature is None:
+            index = SerialIndex(None, 0, None, np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+                                np.array([], dtype=np.int64))
+        else:
+            with open(user_data_path(email), "rb") as f:
+                header = f.readline()
+                serial_column = next(csv.reader([header.decode("utf-8")])).index("Sl.no")
+                serials, offsets, lengths, end = _scan_records(f, len(header), serial_column)
+            order = np.argsort(np.array(serials, dtype=np.int64), kind="stable")
+            index = SerialIndex(base_signature, end, header, np.array(serials, dtype=np.int64)[order],
+                                np.array(offsets, dtype=np.int64)[order], np.array(lengths, dtype=np.int64)[order])
+        _serial_indexes[email] = index
+        return index
+
+
+# Function to extend a user's serial index over rows appended to the base CSV, scanning only the new bytes
+def extend_serial_index(email):
+    with _lock_for(email):
+        index = _serial_indexes.get(email)
+        if index is None or index.header is None:
+            _serial_indexes.pop(email, None)
+            return
+        with open(user_data_path(email), "rb") as f:
+            serial_column = next(csv.reader([index.header.decode("utf-8")])).index("Sl.no")
+            serials, offsets, lengths, end = _scan_records(f, index.scanned_bytes, serial_column)
+        all_serials = np.concatenate([index.serials, np.array(serials, dtype=np.int64)])
+        order = np.argsort(all_serials, kind="stable")
+        _serial_indexes[email] = SerialIndex(
+            _base_signature(email), end, index.header, all_serials[order],
+            np.concatenate([index.offsets, np.array(offsets, dtype=np.int64)])[order],
+            np.concatenate([index.lengths, np.array(lengths, dtype=np.int64)])[order])
+
+
+# Function to read a user's rows with serials in [start, end] via the serial index (log changes applied)
+def read_serial_range(email, start, end):
+    with _lock_for(email):
+        index = serial_index(email)
+        offsets, lengths = index.lookup(start, end)
+        if index.header is not None:
+            with open(user_data_path(email), "rb") as f:
+                parts = []
+                for offset, length in zip(offsets, lengths):
+                    f.seek(int(offset))
+                    parts.append(f.read(int(length)))
+            rows = victory_schema.apply_schema(
+                pd.read_csv(io.BytesIO(index.header + b"".join(parts)), dtype=victory_schema.read_csv_dtypes()))
+        else:
+            rows = pd.DataFrame(columns=USER_DATA_COLUMNS)
+        rows = apply_changes(rows, read_change_log(email))
+    serials = pd.to_numeric(rows["Sl.no"], errors="coerce")
+    return rows[serials.between(start, end)].reset_index(drop=True)
+
+
+# Function to get the path of a reallocation journal
+def _journal_path(realloc_id):
+    return os.path.join(USER_DATA_DIR, f".realloc-{realloc_id}.json")
+
+
+# Function to get a log's size (0 if it does not exist)
+def _log_size(email):
+    path = change_log_path(email)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+# Function to cut a user's change log back to a recorded size
+def _truncate_log(email, size):
+    path = change_log_path(email)
+    if os.path.exists(path):
+        with open(path, "r+b") as f:
+            f.truncate(size)
+    victory_cache.frame_cache.invalidate(_cache_key(email))
+    _pending_indexes.pop(email, None)
+
+
+# Function to write a reallocation journal, holding an exclusive flock on it until the returned file is closed so
+# recovery can tell a live move from an abandoned one. The journal only appears under its name once locked
+def _open_journal(journal):
+    path = _journal_path(journal["id"])
+    os.makedirs(USER_DATA_DIR, exist_ok=True)
+    f = open(path + ".tmp", "w")
+    victory_fileio.try_flock(f.fileno())
+    json.dump(journal, f)
+    f.flush()
+    os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    return f
+
+
+# Function to undo the log appends of a reallocation that did not commit (caller holds both users' locks)
+def _roll_back(journal):
+    if victory_store.reallocation_committed(journal["id"]):
+        return
+    _truncate_log(journal["to"], journal["to_log_size"])
+    _truncate_log(journal["from"], journal["from_log_size"])
+    refresh_summary(journal["to"])
+    refresh_summary(journal["from"])
+
+
+# Function to drop a handled journal and its commit marker
+def _discard_journal(journal):
+    try:
+        os.remove(_journal_path(journal["id"]))
+    except FileNotFoundError:
+        pass
+    victory_store.forget_reallocation(journal["id"])
+
+
+# Function to roll back reallocations abandoned part-way by a crashed mover. Journals still locked by their mover
+# are left alone, and each journal is checked again once both users' locks are held, since its mover or another
+# recovery may have finished it in the meantime
+def recover_reallocations():
+    for path in glob.glob(os.path.join(USER_DATA_DIR, ".realloc-*.json")):
+        try:
+            f = open(path)
+        except FileNotFoundError:  # finished since the listing
+            continue
+        with f:
+            if not victory_fileio.try_flock(f.fileno()) or not os.path.exists(path):
+                continue
+            journal = json.load(f)
+            if journal["id"] in _active_reallocations:
+                continue
+            first, second = sorted([journal["from"], journal["to"]])
+            with _lock_for(first), _lock_for(second):
+                if not os.path.exists(path):
+                    continue
+                _roll_back(journal)
+                _discard_journal(journal)
+
+
+# Function to move the rows with serials in [start, end] from one user to another in O(rows moved).
+# Moved rows are appended to the target's change log and the range is tombstoned in the source's;
+# both logs and both Assigned counts commit together or not at all.
+# Returns (moved rows as written to the target, their original serials)
+def reallocate_range(from_email, to_email, start, end, keep_serials=False):
+    if from_email == to_email:
+        raise ValueError("Choose two different users to reallocate between.")
+    recover_reallocations()
+
+    first, second = sorted([from_email, to_email])
+    with _lock_for(first), _lock_for(second):
+        rows = read_serial_range(from_email, start, end)
+        if rows.empty:
+            return rows, []
+        rows = rows.sort_values(by="Sl.no", kind="stable").reset_index(drop=True)
+        original_serials = [int(serial) for serial in rows["Sl.no"]]
+
+        if keep_serials:
+            if not read_serial_range(to_email, start, end).empty:
+                raise ValueError("The target user already has rows in this serial range.")
+        else:
+            max_serial = load_user_summaries([to_email]).at[to_email, "max_serial"]
+            next_serial = int(max_serial) + 1 if pd.notna(max_serial) else 1
+            rows["Sl.no"] = range(next_serial, next_serial + len(rows))
+
+        # Journal the log sizes first so a half-finished move can be rolled back
+        realloc_id = uuid.uuid4().hex
+        journal = {"id": realloc_id, "from": from_email, "to": to_email,
+                   "from_log_size": _log_size(from_email), "to_log_size": _log_size(to_email)}
+        _active_reallocations.add(realloc_id)
+        journal_file = _open_journal(journal)
+        try:
+            try:
+                records = rows.astype(object).where(rows.notna(), None).to_dict("records")
+                to_signature, to_modified, _ = _append_log_entry(to_email, {"op": "insert", "rows": records})
+                from_signature, from_modified, _ = _append_log_entry(
+                    from_email, {"op": "delete", "from": int(start), "to": int(end)})
+                victory_store.commit_reallocation(realloc_id, from_email, to_email, len(rows), (start, end),
+                                                  lead_keys(rows), search_records(rows))
+            except Exception:
+                _roll_back(journal)
+                _discard_journal(journal)
+                raise
+            _discard_journal(journal)
+        finally:
+            journal_file.close()
+            _active_reallocations.discard(realloc_id)
+
+        # Keep both summaries current without rescanning either user's data
+        moved = summarize(rows)
+        victory_store.record_append(to_email, moved, to_signature, to_modified)
+        victory_store.record_removal(from_email, summarize(rows.assign(**{"Sl.no": original_serials})),
+                                     start, end, from_signature, from_modified)
+    return rows, original_serials
+
+
+# Sorted serials of a user's pending rows (S/T/SF not filled), kept current by every write path
+class PendingIndex:
+    def __init__(self, signature, serials):
+        self.signature = signature
+        self.serials = sorted(set(serials))
+
+    # Function to add pending serials
+    def add(self, serials):
+        for serial in serials:
+            i = bisect.bisect_left(self.serials, serial)
+            if i == len(self.serials) or self.serials[i] != serial:
+                self.serials.insert(i, serial)
+
+    # Function to drop serials that are no longer pending
+    def discard(self, serials):
+        for serial in serials:
+            i = bisect.bisect_left(self.serials, serial)
+            if i < len(self.serials) and self.serials[i] == serial:
+                del self.serials[i]
+
+    # Function to fold one change log entry into the index
+    def apply(self, entry):
+        op = entry.get("op")
+        if op == "set" and "S/T/SF" in entry["values"]:
+            if pd.notna(entry["values"]["S/T/SF"]):
+                self.discard([entry["Sl.no"]])
+            else:
+                self.add([entry["Sl.no"]])
+        elif op == "insert":
+            self.add(pending_serials_of(pd.DataFrame(entry["rows"])))
+        elif op == "delete":
+            lo = bisect.bisect_left(self.serials, entry["from"])
+            hi = bisect.bisect_right(self.serials, entry["to"])
+            del self.serials[lo:hi]
+
+    # Function to list the first n pending serials, skipping the given ones
+    def first(self, n, skip=()):
+        found = []
+        for serial in self.serials:
+            if len(found) == n:
+                break
+            if serial not in skip:
+                found.append(serial)
+        return found
+
+
+_pending_indexes = {}
+
+
+# Function to list the serials of the pending rows of a frame
+def pending_serials_of(data):
+    if data.empty or "Sl.no" not in data.columns:
+        return []
+    serials = pd.to_numeric(data["Sl.no"], errors="coerce")
+    if "S/T/SF" in data.columns:
+        serials = serials[data["S/T/SF"].isna()]
+    return [int(serial) for serial in serials.dropna()]
+
+
+# Function to update a user's pending index for a write that moved their files from one signature to the next;
+# an index built from other state is dropped and rebuilt on next use
+def _patch_pending(email, old_signature, new_signature, update):
+    index = _pending_indexes.get(email)
+    if index is None:
+        return
+    if index.signature != old_signature:
+        _pending_indexes.pop(email, None)
+        return
+    update(index)
+    index.signature = new_signature
+
+
+# Function to get a user's pending index, building it from their data when missing or stale
+def pending_index(email):
+    with _lock_for(email):
+        signature, _ = files_signature(email)
+        index = _pending_indexes.get(email)
+        if index is None or index.signature != signature:
+            index = _pending_indexes[email] = PendingIndex(signature, pending_serials_of(load_user_data(email)))
+        return index
+
+
+# Function to list a user's first n pending serials, skipping the given ones
+def next_pending_serials(email, n=1, skip=()):
+    with _lock_for(email):
+        return pending_index(email).first(n, set(skip))
+
+
+# Function to count a user's pending rows
+def pending_count(email):
+    with _lock_for(email):
+        return len(pending_index(email).serials)